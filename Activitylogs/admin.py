@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ActivityLog
+from .models import ActivityLog, DailyUserActivity
 
 
 @admin.register(ActivityLog)
@@ -24,3 +24,12 @@ class ActivityLogAdmin(admin.ModelAdmin):
         """Show first 50 characters of description"""
         return obj.description[:50] + '...' if len(obj.description) > 50 else obj.description
     description_preview.short_description = 'Description Preview'
+
+
+@admin.register(DailyUserActivity)
+class DailyUserActivityAdmin(admin.ModelAdmin):
+    """Admin interface for the daily user activity rollup"""
+    list_display = ['user', 'day', 'sessions_created', 'messages', 'commands', 'tokens_total', 'cost_usd', 'last_activity_at']
+    list_filter = ['day']
+    search_fields = ['user__username']
+    date_hierarchy = 'day'
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ActivityConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Activitylogs'
+
+    def ready(self):
+        # Deletes subtract from the daily activity rollup
+        from . import signals  # noqa: F401
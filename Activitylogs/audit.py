@@ -0,0 +1,164 @@
+import atexit
+import logging
+import queue
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import ActivityLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUDIT_LOG = {
+    'ENABLED': True,
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 2.0,
+    'MAX_QUEUE_SIZE': 10000,
+    'ENQUEUE_TIMEOUT': 0.0,
+}
+
+
+class AuditLogWriter:
+    """
+    In-process buffered writer for ActivityLog rows.
+
+    Requests only enqueue events; a daemon thread writes them with `bulk_create`
+    once `BATCH_SIZE` events are pending or every `FLUSH_INTERVAL` seconds, and
+    whatever is left is flushed when the worker exits. The queue is bounded: when
+    it is full, `log` waits at most `ENQUEUE_TIMEOUT` seconds and then drops the
+    event and counts it. Rows get `created_at` at flush time, which trails the
+    event by at most `FLUSH_INTERVAL`.
+    """
+
+    def __init__(self, batch_size=200, flush_interval=2.0, max_queue_size=10000, enqueue_timeout=0.0, autostart=True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.autostart = autostart
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._counter_lock = threading.Lock()
+        self.counters = Counter()
+
+    def log(self, **fields):
+        """Queue an ActivityLog row built from `fields`; never touches the database"""
+        self._ensure_started()
+        try:
+            if self.enqueue_timeout > 0:
+                self._queue.put(fields, timeout=self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(fields)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('enqueued')
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def flush(self):
+        """Write every pending event, in batches of `batch_size`; returns the number written"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    break
+                try:
+                    ActivityLog.objects.bulk_create([ActivityLog(**fields) for fields in batch])
+                except Exception:
+                    logger.exception('Failed to write %d activity log events', len(batch))
+                    self._count('dropped', len(batch))
+                else:
+                    self._count('written', len(batch))
+                    written += len(batch)
+        return written
+
+    def stats(self):
+        """Return writer counters for monitoring"""
+        return {
+            'enqueued': self.counters['enqueued'],
+            'written': self.counters['written'],
+            'dropped': self.counters['dropped'],
+            'pending': self._queue.qsize(),
+        }
+
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _count(self, key, amount=1):
+        with self._counter_lock:
+            self.counters[key] += amount
+
+    def _ensure_started(self):
+        if not self.autostart or self._thread is not None or self._stopping.is_set():
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_audit_writer():
+    """Return the process-wide writer, creating it from settings.AUDIT_LOG on first use"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                config = {**DEFAULT_AUDIT_LOG, **getattr(settings, 'AUDIT_LOG', {})}
+                _writer = AuditLogWriter(
+                    batch_size=config['BATCH_SIZE'],
+                    flush_interval=config['FLUSH_INTERVAL'],
+                    max_queue_size=config['MAX_QUEUE_SIZE'],
+                    enqueue_timeout=config['ENQUEUE_TIMEOUT'],
+                )
+    return _writer
+
+
+def log_activity(request, activity_type, description='', metadata=None, user=None):
+    """Queue an activity log event for `user` (defaults to the request user)"""
+    config = {**DEFAULT_AUDIT_LOG, **getattr(settings, 'AUDIT_LOG', {})}
+    if not config['ENABLED']:
+        return False
+    user = user or request.user
+    return get_audit_writer().log(
+        user_id=user.id,
+        activity_type=activity_type,
+        description=description,
+        metadata=metadata,
+        ip_address=request.META.get('REMOTE_ADDR') or None,
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+    )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from zapfix_backend.partitioning import (
+    PARTITIONED_TABLES,
+    supports_partitioning,
+    is_partitioned,
+    ensure_future_partitions,
+    expire_partitions,
+)
+
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly partitions and detach or drop expired ones (PostgreSQL only)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3, help='Months of future partitions to keep ready (default 3)')
+        parser.add_argument('--retention-months', type=int, help='Detach partitions older than this many months before the current one')
+        parser.add_argument('--drop', action='store_true', help='Drop expired partitions instead of only detaching them')
+        parser.add_argument('--table', action='append', choices=PARTITIONED_TABLES, help='Limit to this table (repeatable)')
+
+    def handle(self, *args, **options):
+        if not supports_partitioning(connection):
+            self.stdout.write(f'{connection.vendor} does not use partitioned tables; nothing to do')
+            return
+        if options['months_ahead'] < 0:
+            raise CommandError('--months-ahead must not be negative')
+        if options['retention_months'] is not None and options['retention_months'] < 0:
+            raise CommandError('--retention-months must not be negative')
+
+        for table in options['table'] or PARTITIONED_TABLES:
+            if not is_partitioned(connection, table):
+                self.stdout.write(self.style.WARNING(f'{table} is not partitioned; run migrate first'))
+                continue
+            with connection.schema_editor() as schema_editor:
+                created = ensure_future_partitions(schema_editor, table, options['months_ahead'])
+                expired = []
+                if options['retention_months'] is not None:
+                    expired = expire_partitions(schema_editor, table, options['retention_months'], drop=options['drop'])
+            for name in created:
+                self.stdout.write(f'Created {name}')
+            for name in expired:
+                self.stdout.write(f"{'Dropped' if options['drop'] else 'Detached'} {name}")
+            self.stdout.write(self.style.SUCCESS(f'{table}: {len(created)} created, {len(expired)} expired'))
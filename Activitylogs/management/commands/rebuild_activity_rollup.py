@@ -0,0 +1,39 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from Activitylogs.models import DailyUserActivity
+from Activitylogs.rollup import daily_activity_rows
+from zapfix_backend.filters import DateRangeFilter
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily user activity rollup for a date range from the raw tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', required=True, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--date-to', required=True, help='Last day to rebuild, inclusive (YYYY-MM-DD)')
+        parser.add_argument('--user-id', type=int, help='Only rebuild rows for this user')
+
+    def handle(self, *args, **options):
+        date_from = parse_date(options['date_from'] or '')
+        date_to = parse_date(options['date_to'] or '')
+        if not date_from or not date_to:
+            raise CommandError('--date-from and --date-to must be dates in YYYY-MM-DD format')
+        if date_from > date_to:
+            raise CommandError('--date-from must not be after --date-to')
+
+        user_id = options.get('user_id')
+        rows = daily_activity_rows(apps, DateRangeFilter(date_from, date_to), user_id=user_id)
+
+        with transaction.atomic():
+            existing = DailyUserActivity.objects.filter(day__gte=date_from, day__lte=date_to)
+            if user_id:
+                existing = existing.filter(user_id=user_id)
+            deleted, _ = existing.delete()
+            DailyUserActivity.objects.bulk_create(rows, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(rows)} rollup rows for {date_from} to {date_to} (replaced {deleted})'
+        ))
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Activitylogs', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserActivity',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('sessions_created', models.IntegerField(default=0)),
+                ('messages', models.IntegerField(default=0)),
+                ('commands', models.IntegerField(default=0)),
+                ('tokens_input', models.BigIntegerField(default=0)),
+                ('tokens_output', models.BigIntegerField(default=0)),
+                ('tokens_total', models.BigIntegerField(default=0)),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=14)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_activity', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'daily_user_activity',
+                'indexes': [models.Index(fields=['day'], name='daily_user__day_9a2e93_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='daily_user_activity_user_day_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Activitylogs', '0002_dailyuseractivity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activitylog',
+            name='activity_type',
+            field=models.CharField(choices=[('login', 'Login'), ('session_start', 'Session Start'), ('session_end', 'Session End'), ('command_executed', 'Command Executed'), ('message_sent', 'Message Sent'), ('token_usage', 'Token Usage'), ('error', 'Error')], max_length=30),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from zapfix_backend.partitioning import partition_table, unpartition_table
+
+
+def forwards(apps, schema_editor):
+    partition_table(schema_editor, 'activity_logs')
+
+
+def backwards(apps, schema_editor):
+    unpartition_table(schema_editor, 'activity_logs')
+
+
+class Migration(migrations.Migration):
+    """Range-partition activity_logs by month on PostgreSQL; no-op elsewhere"""
+
+    dependencies = [
+        ('Activitylogs', '0003_alter_activitylog_activity_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
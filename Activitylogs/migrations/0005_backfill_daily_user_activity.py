@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from Activitylogs.rollup import daily_activity_rows
+from zapfix_backend.filters import DateRangeFilter
+
+
+def backfill(apps, schema_editor):
+    DailyUserActivity = apps.get_model('Activitylogs', 'DailyUserActivity')
+    # Rows written since 0002 are rebuilt from the raw tables as well
+    DailyUserActivity.objects.all().delete()
+    DailyUserActivity.objects.bulk_create(daily_activity_rows(apps, DateRangeFilter()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    """Populate the daily activity rollup from the history recorded before it existed"""
+
+    dependencies = [
+        ('Activitylogs', '0004_partition_activity_logs'),
+        ('session', '0004_session_change_version'),
+        ('message', '0004_message_search'),
+        ('CommandExecution', '0007_dailycommandlatency'),
+        ('Tokenusage', '0004_backfill_hourly_token_usage'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
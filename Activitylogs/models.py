@@ -1,5 +1,9 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.conf import settings
+from django.utils import timezone
+from decimal import Decimal
 import uuid
 
 # Create your models here.
@@ -11,6 +15,7 @@ class ActivityLog(models.Model):
         ('session_end', 'Session End'),
         ('command_executed', 'Command Executed'),
         ('message_sent', 'Message Sent'),
+        ('token_usage', 'Token Usage'),
         ('error', 'Error'),
     )
 
@@ -32,3 +37,62 @@ class ActivityLog(models.Model):
 
     def __str__(self):
         return f"{self.user} | {self.activity_type} | {self.created_at}"
+
+
+class DailyUserActivity(models.Model):
+    """Per-user, per-day activity counters maintained incrementally on write"""
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.CASCADE,related_name='daily_activity')
+    day = models.DateField()
+    sessions_created = models.IntegerField(default=0)
+    messages = models.IntegerField(default=0)
+    commands = models.IntegerField(default=0)
+    tokens_input = models.BigIntegerField(default=0)
+    tokens_output = models.BigIntegerField(default=0)
+    tokens_total = models.BigIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=14,decimal_places=6,default=0)
+    last_activity_at = models.DateTimeField(null=True,blank=True)
+
+    class Meta:
+        db_table = 'daily_user_activity'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='daily_user_activity_user_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} | {self.day}"
+
+    @classmethod
+    def record(cls, user_id, at=None, sessions_created=0, messages=0, commands=0,
+               tokens_input=0, tokens_output=0, cost_usd=None):
+        """Add deltas to the user's row for the day of `at` (defaults to now)"""
+        at = at or timezone.now()
+        row, _ = cls.objects.get_or_create(user_id=user_id, day=timezone.localdate(at))
+        cls.objects.filter(pk=row.pk).update(
+            sessions_created=F('sessions_created') + sessions_created,
+            messages=F('messages') + messages,
+            commands=F('commands') + commands,
+            tokens_input=F('tokens_input') + (tokens_input or 0),
+            tokens_output=F('tokens_output') + (tokens_output or 0),
+            tokens_total=F('tokens_total') + (tokens_input or 0) + (tokens_output or 0),
+            cost_usd=F('cost_usd') + (cost_usd or Decimal('0')),
+            last_activity_at=Greatest(Coalesce(F('last_activity_at'), Value(at)), Value(at)),
+        )
+
+    @classmethod
+    def retract(cls, user_id, day, sessions_created=0, messages=0, commands=0,
+                tokens_input=0, tokens_output=0, cost_usd=None):
+        """Subtract the counts of deleted rows from the user's row for `day`, if it exists"""
+        cls.objects.filter(user_id=user_id, day=day).update(
+            sessions_created=F('sessions_created') - sessions_created,
+            messages=F('messages') - messages,
+            commands=F('commands') - commands,
+            tokens_input=F('tokens_input') - (tokens_input or 0),
+            tokens_output=F('tokens_output') - (tokens_output or 0),
+            tokens_total=F('tokens_total') - (tokens_input or 0) - (tokens_output or 0),
+            cost_usd=F('cost_usd') - (cost_usd or Decimal('0')),
+        )
@@ -0,0 +1,77 @@
+"""
+Rebuilding DailyUserActivity from the raw tables.
+
+Shared by the rebuild_activity_rollup management command and the migration
+that backfills the rollup, so it takes an app registry and resolves models
+through it: the global one from the command, the historical one from the
+migration.
+"""
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+
+
+def daily_activity_rows(apps, date_range, user_id=None):
+    """Unsaved DailyUserActivity rows for every (user, day) with raw activity in `date_range`"""
+    DailyUserActivity = apps.get_model('Activitylogs', 'DailyUserActivity')
+    Session = apps.get_model('session', 'Session')
+    Message = apps.get_model('message', 'Message')
+    CommandExecution = apps.get_model('CommandExecution', 'CommandExecution')
+    TokenUsage = apps.get_model('Tokenusage', 'TokenUsage')
+
+    rows = {}
+
+    def row_for(key):
+        if key not in rows:
+            rows[key] = DailyUserActivity(user_id=key[0], day=key[1])
+        return rows[key]
+
+    def touch(row, at):
+        if at and (row.last_activity_at is None or at > row.last_activity_at):
+            row.last_activity_at = at
+
+    sessions = Session.objects.filter(date_range.q())
+    messages = Message.objects.filter(date_range.q())
+    commands = CommandExecution.objects.filter(date_range.q())
+    tokens = TokenUsage.objects.filter(date_range.q())
+    if user_id:
+        sessions = sessions.filter(user_id=user_id)
+        messages = messages.filter(session__user_id=user_id)
+        commands = commands.filter(user_id=user_id)
+        tokens = tokens.filter(user_id=user_id)
+
+    for item in sessions.annotate(day=TruncDate('created_at')).values('user_id', 'day').annotate(
+        total=Count('pk'), last=Max('created_at')
+    ).order_by():
+        row = row_for((item['user_id'], item['day']))
+        row.sessions_created = item['total']
+        touch(row, item['last'])
+
+    for item in messages.annotate(day=TruncDate('created_at')).values('session__user_id', 'day').annotate(
+        total=Count('pk'), last=Max('created_at')
+    ).order_by():
+        row = row_for((item['session__user_id'], item['day']))
+        row.messages = item['total']
+        touch(row, item['last'])
+
+    for item in commands.annotate(day=TruncDate('created_at')).values('user_id', 'day').annotate(
+        total=Count('pk'), last=Max('created_at')
+    ).order_by():
+        row = row_for((item['user_id'], item['day']))
+        row.commands = item['total']
+        touch(row, item['last'])
+
+    for item in tokens.annotate(day=TruncDate('created_at')).values('user_id', 'day').annotate(
+        tokens_input=Sum('tokens_input'),
+        tokens_output=Sum('tokens_output'),
+        tokens_total=Sum('tokens_total'),
+        cost_usd=Sum('cost_usd'),
+        last=Max('created_at')
+    ).order_by():
+        row = row_for((item['user_id'], item['day']))
+        row.tokens_input = item['tokens_input'] or 0
+        row.tokens_output = item['tokens_output'] or 0
+        row.tokens_total = item['tokens_total'] or 0
+        row.cost_usd = item['cost_usd'] or 0
+        touch(row, item['last'])
+
+    return list(rows.values())
@@ -125,4 +125,5 @@ class UserDetailsSerializer(serializers.Serializer):
 class UsersListResponseSerializer(serializers.Serializer):
     """Serializer for users list response"""
     users = UserStatisticsSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True)
 
@@ -0,0 +1,68 @@
+"""
+Keep DailyUserActivity in step with deletes.
+
+Writes add to the rollup explicitly in the views; deletes can also come from
+the admin site or cascades, so they are handled here. `origin` is whatever
+started the delete: rows removed along with their user need nothing (the
+rollup rows cascade too), and messages removed with their session are
+subtracted in one grouped query by the session's handler.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from CommandExecution.models import CommandExecution
+from Tokenusage.models import TokenUsage
+from message.models import Message
+from session.models import Session
+from .models import DailyUserActivity
+
+
+def _origin_model(origin):
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def _deleted_with(origin, *models):
+    return issubclass(_origin_model(origin), models)
+
+
+@receiver(pre_delete, sender=Session)
+def retract_session(sender, instance, origin=None, **kwargs):
+    """Runs before the cascade, while the session's messages can still be counted"""
+    if _deleted_with(origin, get_user_model()):
+        return
+    DailyUserActivity.retract(instance.user_id, timezone.localdate(instance.created_at), sessions_created=1)
+    for item in Message.objects.filter(session=instance).annotate(day=TruncDate('created_at')).values('day').annotate(
+        total=Count('pk')
+    ).order_by():
+        DailyUserActivity.retract(instance.user_id, item['day'], messages=item['total'])
+
+
+@receiver(post_delete, sender=Message)
+def retract_message(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, get_user_model(), Session):
+        return
+    user_id = Session.objects.filter(pk=instance.session_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        DailyUserActivity.retract(user_id, timezone.localdate(instance.created_at), messages=1)
+
+
+@receiver(post_delete, sender=CommandExecution)
+def retract_command(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, get_user_model()):
+        return
+    DailyUserActivity.retract(instance.user_id, timezone.localdate(instance.created_at), commands=1)
+
+
+@receiver(post_delete, sender=TokenUsage)
+def retract_token_usage(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, get_user_model()):
+        return
+    DailyUserActivity.retract(
+        instance.user_id, timezone.localdate(instance.created_at),
+        tokens_input=instance.tokens_input, tokens_output=instance.tokens_output, cost_usd=instance.cost_usd
+    )
@@ -1,3 +1,277 @@
-from django.test import TestCase
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.models import UserProfile
+from session.models import Session
+from CommandExecution.models import CommandExecution
+from Tokenusage.models import TokenUsage
+from .models import ActivityLog, DailyUserActivity
+from .audit import AuditLogWriter
+
+
+TEST_SETTINGS = {
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+    'AUDIT_LOG': {'ENABLED': False},
+}
+
+
+def create_admin(username='admin'):
+    admin = User.objects.create_user(username=username, email=f'{username}@example.com', password='pass12345!')
+    UserProfile(user=admin, role='admin').save()
+    return admin
+
+
+def create_user(admin, username):
+    user = User.objects.create_user(username=username, email=f'{username}@example.com', password='pass12345!')
+    UserProfile(user=user, role='user', admin_id=admin).save()
+    return user
+
+
+@override_settings(**TEST_SETTINGS)
+class AdminUsersListTests(TestCase):
+    """Tests for the admin users list endpoint"""
+
+    def setUp(self):
+        self.admin = create_admin()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('admin_users_list')
+
+    def _add_users(self, count, start=0):
+        for i in range(start, start + count):
+            user = create_user(self.admin, f'user{i}')
+            Session.objects.create(user=user, title='s1')
+            Session.objects.create(user=user, title='s2')
+            CommandExecution.objects.create(user=user, command='ls', command_type='shell', status='success')
+            TokenUsage.objects.create(user=user, model_used='gpt', tokens_input=10, tokens_output=5)
+            TokenUsage.objects.create(user=user, model_used='gpt', tokens_input=1, tokens_output=2)
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_statistics_are_aggregated_per_user(self):
+        self._add_users(2)
+        response = self.client.get(self.url)
+        rows = {row['username']: row for row in response.data['users']}
+        self.assertEqual(rows['user0']['total_sessions'], 2)
+        self.assertEqual(rows['user0']['total_commands_executed'], 1)
+        self.assertEqual(rows['user0']['total_tokens_used'], 18)
+        self.assertEqual(rows['admin']['total_sessions'], 0)
+        self.assertEqual(rows['admin']['total_tokens_used'], 0)
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_query_count_is_independent_of_user_count(self):
+        self._add_users(2)
+        few = self._count_queries()
+        self._add_users(20, start=2)
+        many = self._count_queries()
+        self.assertEqual(few, many)
+        # The admin's profile is already cached, so only the annotated users query runs
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_keyset_pagination_walks_every_user_once(self):
+        self._add_users(7)
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data['users'])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+        expected = list(User.objects.order_by('-date_joined', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(**TEST_SETTINGS)
+class DailyUserActivityTests(TestCase):
+    """Tests for the incrementally maintained daily activity rollup"""
+
+    def setUp(self):
+        self.admin = create_admin()
+        self.user = create_user(self.admin, 'worker')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(self.admin)
+
+    def _generate_activity(self):
+        response = self.client.post(reverse('session_list_create'), {'title': 'Debug'}, format='json')
+        session_id = response.data['id']
+        for content in ['hello', 'world']:
+            self.client.post(reverse('session_add_message', args=[session_id]), {'role': 'user', 'content': content}, format='json')
+        self.client.post(reverse('command_list_create'), {'command': 'ls', 'command_type': 'shell', 'status': 'success'}, format='json')
+        self.client.post(reverse('tokens_create'), {'model_used': 'gpt', 'tokens_input': 7, 'tokens_output': 3, 'cost_usd': '0.25'}, format='json')
+        self.client.post(reverse('tokens_create'), {'model_used': 'gpt', 'tokens_input': 1, 'tokens_output': 1}, format='json')
+
+    def _snapshot(self):
+        return list(DailyUserActivity.objects.order_by('user_id', 'day').values(
+            'user_id', 'day', 'sessions_created', 'messages', 'commands',
+            'tokens_input', 'tokens_output', 'tokens_total', 'cost_usd', 'last_activity_at'
+        ))
+
+    def test_writes_update_rollup_incrementally(self):
+        self._generate_activity()
+        row = DailyUserActivity.objects.get(user=self.user, day=timezone.localdate())
+        self.assertEqual(row.sessions_created, 1)
+        self.assertEqual(row.messages, 2)
+        self.assertEqual(row.commands, 1)
+        self.assertEqual((row.tokens_input, row.tokens_output, row.tokens_total), (8, 4, 12))
+        self.assertEqual(str(row.cost_usd), '0.250000')
+        self.assertIsNotNone(row.last_activity_at)
+
+    def test_summary_and_details_read_from_rollup(self):
+        self._generate_activity()
+        response = self.admin_client.get(reverse('admin_activity_summary'))
+        summary = response.data['summary']
+        self.assertEqual(summary['total_sessions'], 1)
+        self.assertEqual(summary['total_messages'], 2)
+        self.assertEqual(summary['total_commands'], 1)
+        self.assertEqual(summary['total_tokens'], 12)
+        rows = {row['username']: row for row in response.data['user_activity']}
+        self.assertEqual(rows['worker']['tokens_used'], 12)
+        self.assertIsNone(rows['admin']['last_activity'])
+
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        response = self.admin_client.get(reverse('admin_activity_summary'), {'date_from': tomorrow})
+        self.assertEqual(response.data['summary']['total_sessions'], 0)
+
+        response = self.admin_client.get(reverse('admin_user_details', args=[self.user.id]))
+        statistics = response.data['statistics']
+        self.assertEqual(statistics['total_messages'], 2)
+        self.assertEqual(statistics['total_tokens_used'], 12)
+
+    def test_rebuild_command_matches_incremental_rollup(self):
+        self._generate_activity()
+        incremental = self._snapshot()
+        DailyUserActivity.objects.all().delete()
+        today = timezone.localdate().isoformat()
+        call_command('rebuild_activity_rollup', date_from=today, date_to=today, stdout=StringIO())
+        rebuilt = self._snapshot()
+        strip = lambda rows: [{k: v for k, v in row.items() if k != 'last_activity_at'} for row in rows]
+        self.assertEqual(strip(rebuilt), strip(incremental))
+
+    def test_deletes_are_subtracted(self):
+        from message.models import Message
+        self._generate_activity()
+        self.client.post(reverse('session_list_create'), {'title': 'Second'}, format='json')
+        Message.objects.get(content='hello').delete()
+        # Deleting the session takes its remaining message with it
+        Session.objects.get(title='Debug').delete()
+        CommandExecution.objects.filter(user=self.user).delete()
+        TokenUsage.objects.filter(user=self.user, tokens_input=7).delete()
+
+        row = DailyUserActivity.objects.get(user=self.user, day=timezone.localdate())
+        self.assertEqual((row.sessions_created, row.messages, row.commands), (1, 0, 0))
+        self.assertEqual((row.tokens_input, row.tokens_output, row.tokens_total), (1, 1, 2))
+        self.assertEqual(str(row.cost_usd), '0.000000')
+
+        statistics = self.admin_client.get(reverse('admin_user_details', args=[self.user.id])).data['statistics']
+        self.assertEqual((statistics['total_sessions'], statistics['total_messages']), (1, 0))
+        listed = {row['id']: row for row in self.admin_client.get(reverse('admin_users_list')).data['users']}
+        self.assertEqual(listed[self.user.id]['total_sessions'], statistics['total_sessions'])
+        self.assertEqual(listed[self.user.id]['total_commands_executed'], statistics['total_commands'])
+
+    def test_deleting_a_user_leaves_no_rollup(self):
+        self._generate_activity()
+        self.user.delete()
+        self.assertFalse(DailyUserActivity.objects.exists())
+
+    def test_migration_backfills_history(self):
+        self._generate_activity()
+        incremental = self._snapshot()
+        DailyUserActivity.objects.all().delete()
+        DailyUserActivity.objects.create(user=self.user, day=timezone.localdate(), messages=99)
+        backfill = import_module('Activitylogs.migrations.0005_backfill_daily_user_activity').backfill
+        backfill(apps, None)
+        strip = lambda rows: [{k: v for k, v in row.items() if k != 'last_activity_at'} for row in rows]
+        self.assertEqual(strip(self._snapshot()), strip(incremental))
+
+
+@override_settings(**TEST_SETTINGS)
+class AuditLogWriterTests(TestCase):
+    """Tests for the buffered ActivityLog writer"""
+
+    def setUp(self):
+        self.admin = create_admin()
+        self.user = create_user(self.admin, 'worker')
+
+    def test_log_is_queued_without_queries(self):
+        writer = AuditLogWriter(autostart=False)
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                writer.log(user_id=self.user.id, activity_type='login')
+        self.assertEqual(writer.stats()['pending'], 10)
+        self.assertEqual(ActivityLog.objects.count(), 0)
+
+    def test_flush_writes_in_batches(self):
+        writer = AuditLogWriter(batch_size=4, autostart=False)
+        for _ in range(10):
+            writer.log(user_id=self.user.id, activity_type='message_sent')
+        # 10 events at a batch size of 4 need three INSERTs
+        with self.assertNumQueries(3):
+            self.assertEqual(writer.flush(), 10)
+        self.assertEqual(ActivityLog.objects.filter(activity_type='message_sent').count(), 10)
+        self.assertEqual(writer.stats(), {'enqueued': 10, 'written': 10, 'dropped': 0, 'pending': 0})
+
+    def test_batch_size_wakes_the_flusher(self):
+        writer = AuditLogWriter(batch_size=3, autostart=False)
+        writer.log(user_id=self.user.id, activity_type='login')
+        writer.log(user_id=self.user.id, activity_type='login')
+        self.assertFalse(writer._wakeup.is_set())
+        writer.log(user_id=self.user.id, activity_type='login')
+        self.assertTrue(writer._wakeup.is_set())
+
+    def test_full_queue_drops_and_counts(self):
+        writer = AuditLogWriter(max_queue_size=2, autostart=False)
+        results = [writer.log(user_id=self.user.id, activity_type='login') for _ in range(5)]
+        self.assertEqual(results, [True, True, False, False, False])
+        self.assertEqual(writer.stats()['dropped'], 3)
+
+    def test_close_flushes_pending_events(self):
+        writer = AuditLogWriter(autostart=False)
+        writer.log(user_id=self.user.id, activity_type='error', description='boom')
+        writer.close()
+        self.assertTrue(ActivityLog.objects.filter(activity_type='error', description='boom').exists())
+
+    @override_settings(AUDIT_LOG={'ENABLED': True})
+    def test_endpoints_emit_activity_events(self):
+        writer = AuditLogWriter(autostart=False)
+        client = APIClient()
+        with mock.patch('Activitylogs.audit._writer', writer):
+            client.post(reverse('user_login'), {'username': 'worker', 'password': 'pass12345!'}, format='json')
+            client.force_authenticate(self.user)
+            session_id = client.post(reverse('session_list_create'), {'title': 'x'}, format='json').data['id']
+            client.post(reverse('session_add_message', args=[session_id]), {'role': 'user', 'content': 'hi'}, format='json')
+            client.post(reverse('command_list_create'), {'command': 'ls', 'command_type': 'shell', 'status': 'success'}, format='json')
+            client.post(reverse('tokens_create'), {'model_used': 'gpt', 'tokens_input': 1, 'tokens_output': 1}, format='json')
+        self.assertEqual(ActivityLog.objects.count(), 0)
+        writer.flush()
+        self.assertEqual(
+            sorted(ActivityLog.objects.filter(user=self.user).values_list('activity_type', flat=True)),
+            ['command_executed', 'login', 'message_sent', 'session_start', 'token_usage']
+        )
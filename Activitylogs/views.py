@@ -1,20 +1,65 @@
+import base64
+import binascii
+import json
+
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.models import User
-from django.db.models import Sum, Q
-from django.utils.dateparse import parse_date
+from django.db.models import Sum, Q, Count, Max, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce, Substr
+from django.utils.dateparse import parse_datetime
 from django.utils import timezone
-from datetime import timedelta
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from users.views import is_admin, AdminPermission
+from zapfix_backend.filters import DateRangeFilter
+from .models import DailyUserActivity
+
+
+USERS_LIST_PAGE_SIZE = 100
+USERS_LIST_MAX_PAGE_SIZE = 500
+
+
+def _subquery_count(queryset):
+    """Correlated COUNT(*) subquery over `queryset` grouped by its user column"""
+    counted = queryset.order_by().values('user').annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def _subquery_sum(queryset, field):
+    """Correlated SUM(field) subquery over `queryset` grouped by its user column"""
+    summed = queryset.order_by().values('user').annotate(total=Sum(field)).values('total')
+    return Coalesce(Subquery(summed, output_field=IntegerField()), 0)
+
+
+def _encode_users_cursor(user):
+    """Encode the (date_joined, id) keyset position of `user` as an opaque cursor"""
+    raw = json.dumps({'date_joined': user.date_joined.isoformat(), 'id': user.id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_users_cursor(cursor):
+    """Decode a cursor produced by `_encode_users_cursor`, or return None if invalid"""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        date_joined = parse_datetime(raw['date_joined'])
+        user_id = int(raw['id'])
+    except (ValueError, TypeError, KeyError, UnicodeDecodeError, binascii.Error):
+        return None
+    if date_joined is None:
+        return None
+    return date_joined, user_id
 
 
 @swagger_auto_schema(
     method='get',
+    manual_parameters=[
+        openapi.Parameter('cursor', openapi.IN_QUERY, description='Opaque cursor returned as next_cursor by the previous page', type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description='Users per page (max 500)', type=openapi.TYPE_INTEGER),
+    ],
     responses={200: openapi.Response('List of users with statistics')},
     tags=['Admin Dashboard'],
     security=[{'Bearer': []}]
@@ -23,17 +68,44 @@ from users.views import is_admin, AdminPermission
 @permission_classes([IsAuthenticated, AdminPermission])
 def admin_users_list(request):
     """Get all users with their statistics - Admin only"""
-    users = User.objects.all().order_by('-date_joined')
+    from session.models import Session
+    from CommandExecution.models import CommandExecution
+    from Tokenusage.models import TokenUsage
+    
+    # Per-user statistics come from correlated subqueries so that the joins
+    # don't fan out and the whole page is fetched in a single query
+    users = User.objects.annotate(
+        total_sessions=_subquery_count(Session.objects.filter(user=OuterRef('pk'))),
+        total_tokens_used=_subquery_sum(TokenUsage.objects.filter(user=OuterRef('pk')), 'tokens_total'),
+        total_commands_executed=_subquery_count(CommandExecution.objects.filter(user=OuterRef('pk'))),
+    ).order_by('-date_joined', '-id')
+    
+    # Keyset pagination on (date_joined, id)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        position = _decode_users_cursor(cursor)
+        if position is None:
+            return Response({
+                'error': 'Invalid cursor'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        date_joined, last_id = position
+        users = users.filter(
+            Q(date_joined__lt=date_joined) | Q(date_joined=date_joined, id__lt=last_id)
+        )
+    
+    try:
+        page_size = int(request.GET.get('page_size', USERS_LIST_PAGE_SIZE))
+    except (ValueError, TypeError):
+        page_size = USERS_LIST_PAGE_SIZE
+    page_size = max(1, min(page_size, USERS_LIST_MAX_PAGE_SIZE))
+    
+    # Fetch one extra row to know whether another page exists
+    page = list(users[:page_size + 1])
+    has_next = len(page) > page_size
+    page = page[:page_size]
     
     users_data = []
-    for user in users:
-        # Get user statistics
-        total_sessions = user.sessions.count()
-        total_tokens_used = user.token_usages.aggregate(
-            total=Sum('tokens_total')
-        )['total'] or 0
-        total_commands_executed = user.command_executions.count()
-        
+    for user in page:
         users_data.append({
             'id': user.id,
             'username': user.username,
@@ -43,13 +115,14 @@ def admin_users_list(request):
             'is_active': user.is_active,
             'created_at': user.date_joined.isoformat() if user.date_joined else None,
             'last_login': user.last_login.isoformat() if user.last_login else None,
-            'total_sessions': total_sessions,
-            'total_tokens_used': total_tokens_used,
-            'total_commands_executed': total_commands_executed
+            'total_sessions': user.total_sessions,
+            'total_tokens_used': user.total_tokens_used,
+            'total_commands_executed': user.total_commands_executed
         })
     
     return Response({
-        'users': users_data
+        'users': users_data,
+        'next_cursor': _encode_users_cursor(page[-1]) if has_next else None
     })
 
 
@@ -59,210 +132,53 @@ def admin_activity_summary(request):
     """Get activity summary for all users - Admin only"""
     # Base queryset
     users = User.objects.all()
+    activity = DailyUserActivity.objects.all()
     
     # Filter by user_id if provided
     user_id = request.GET.get('user_id')
     if user_id:
         try:
             users = users.filter(id=int(user_id))
+            activity = activity.filter(user_id=int(user_id))
         except (ValueError, TypeError):
             pass
     
     # Filter by date range
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    
-    date_filter = Q()
-    if date_from:
-        try:
-            date_from_parsed = parse_date(date_from)
-            if date_from_parsed:
-                date_filter &= Q(created_at__date__gte=date_from_parsed)
-        except (ValueError, TypeError):
-            pass
-    
-    if date_to:
-        try:
-            date_to_parsed = parse_date(date_to)
-            if date_to_parsed:
-                date_to_parsed = date_to_parsed + timedelta(days=1)
-                date_filter &= Q(created_at__date__lt=date_to_parsed)
-        except (ValueError, TypeError):
-            pass
-    
-    # Filter by activity_type if provided
-    activity_type = request.GET.get('activity_type')
-    activity_filter = Q()
-    if activity_type:
-        from .models import ActivityLog
-        activity_filter = Q(activity_type=activity_type)
+    activity = DateRangeFilter.from_request(request).filter_days(activity)
     
     # Calculate summary statistics
     total_users = users.count()
     active_users = users.filter(is_active=True).count()
     
-    # Get total sessions (with date filter if provided)
-    from session.models import Session
-    sessions_qs = Session.objects.all()
-    if date_from or date_to:
-        if date_from:
-            try:
-                date_from_parsed = parse_date(date_from)
-                if date_from_parsed:
-                    sessions_qs = sessions_qs.filter(created_at__date__gte=date_from_parsed)
-            except (ValueError, TypeError):
-                pass
-        if date_to:
-            try:
-                date_to_parsed = parse_date(date_to)
-                if date_to_parsed:
-                    date_to_parsed = date_to_parsed + timedelta(days=1)
-                    sessions_qs = sessions_qs.filter(created_at__date__lt=date_to_parsed)
-            except (ValueError, TypeError):
-                pass
-    if user_id:
-        try:
-            sessions_qs = sessions_qs.filter(user_id=int(user_id))
-        except (ValueError, TypeError):
-            pass
-    
-    total_sessions = sessions_qs.count()
-    
-    # Get total messages
-    from message.models import Message
-    messages_qs = Message.objects.all()
-    if date_from or date_to:
-        if date_from:
-            try:
-                date_from_parsed = parse_date(date_from)
-                if date_from_parsed:
-                    messages_qs = messages_qs.filter(created_at__date__gte=date_from_parsed)
-            except (ValueError, TypeError):
-                pass
-        if date_to:
-            try:
-                date_to_parsed = parse_date(date_to)
-                if date_to_parsed:
-                    date_to_parsed = date_to_parsed + timedelta(days=1)
-                    messages_qs = messages_qs.filter(created_at__date__lt=date_to_parsed)
-            except (ValueError, TypeError):
-                pass
-    if user_id:
-        try:
-            messages_qs = messages_qs.filter(session__user_id=int(user_id))
-        except (ValueError, TypeError):
-            pass
-    
-    total_messages = messages_qs.count()
-    
-    # Get total commands
-    from CommandExecution.models import CommandExecution
-    commands_qs = CommandExecution.objects.all()
-    if date_from or date_to:
-        if date_from:
-            try:
-                date_from_parsed = parse_date(date_from)
-                if date_from_parsed:
-                    commands_qs = commands_qs.filter(created_at__date__gte=date_from_parsed)
-            except (ValueError, TypeError):
-                pass
-        if date_to:
-            try:
-                date_to_parsed = parse_date(date_to)
-                if date_to_parsed:
-                    date_to_parsed = date_to_parsed + timedelta(days=1)
-                    commands_qs = commands_qs.filter(created_at__date__lt=date_to_parsed)
-            except (ValueError, TypeError):
-                pass
-    if user_id:
-        try:
-            commands_qs = commands_qs.filter(user_id=int(user_id))
-        except (ValueError, TypeError):
-            pass
-    
-    total_commands = commands_qs.count()
-    
-    # Get total tokens
-    from Tokenusage.models import TokenUsage
-    tokens_qs = TokenUsage.objects.all()
-    if date_from or date_to:
-        if date_from:
-            try:
-                date_from_parsed = parse_date(date_from)
-                if date_from_parsed:
-                    tokens_qs = tokens_qs.filter(created_at__date__gte=date_from_parsed)
-            except (ValueError, TypeError):
-                pass
-        if date_to:
-            try:
-                date_to_parsed = parse_date(date_to)
-                if date_to_parsed:
-                    date_to_parsed = date_to_parsed + timedelta(days=1)
-                    tokens_qs = tokens_qs.filter(created_at__date__lt=date_to_parsed)
-            except (ValueError, TypeError):
-                pass
-    if user_id:
-        try:
-            tokens_qs = tokens_qs.filter(user_id=int(user_id))
-        except (ValueError, TypeError):
-            pass
-    
-    total_tokens = tokens_qs.aggregate(total=Sum('tokens_total'))['total'] or 0
+    # Totals come from the daily rollup instead of the raw tables
+    totals = activity.aggregate(
+        total_sessions=Sum('sessions_created'),
+        total_messages=Sum('messages'),
+        total_commands=Sum('commands'),
+        total_tokens=Sum('tokens_total')
+    )
     
     # Get user activity breakdown
+    per_user = {
+        row['user_id']: row
+        for row in activity.values('user_id').annotate(
+            sessions_count=Sum('sessions_created'),
+            commands_count=Sum('commands'),
+            tokens_used=Sum('tokens_total'),
+            last_activity=Max('last_activity_at')
+        ).order_by()
+    }
+    
     user_activity = []
-    for user in users:
-        # Get user-specific stats with date filters
-        user_sessions_qs = user.sessions.all()
-        user_commands_qs = user.command_executions.all()
-        user_tokens_qs = user.token_usages.all()
-        
-        if date_from:
-            try:
-                date_from_parsed = parse_date(date_from)
-                if date_from_parsed:
-                    user_sessions_qs = user_sessions_qs.filter(created_at__date__gte=date_from_parsed)
-                    user_commands_qs = user_commands_qs.filter(created_at__date__gte=date_from_parsed)
-                    user_tokens_qs = user_tokens_qs.filter(created_at__date__gte=date_from_parsed)
-            except (ValueError, TypeError):
-                pass
-        
-        if date_to:
-            try:
-                date_to_parsed = parse_date(date_to)
-                if date_to_parsed:
-                    date_to_parsed = date_to_parsed + timedelta(days=1)
-                    user_sessions_qs = user_sessions_qs.filter(created_at__date__lt=date_to_parsed)
-                    user_commands_qs = user_commands_qs.filter(created_at__date__lt=date_to_parsed)
-                    user_tokens_qs = user_tokens_qs.filter(created_at__date__lt=date_to_parsed)
-            except (ValueError, TypeError):
-                pass
-        
-        sessions_count = user_sessions_qs.count()
-        commands_count = user_commands_qs.count()
-        tokens_used = user_tokens_qs.aggregate(total=Sum('tokens_total'))['total'] or 0
-        
-        # Get last activity (most recent session, command, or token usage)
-        last_session = user_sessions_qs.order_by('-last_activity_at').first()
-        last_command = user_commands_qs.order_by('-created_at').first()
-        last_token = user_tokens_qs.order_by('-created_at').first()
-        
-        last_activity = None
-        if last_session and last_session.last_activity_at:
-            last_activity = last_session.last_activity_at
-        if last_command and last_command.created_at:
-            if not last_activity or last_command.created_at > last_activity:
-                last_activity = last_command.created_at
-        if last_token and last_token.created_at:
-            if not last_activity or last_token.created_at > last_activity:
-                last_activity = last_token.created_at
-        
+    for user in users.only('id', 'username'):
+        row = per_user.get(user.id, {})
+        last_activity = row.get('last_activity')
         user_activity.append({
             'user_id': user.id,
             'username': user.username,
-            'sessions_count': sessions_count,
-            'commands_count': commands_count,
-            'tokens_used': tokens_used,
+            'sessions_count': row.get('sessions_count') or 0,
+            'commands_count': row.get('commands_count') or 0,
+            'tokens_used': row.get('tokens_used') or 0,
             'last_activity': last_activity.isoformat() if last_activity else None
         })
     
@@ -270,10 +186,10 @@ def admin_activity_summary(request):
         'summary': {
             'total_users': total_users,
             'active_users': active_users,
-            'total_sessions': total_sessions,
-            'total_messages': total_messages,
-            'total_commands': total_commands,
-            'total_tokens': total_tokens
+            'total_sessions': totals['total_sessions'] or 0,
+            'total_messages': totals['total_messages'] or 0,
+            'total_commands': totals['total_commands'] or 0,
+            'total_tokens': totals['total_tokens'] or 0
         },
         'user_activity': user_activity
     })
@@ -296,16 +212,18 @@ def admin_user_details(request, user_id):
             'error': 'User not found'
         }, status=status.HTTP_404_NOT_FOUND)
     
-    # Get user statistics
-    total_sessions = user.sessions.count()
+    # Get user statistics from the daily rollup
+    totals = DailyUserActivity.objects.filter(user=user).aggregate(
+        total_sessions=Sum('sessions_created'),
+        total_messages=Sum('messages'),
+        total_commands=Sum('commands'),
+        total_tokens_used=Sum('tokens_total')
+    )
+    total_sessions = totals['total_sessions'] or 0
     active_sessions = user.sessions.filter(status='active').count()
-    # Count messages across all user sessions
-    from message.models import Message
-    total_messages = Message.objects.filter(session__user=user).count()
-    total_commands = user.command_executions.count()
-    total_tokens_used = user.token_usages.aggregate(
-        total=Sum('tokens_total')
-    )['total'] or 0
+    total_messages = totals['total_messages'] or 0
+    total_commands = totals['total_commands'] or 0
+    total_tokens_used = totals['total_tokens_used'] or 0
     
     # Get tokens by model
     from Tokenusage.models import TokenUsage
@@ -332,12 +250,15 @@ def admin_user_details(request, user_id):
     
     # Get recent commands (last 10)
     from CommandExecution.models import CommandExecution
-    recent_commands = user.command_executions.order_by('-created_at')[:10]
+    # Only a 101-character prefix of each command leaves the database
+    recent_commands = user.command_executions.order_by('-created_at').annotate(
+        command_prefix=Substr('command', 1, 101)
+    ).only('id', 'command_type', 'status', 'created_at')[:10]
     recent_commands_data = []
     for command in recent_commands:
         recent_commands_data.append({
             'id': str(command.id),
-            'command': command.command[:100] + '...' if len(command.command) > 100 else command.command,
+            'command': command.command_prefix[:100] + '...' if len(command.command_prefix) > 100 else command.command_prefix,
             'command_type': command.command_type,
             'status': command.status,
             'created_at': command.created_at.isoformat()
@@ -8,15 +8,15 @@ class CommandExecutionAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'command_preview', 'command_type', 'status', 'execution_time_ms', 'created_at']
     list_filter = ['command_type', 'status', 'created_at', 'user']
     search_fields = ['command', 'user__username', 'user__email', 'hostname', 'ip_address']
-    readonly_fields = ['id', 'created_at']
+    readonly_fields = ['id', 'fingerprint', 'created_at', 'output_size', 'output_tail']
     date_hierarchy = 'created_at'
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('id', 'user', 'session', 'command', 'command_type', 'status')
+            'fields': ('id', 'user', 'session', 'command', 'fingerprint', 'command_type', 'status')
         }),
         ('Execution Details', {
-            'fields': ('output', 'exit_code', 'execution_time_ms', 'error_message')
+            'fields': ('output_size', 'output_tail', 'exit_code', 'execution_time_ms', 'error_message')
         }),
         ('System Information', {
             'fields': ('hostname', 'ip_address', 'created_at')
@@ -27,3 +27,10 @@ class CommandExecutionAdmin(admin.ModelAdmin):
         """Show first 50 characters of command"""
         return obj.command[:50] + '...' if len(obj.command) > 50 else obj.command
     command_preview.short_description = 'Command Preview'
+    
+    def output_tail(self, obj):
+        """Show the last 50 lines of output"""
+        if not obj or not obj.pk:
+            return ''
+        return obj.tail_output(50)[0].decode('utf-8', errors='replace')
+    output_tail.short_description = 'Output (last 50 lines)'
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CommandConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'CommandExecution'
+
+    def ready(self):
+        from zapfix_backend.triggers import restore_after_migrate
+        from .search import DOCS_TABLE, sqlite_triggers
+        # The command insert/update/delete triggers feed the trigram index
+        restore_after_migrate(self, DOCS_TABLE, sqlite_triggers)
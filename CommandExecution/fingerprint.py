@@ -0,0 +1,81 @@
+"""
+Command fingerprints: the shape of a command with its arguments stripped.
+
+`normalize_command` keeps what identifies the kind of command (the program,
+its subcommands, flag names, shell operators) and replaces arguments, paths,
+numbers, quoted strings and flag/variable values with `?`:
+
+    kubectl delete pod api-7f9c -n prod   ->  kubectl delete pod ? -n ?
+    rm -rf /tmp/build-42                  ->  rm -rf ?
+    FOO=1 make test 2> err.log            ->  FOO=? make test 2> ?
+
+Subcommands are the bare lowercase words right after the program; the first
+argument or flag ends them, so later words are stripped too. The fingerprint is
+a short hash of the normalised text, stored on CommandExecution so analytics
+can group on a small indexed column instead of unbounded command text.
+"""
+import hashlib
+import re
+
+FINGERPRINT_LENGTH = 16
+PLACEHOLDER = '?'
+
+_TOKEN = re.compile(r"""'[^']*'?|"(?:\\.|[^"\\])*"?|\d*>&\d+|\|\||&&|[|;&]|\d*>>?|<|[^\s|;&<>'"]+""")
+_SEPARATOR = re.compile(r'^(?:\|\||&&|[|;&])$')
+_DUPLICATE = re.compile(r'^\d*>&\d+$')
+_REDIRECT = re.compile(r'^(?:\d*>>?|<)$')
+_WORD = re.compile(r'^[a-z][a-z_-]*$')
+_ASSIGNMENT = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*=')
+_FLAG = re.compile(r'^(--?[A-Za-z][A-Za-z0-9_-]*)(=.*)?$')
+
+
+def normalize_command(command):
+    """Return the argument-free shape of `command` (see the module docstring)"""
+    normalized = []
+    expect_program = True
+    in_arguments = False
+    redirect_target = False
+    for token in _TOKEN.findall(command or ''):
+        if _SEPARATOR.match(token):
+            # A new command starts after every pipe, list or background operator
+            normalized.append(token)
+            expect_program, in_arguments, redirect_target = True, False, False
+            continue
+        if _DUPLICATE.match(token):
+            # 2>&1 and friends carry no argument
+            normalized.append(token)
+            continue
+        if _REDIRECT.match(token):
+            normalized.append(token)
+            redirect_target = True
+            continue
+        if redirect_target:
+            value = PLACEHOLDER
+            redirect_target = False
+        elif expect_program and _ASSIGNMENT.match(token):
+            # Environment assignments before the program keep only the name
+            value = token.split('=', 1)[0] + '=' + PLACEHOLDER
+        elif expect_program:
+            value = token.rsplit('/', 1)[-1] or PLACEHOLDER
+            expect_program = False
+        else:
+            flag = _FLAG.match(token)
+            if flag:
+                # Words after a flag may be its value, so they count as arguments
+                value = flag.group(1) + ('=' + PLACEHOLDER if flag.group(2) else '')
+                in_arguments = True
+            elif not in_arguments and _WORD.match(token):
+                value = token
+            else:
+                value = PLACEHOLDER
+                in_arguments = True
+        if value == PLACEHOLDER and normalized and normalized[-1] == PLACEHOLDER:
+            # Runs of arguments collapse, so `rm -f a.log b.log` and `rm -f a.log` match
+            continue
+        normalized.append(value)
+    return ' '.join(normalized)
+
+
+def fingerprint_command(command):
+    """Hex digest identifying the normalised form of `command`"""
+    return hashlib.sha1(normalize_command(command).encode('utf-8')).hexdigest()[:FINGERPRINT_LENGTH]
@@ -0,0 +1,53 @@
+"""
+Log-bucketed histogram of command execution times.
+
+A duration of `x` ms > 0 falls in bucket `ceil(log(x) / log(GAMMA)) + 1`, so
+bucket `i` covers (GAMMA**(i-2), GAMMA**(i-1)] and every value in it is within
+RELATIVE_ACCURACY of the bucket's representative value. Bucket 0 holds zero
+(and negative) durations. Histograms merge by adding counts per bucket, so the
+DailyCommandLatency rows of any set of days, command types and hosts can be
+combined with a plain SUM ... GROUP BY bucket. A day's worth of milliseconds
+needs fewer than 1,000 buckets.
+"""
+import math
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+
+
+def bucket_index(value):
+    """Bucket holding a duration of `value` ms"""
+    if value <= 0:
+        return 0
+    return math.ceil(math.log(value) / _LOG_GAMMA) + 1
+
+
+def bucket_value(index):
+    """Representative duration of bucket `index`, within RELATIVE_ACCURACY of every value in it"""
+    if index <= 0:
+        return 0.0
+    return 2 * GAMMA ** (index - 1) / (GAMMA + 1)
+
+
+def quantiles(counts, percentiles):
+    """
+    Estimate nearest-rank percentiles from {bucket: count}.
+
+    Returns {percentile: value or None}; the estimate for p is within
+    RELATIVE_ACCURACY of the exact value at rank ceil(p% of n).
+    """
+    total = sum(counts.values())
+    if not total:
+        return {percentile: None for percentile in percentiles}
+    ordered = sorted(counts.items())
+    estimates = {}
+    for percentile in percentiles:
+        rank = max(1, math.ceil(total * percentile / 100))
+        seen = 0
+        for index, count in ordered:
+            seen += count
+            if seen >= rank:
+                estimates[percentile] = bucket_value(index)
+                break
+    return estimates
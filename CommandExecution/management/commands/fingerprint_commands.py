@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from CommandExecution.fingerprint import fingerprint_command
+from CommandExecution.models import CommandExecution
+
+
+class Command(BaseCommand):
+    help = "Fingerprint commands recorded before fingerprints existed (run once after upgrading)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute every fingerprint, e.g. after the normalisation rules change')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Commands to fingerprint per batch')
+
+    def handle(self, *args, **options):
+        commands = CommandExecution.objects.only('id', 'command', 'fingerprint').order_by('pk')
+        if not options['all']:
+            commands = commands.filter(fingerprint='')
+
+        updated = 0
+        last_pk = None
+        while True:
+            batch = commands if last_pk is None else commands.filter(pk__gt=last_pk)
+            batch = list(batch[:options['batch_size']])
+            if not batch:
+                break
+            changed = []
+            for command in batch:
+                fingerprint = fingerprint_command(command.command)
+                if fingerprint != command.fingerprint:
+                    command.fingerprint = fingerprint
+                    changed.append(command)
+            with transaction.atomic():
+                CommandExecution.objects.bulk_update(changed, ['fingerprint'])
+            updated += len(changed)
+            last_pk = batch[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f'Fingerprinted {updated} commands'))
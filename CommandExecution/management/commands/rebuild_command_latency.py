@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from CommandExecution.latency import bucket_index
+from CommandExecution.models import CommandExecution, DailyCommandLatency
+from zapfix_backend.filters import DateRangeFilter
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily command latency histograms for a date range from command_executions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', required=True, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--date-to', required=True, help='Last day to rebuild, inclusive (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        date_from = parse_date(options['date_from'] or '')
+        date_to = parse_date(options['date_to'] or '')
+        if not date_from or not date_to:
+            raise CommandError('--date-from and --date-to must be dates in YYYY-MM-DD format')
+        if date_from > date_to:
+            raise CommandError('--date-from must not be after --date-to')
+
+        date_range = DateRangeFilter(date_from, date_to)
+        timed = date_range.filter(CommandExecution.objects.filter(execution_time_ms__isnull=False)).order_by()
+
+        counts = {}
+        for created_at, command_type, hostname, execution_time_ms in timed.values_list(
+            'created_at', 'command_type', 'hostname', 'execution_time_ms'
+        ).iterator(chunk_size=5000):
+            key = (timezone.localdate(created_at), command_type, hostname or '', bucket_index(execution_time_ms))
+            counts[key] = counts.get(key, 0) + 1
+
+        with transaction.atomic():
+            deleted, _ = date_range.filter_days(DailyCommandLatency.objects.all()).delete()
+            DailyCommandLatency.objects.bulk_create([
+                DailyCommandLatency(day=day, command_type=command_type, hostname=hostname, bucket=bucket, count=count)
+                for (day, command_type, hostname, bucket), count in counts.items()
+            ], batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(counts)} histogram buckets (replaced {deleted})'))
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from zapfix_backend.partitioning import partition_table, unpartition_table
+
+
+def forwards(apps, schema_editor):
+    partition_table(schema_editor, 'command_executions')
+
+
+def backwards(apps, schema_editor):
+    unpartition_table(schema_editor, 'command_executions')
+
+
+class Migration(migrations.Migration):
+    """Range-partition command_executions by month on PostgreSQL; no-op elsewhere"""
+
+    dependencies = [
+        ('CommandExecution', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
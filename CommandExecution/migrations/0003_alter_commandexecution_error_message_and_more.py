@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-17 15:05
+
+import zapfix_backend.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CommandExecution', '0002_partition_command_executions'),
+    ]
+
+    # The columns stay text; only the Python-side encoding changes, so skip the
+    # table rebuild some backends would do for AlterField
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='commandexecution',
+                    name='error_message',
+                    field=zapfix_backend.fields.CompressedTextField(blank=True),
+                ),
+                migrations.AlterField(
+                    model_name='commandexecution',
+                    name='output',
+                    field=zapfix_backend.fields.CompressedTextField(blank=True),
+                ),
+            ],
+        ),
+    ]
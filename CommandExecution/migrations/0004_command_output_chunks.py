@@ -0,0 +1,63 @@
+# Generated by Django 6.0 on 2026-10-17 15:40
+
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CHUNK_SIZE = 256 * 1024
+
+
+def move_output_to_chunks(apps, schema_editor):
+    CommandExecution = apps.get_model('CommandExecution', 'CommandExecution')
+    CommandOutputChunk = apps.get_model('CommandExecution', 'CommandOutputChunk')
+    commands = CommandExecution.objects.exclude(output='').only('id', 'output')
+    for command in commands.iterator(chunk_size=500):
+        data = command.output.encode('utf-8')
+        CommandOutputChunk.objects.bulk_create([
+            CommandOutputChunk(command_id=command.id, index=index, data=zlib.compress(data[start:start + CHUNK_SIZE]))
+            for index, start in enumerate(range(0, len(data), CHUNK_SIZE))
+        ])
+        CommandExecution.objects.filter(pk=command.id).update(output_size=len(data))
+
+
+def move_chunks_to_output(apps, schema_editor):
+    CommandExecution = apps.get_model('CommandExecution', 'CommandExecution')
+    CommandOutputChunk = apps.get_model('CommandExecution', 'CommandOutputChunk')
+    for command in CommandExecution.objects.filter(output_size__gt=0).only('id').iterator(chunk_size=500):
+        chunks = CommandOutputChunk.objects.filter(command_id=command.id).order_by('index').values_list('data', flat=True)
+        output = b''.join(zlib.decompress(chunk) for chunk in chunks).decode('utf-8')
+        CommandExecution.objects.filter(pk=command.id).update(output=output)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CommandExecution', '0003_alter_commandexecution_error_message_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandexecution',
+            name='output_size',
+            field=models.BigIntegerField(default=0, help_text='Size of the output in bytes (UTF-8); the text lives in CommandOutputChunk'),
+        ),
+        migrations.CreateModel(
+            name='CommandOutputChunk',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('index', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('command', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='output_chunks', to='CommandExecution.commandexecution')),
+            ],
+            options={
+                'db_table': 'command_output_chunks',
+                'constraints': [models.UniqueConstraint(fields=('command', 'index'), name='command_output_chunk_unique')],
+            },
+        ),
+        migrations.RunPython(move_output_to_chunks, move_chunks_to_output),
+        migrations.RemoveField(
+            model_name='commandexecution',
+            name='output',
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from CommandExecution.search import create_search_index, drop_search_index
+
+
+def forwards(apps, schema_editor):
+    create_search_index(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    drop_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+    """Substring index for commands: pg_trgm GIN on PostgreSQL, FTS5 trigram side table on SQLite"""
+
+    dependencies = [
+        ('CommandExecution', '0004_command_output_chunks'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
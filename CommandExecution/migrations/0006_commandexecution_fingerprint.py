@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-17 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CommandExecution', '0005_command_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandexecution',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', help_text='Hash of the command with arguments, paths and numbers stripped so analytics can group on it', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='commandexecution',
+            index=models.Index(fields=['fingerprint', 'created_at'], name='command_exe_fingerp_982333_idx'),
+        ),
+    ]
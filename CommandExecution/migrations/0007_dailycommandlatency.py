@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-17 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('CommandExecution', '0006_commandexecution_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCommandLatency',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('command_type', models.CharField(max_length=20)),
+                ('hostname', models.CharField(blank=True, max_length=255)),
+                ('bucket', models.SmallIntegerField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'command_latency_daily',
+                'indexes': [models.Index(fields=['day'], name='command_lat_day_1583d9_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'command_type', 'hostname', 'bucket'), name='command_latency_daily_uniq')],
+            },
+        ),
+    ]
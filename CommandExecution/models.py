@@ -1,7 +1,15 @@
-from django.db import models
+import zlib
+
+from django.db import connection, models
+from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
 import uuid
 
+from zapfix_backend.fields import CompressedTextField
+from .fingerprint import FINGERPRINT_LENGTH, fingerprint_command
+from .latency import bucket_index
+
 
 class CommandExecution(models.Model):
     """Command execution tracking model"""
@@ -22,12 +30,13 @@ class CommandExecution(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='command_executions')
     session = models.ForeignKey('session.Session', on_delete=models.SET_NULL, null=True, blank=True, related_name='command_executions')
     command = models.TextField()
+    fingerprint = models.CharField(max_length=FINGERPRINT_LENGTH, blank=True, default='', help_text="Hash of the command with arguments, paths and numbers stripped so analytics can group on it")
     command_type = models.CharField(max_length=20, choices=COMMAND_TYPE_CHOICES)
-    output = models.TextField(blank=True)
+    output_size = models.BigIntegerField(default=0, help_text="Size of the output in bytes (UTF-8); the text lives in CommandOutputChunk")
     exit_code = models.IntegerField(null=True, blank=True)
     execution_time_ms = models.IntegerField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
-    error_message = models.TextField(blank=True)
+    error_message = CompressedTextField(blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     hostname = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -40,7 +49,157 @@ class CommandExecution(models.Model):
             models.Index(fields=['command_type']),
             models.Index(fields=['status']),
             models.Index(fields=['session']),
+            models.Index(fields=['fingerprint', 'created_at']),
         ]
 
     def __str__(self):
         return f"{self.command_type} | {self.status} | {self.user.username}"
+    
+    def save(self, *args, **kwargs):
+        """Fingerprint the command whenever it is written"""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'command' in update_fields:
+            self.fingerprint = fingerprint_command(self.command)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'fingerprint'}
+        super().save(*args, **kwargs)
+    
+    def write_output(self, text):
+        """Replace the command's output with `text`, stored in compressed chunks"""
+        data = (text or '').encode('utf-8')
+        self.output_chunks.all().delete()
+        CommandOutputChunk.objects.bulk_create(CommandOutputChunk.split(self, data))
+        self.output_size = len(data)
+        CommandExecution.objects.filter(pk=self.pk).update(output_size=self.output_size)
+    
+    def read_output(self, start=0, end=None):
+        """
+        Return bytes [start, end) of the output, loading only the chunks that overlap.
+        
+        Byte offsets can split a multi-byte character; callers decode with
+        errors='replace' where that matters.
+        """
+        end = self.output_size if end is None else min(end, self.output_size)
+        start = max(0, start)
+        if start >= end:
+            return b''
+        size = CommandOutputChunk.CHUNK_SIZE
+        chunks = self.output_chunks.filter(index__gte=start // size, index__lte=(end - 1) // size).order_by('index')
+        data = b''.join(zlib.decompress(chunk.data) for chunk in chunks)
+        offset = (start // size) * size
+        return data[start - offset:end - offset]
+    
+    def tail_output(self, lines):
+        """Return (bytes, start offset) of the last `lines` lines, reading chunks from the end"""
+        if lines <= 0 or not self.output_size:
+            return b'', self.output_size
+        size = CommandOutputChunk.CHUNK_SIZE
+        data = b''
+        wanted = lines
+        index = (self.output_size - 1) // size
+        while index >= 0:
+            part = zlib.decompress(self.output_chunks.filter(index=index).values_list('data', flat=True).get())
+            if not data and part.endswith(b'\n'):
+                # A trailing newline ends the last line rather than starting a new one
+                wanted = lines + 1
+            data = part + data
+            if data.count(b'\n') >= wanted:
+                break
+            index -= 1
+        cut = len(data)
+        for _ in range(wanted):
+            cut = data.rfind(b'\n', 0, cut)
+            if cut < 0:
+                break
+        data = data if cut < 0 else data[cut + 1:]
+        return data, self.output_size - len(data)
+
+
+class CommandOutputChunk(models.Model):
+    """
+    Slice of a command's output, zlib-compressed, stored apart from the command row.
+    
+    Outputs are split every CHUNK_SIZE bytes, so range and tail reads fetch only
+    the chunks they need and list queries never touch output bytes. There is no
+    database-level foreign key because command_executions is partitioned on
+    PostgreSQL and its id alone is not unique there; deletes cascade in Django.
+    """
+    CHUNK_SIZE = 256 * 1024
+    
+    id = models.BigAutoField(primary_key=True)
+    command = models.ForeignKey(CommandExecution, on_delete=models.CASCADE, db_constraint=False, related_name='output_chunks')
+    index = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        db_table = 'command_output_chunks'
+        constraints = [
+            models.UniqueConstraint(fields=['command', 'index'], name='command_output_chunk_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.command_id} chunk {self.index}"
+
+    @classmethod
+    def split(cls, command, data):
+        """Unsaved chunks holding the UTF-8 output bytes `data` of `command`"""
+        return [
+            cls(command=command, index=index, data=zlib.compress(data[start:start + cls.CHUNK_SIZE]))
+            for index, start in enumerate(range(0, len(data), cls.CHUNK_SIZE))
+        ]
+
+
+class DailyCommandLatency(models.Model):
+    """
+    Day x command type x hostname histogram of execution_time_ms, maintained on insert.
+    
+    Each row is one non-empty bucket of the log-bucketed histogram described
+    in CommandExecution/latency.py; summing counts per bucket merges any
+    selection of rows into a single histogram.
+    """
+    id = models.BigAutoField(primary_key=True)
+    day = models.DateField()
+    command_type = models.CharField(max_length=20)
+    hostname = models.CharField(max_length=255, blank=True)
+    bucket = models.SmallIntegerField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'command_latency_daily'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'command_type', 'hostname', 'bucket'], name='command_latency_daily_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} | {self.command_type} | {self.hostname} | bucket {self.bucket}: {self.count}"
+
+    @classmethod
+    def record(cls, commands):
+        """Add the execution times of CommandExecution rows to their daily histograms"""
+        deltas = {}
+        for command in commands:
+            if command.execution_time_ms is None:
+                continue
+            key = (timezone.localdate(command.created_at), command.command_type, command.hostname or '', bucket_index(command.execution_time_ms))
+            deltas[key] = deltas.get(key, 0) + 1
+        if not deltas:
+            return
+        if connection.features.supports_update_conflicts_with_target:
+            # One upsert per bucket, sent as a single batch (PostgreSQL, SQLite >= 3.24)
+            table = connection.ops.quote_name(cls._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO {table} (day, command_type, hostname, bucket, count) VALUES (%s, %s, %s, %s, %s) '
+                    f'ON CONFLICT (day, command_type, hostname, bucket) DO UPDATE SET count = {table}.count + excluded.count',
+                    [
+                        (connection.ops.adapt_datefield_value(day), command_type, hostname, bucket, count)
+                        for (day, command_type, hostname, bucket), count in deltas.items()
+                    ]
+                )
+            return
+        for (day, command_type, hostname, bucket), count in deltas.items():
+            row, _ = cls.objects.get_or_create(day=day, command_type=command_type, hostname=hostname, bucket=bucket)
+            cls.objects.filter(pk=row.pk).update(count=F('count') + count)
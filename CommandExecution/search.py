@@ -0,0 +1,139 @@
+"""
+Substring and prefix search over CommandExecution.command.
+
+PostgreSQL uses a pg_trgm GIN index on UPPER(command), which is exactly the
+expression Django's `icontains`/`istartswith` lookups compare, so those
+lookups become index scans. SQLite keeps an FTS5 `trigram` index over
+`command_search_docs`, maintained by triggers on command_executions; queries
+narrow candidates through it and recheck with the same Django lookup. Like
+PostgreSQL's planner, it falls back to a plain scan for patterns too common to
+be worth an index (SQLite cannot estimate that itself), and it needs planner
+statistics (ANALYZE / PRAGMA optimize) to prefer the index over user_id.
+
+The triggers on command_executions are re-created after each migrate (see
+zapfix_backend/triggers.py).
+"""
+import time
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+DOCS_TABLE = 'command_search_docs'
+FTS_TABLE = 'command_search'
+TRGM_INDEX = 'command_executions_command_trgm_idx'
+# Trigram indexes cannot narrow patterns shorter than this
+MIN_INDEXED_LENGTH = 3
+# Above this share of matching rows a scan beats the index lookups (SQLite)
+MAX_INDEXED_SELECTIVITY = 0.02
+# Seconds to reuse the indexed row count the selectivity check is relative to
+ROW_COUNT_TTL = 300.0
+
+_row_count = None  # (counted at, rows), per process
+
+
+def _command_table():
+    from .models import CommandExecution
+    return CommandExecution._meta.db_table
+
+
+def sqlite_triggers(quote):
+    """Triggers on command_executions that copy commands into the documents table"""
+    table, docs = quote(_command_table()), quote(DOCS_TABLE)
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS command_search_command_ai AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {docs} (command_id, command) VALUES (new.id, new.command); END',
+        f'CREATE TRIGGER IF NOT EXISTS command_search_command_au AFTER UPDATE OF command ON {table} BEGIN '
+        f'UPDATE {docs} SET command = new.command WHERE command_id = new.id; END',
+        f'CREATE TRIGGER IF NOT EXISTS command_search_command_ad AFTER DELETE ON {table} BEGIN '
+        f'DELETE FROM {docs} WHERE command_id = old.id; END',
+    ]
+
+
+def _sqlite_docs_triggers(quote):
+    docs, fts = quote(DOCS_TABLE), quote(FTS_TABLE)
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS command_search_docs_ai AFTER INSERT ON {docs} BEGIN '
+        f'INSERT INTO {fts}(rowid, command) VALUES (new.id, new.command); END',
+        f'CREATE TRIGGER IF NOT EXISTS command_search_docs_ad AFTER DELETE ON {docs} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, command) VALUES ('delete', old.id, old.command); END",
+        f'CREATE TRIGGER IF NOT EXISTS command_search_docs_au AFTER UPDATE ON {docs} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, command) VALUES ('delete', old.id, old.command); "
+        f'INSERT INTO {fts}(rowid, command) VALUES (new.id, new.command); END',
+    ]
+
+
+def create_search_index(schema_editor):
+    """Create the backend's command search structures (called from a migration)"""
+    vendor = schema_editor.connection.vendor
+    quote = schema_editor.quote_name
+    table = quote(_command_table())
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(f'CREATE INDEX {TRGM_INDEX} ON {table} USING GIN (UPPER(command) gin_trgm_ops)')
+    elif vendor == 'sqlite':
+        docs, fts = quote(DOCS_TABLE), quote(FTS_TABLE)
+        schema_editor.execute(
+            f'CREATE TABLE {docs} (id INTEGER PRIMARY KEY, command_id char(32) NOT NULL UNIQUE, command TEXT NOT NULL)'
+        )
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5(command, content={docs}, content_rowid='id', tokenize='trigram')"
+        )
+        for statement in _sqlite_docs_triggers(quote):
+            schema_editor.execute(statement)
+        schema_editor.execute(f'INSERT INTO {docs} (command_id, command) SELECT id, command FROM {table}')
+        for statement in sqlite_triggers(quote):
+            schema_editor.execute(statement)
+
+
+def drop_search_index(schema_editor):
+    """Remove the backend's command search structures (called from a migration)"""
+    vendor = schema_editor.connection.vendor
+    quote = schema_editor.quote_name
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {TRGM_INDEX}')
+    elif vendor == 'sqlite':
+        for name in ['command_search_command_ai', 'command_search_command_au', 'command_search_command_ad']:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {quote(FTS_TABLE)}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {quote(DOCS_TABLE)}')
+
+
+def _indexed_rows():
+    """Number of indexed commands, recounted at most every ROW_COUNT_TTL seconds"""
+    global _row_count
+    now = time.monotonic()
+    if _row_count is None or now - _row_count[0] > ROW_COUNT_TTL:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(DOCS_TABLE)}')
+            _row_count = (now, cursor.fetchone()[0])
+    return _row_count[1]
+
+
+def _is_selective(match):
+    """Whether an FTS5 `match` hits few enough documents for the index to pay off"""
+    quote = connection.ops.quote_name
+    limit = int(_indexed_rows() * MAX_INDEXED_SELECTIVITY) + 1
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT COUNT(*) FROM (SELECT rowid FROM {quote(FTS_TABLE)} WHERE {quote(FTS_TABLE)} MATCH %s LIMIT %s)',
+            [match, limit]
+        )
+        return cursor.fetchone()[0] < limit
+
+
+def filter_commands(queryset, query, prefix=False):
+    """Restrict `queryset` to commands containing (or starting with) `query`, case-insensitively"""
+    lookup = 'command__istartswith' if prefix else 'command__icontains'
+    queryset = queryset.filter(**{lookup: query})
+    if connection.vendor == 'sqlite' and len(query) >= MIN_INDEXED_LENGTH:
+        # A quoted FTS5 trigram phrase matches any substring; the lookup above rechecks it
+        match = '"%s"' % query.replace('"', '""')
+        if not _is_selective(match):
+            return queryset
+        quote = connection.ops.quote_name
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT d.command_id FROM {quote(FTS_TABLE)} JOIN {quote(DOCS_TABLE)} d ON d.id = {quote(FTS_TABLE)}.rowid '
+            f'WHERE {quote(FTS_TABLE)} MATCH %s',
+            [match]
+        ))
+    return queryset
@@ -1,9 +1,10 @@
 from rest_framework import serializers
-from .models import CommandExecution
+from .models import CommandExecution, DailyCommandLatency
 
 class CommandExecutionCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating command execution"""
     session_id = serializers.UUIDField(required=False, allow_null=True, write_only=True)
+    output = serializers.CharField(required=False, allow_blank=True, write_only=True, trim_whitespace=False)
     
     class Meta:
         model = CommandExecution
@@ -13,7 +14,6 @@ class CommandExecutionCreateSerializer(serializers.ModelSerializer):
             'error_message', 'hostname', 'ip_address'
         ]
         extra_kwargs = {
-            'output': {'required': False, 'allow_blank': True},
             'exit_code': {'required': False, 'allow_null': True},
             'execution_time_ms': {'required': False, 'allow_null': True},
             'error_message': {'required': False, 'allow_blank': True},
@@ -21,9 +21,25 @@ class CommandExecutionCreateSerializer(serializers.ModelSerializer):
             'ip_address': {'required': False, 'allow_null': True},
         }
     
+    @staticmethod
+    def resolve_sessions(user, session_ids):
+        """
+        Look up the sessions `user` owns among the given IDs with one query.
+        
+        Returns {session_id: Session}; IDs that don't exist or belong to another
+        user are simply absent.
+        """
+        from session.models import Session
+        
+        session_ids = {pk for pk in session_ids if pk}
+        if not session_ids:
+            return {}
+        return Session.objects.filter(pk__in=session_ids, user=user).in_bulk()
+    
     def create(self, validated_data):
         request = self.context['request']
         session_id = validated_data.pop('session_id', None)
+        output = validated_data.pop('output', '')
         
         # Get session if session_id provided
         session = None
@@ -34,18 +50,22 @@ class CommandExecutionCreateSerializer(serializers.ModelSerializer):
             except Session.DoesNotExist:
                 pass  # session_id is optional, so we continue without it
         
-        return CommandExecution.objects.create(
+        command = CommandExecution.objects.create(
             user=request.user,
             session=session,
             **validated_data
         )
+        if output:
+            command.write_output(output)
+        DailyCommandLatency.record([command])
+        return command
 
 
 class CommandExecutionListSerializer(serializers.ModelSerializer):
     """Serializer for listing command executions"""
     user_id = serializers.IntegerField(source='user.id', read_only=True)
     username = serializers.CharField(source='user.username', read_only=True)
-    session_id = serializers.UUIDField(source='session.id', read_only=True, allow_null=True)
+    session_id = serializers.UUIDField(read_only=True, allow_null=True)
     
     class Meta:
         model = CommandExecution
@@ -57,16 +77,16 @@ class CommandExecutionListSerializer(serializers.ModelSerializer):
 
 
 class CommandExecutionDetailSerializer(serializers.ModelSerializer):
-    """Serializer for command execution detail"""
+    """Serializer for command execution detail (output is read separately, see command_detail)"""
     user_id = serializers.IntegerField(source='user.id', read_only=True)
     username = serializers.CharField(source='user.username', read_only=True)
-    session_id = serializers.UUIDField(source='session.id', read_only=True, allow_null=True)
+    session_id = serializers.UUIDField(read_only=True, allow_null=True)
     
     class Meta:
         model = CommandExecution
         fields = [
             'id', 'user_id', 'username', 'session_id', 'command',
-            'command_type', 'output', 'exit_code', 'execution_time_ms',
+            'command_type', 'output_size', 'exit_code', 'execution_time_ms',
             'status', 'error_message', 'hostname', 'ip_address', 'created_at'
         ]
         read_only_fields = ['id', 'user_id', 'username', 'session_id', 'created_at']
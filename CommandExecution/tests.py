@@ -1,3 +1,642 @@
-from django.test import TestCase
+import gzip
+import json
+import math
+import os
+import random
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from session.models import Session
+from users.models import UserProfile
+from zapfix_backend.triggers import ensure_sqlite_triggers
+from .fingerprint import fingerprint_command, normalize_command
+from .latency import RELATIVE_ACCURACY, bucket_index, bucket_value, quantiles
+from .models import CommandExecution, CommandOutputChunk, DailyCommandLatency
+from .search import DOCS_TABLE, FTS_TABLE, filter_commands, sqlite_triggers
+
+TEST_SETTINGS = {
+    'AUDIT_LOG': {'ENABLED': False},
+}
+
+
+@override_settings(**TEST_SETTINGS)
+@mock.patch.object(CommandOutputChunk, 'CHUNK_SIZE', 64)
+class CommandOutputStorageTests(TestCase):
+    """Command output lives in chunks and is read by tail or byte range"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.output = ''.join(f'line {i:03d}\n' for i in range(100))
+
+    def _create(self, output=None):
+        response = self.client.post(reverse('command_list_create'), {
+            'command': 'make test', 'command_type': 'shell', 'status': 'success',
+            'output': self.output if output is None else output,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return CommandExecution.objects.get(pk=response.data['execution']['id'])
+
+    def _detail(self, command, **params):
+        return self.client.get(reverse('command_detail', args=[command.id]), params)
+
+    def test_output_is_split_into_chunks(self):
+        command = self._create()
+        self.assertEqual(command.output_size, len(self.output))
+        self.assertEqual(command.output_chunks.count(), -(-len(self.output) // 64))
+        self.assertEqual(command.read_output().decode(), self.output)
+
+    def test_tail_returns_last_lines_across_chunks(self):
+        command = self._create()
+        output, start = command.tail_output(10)
+        self.assertEqual(output.decode(), ''.join(f'line {i:03d}\n' for i in range(90, 100)))
+        self.assertEqual(start, len(self.output) - len(output))
+
+        command = self._create('a\nb\nc')
+        self.assertEqual(command.tail_output(2)[0], b'b\nc')
+        self.assertEqual(command.tail_output(10)[0], b'a\nb\nc')
+
+    def test_range_reads_only_overlapping_chunks(self):
+        command = self._create()
+        with CaptureQueriesContext(connection) as ctx:
+            data = command.read_output(100, 120)
+        self.assertEqual(data, self.output.encode()[100:120])
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_detail_endpoint(self):
+        command = self._create()
+        response = self._detail(command)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['execution']['output'], self.output)
+        self.assertEqual(response.data['execution']['output_range'], {'start': 0, 'end': 900, 'size': 900})
+
+        response = self._detail(command, tail=2)
+        self.assertEqual(response.data['execution']['output'], 'line 098\nline 099\n')
+        self.assertEqual(response.data['execution']['output_range']['start'], 882)
+
+        response = self._detail(command, offset=9, length=9)
+        self.assertEqual(response.data['execution']['output'], 'line 001\n')
+
+        self.assertEqual(self._detail(command, tail='x').status_code, 400)
+        self.assertEqual(self._detail(command, offset=-1).status_code, 400)
+
+    def test_detail_is_scoped_to_owner(self):
+        command = self._create()
+        other = APIClient()
+        other.force_authenticate(User.objects.create(username='other'))
+        self.assertEqual(other.get(reverse('command_detail', args=[command.id])).status_code, 404)
+
+    def test_list_does_not_load_output(self):
+        for _ in range(3):
+            self._create()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('command_list_create'))
+        self.assertEqual(response.data['execution']['count'], 3)
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn(CommandOutputChunk._meta.db_table, sql)
+        self.assertNotIn('error_message', sql)
+
+        # No per-row user/session lookups
+        for _ in range(3):
+            self._create()
+        with CaptureQueriesContext(connection) as more:
+            self.client.get(reverse('command_list_create'))
+        self.assertEqual(len(more.captured_queries), len(ctx.captured_queries))
+
+    def test_deleting_a_command_removes_its_chunks(self):
+        command = self._create()
+        command.delete()
+        self.assertFalse(CommandOutputChunk.objects.exists())
+
+
+@override_settings(**TEST_SETTINGS)
+@mock.patch('CommandExecution.search._row_count', None)
+class CommandSearchTests(TestCase):
+    """Substring/prefix command search is indexed, scoped and combines with the list filters"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.admin = User.objects.create(username='root')
+        UserProfile(user=self.admin, role='admin').save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('command_search')
+
+    def _add(self, command, user=None, **fields):
+        fields.setdefault('command_type', 'shell')
+        fields.setdefault('status', 'success')
+        return CommandExecution.objects.create(user=user or self.user, command=command, **fields)
+
+    def _search(self, q, client=None, **params):
+        response = (client or self.client).get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data['execution']
+
+    def _ids(self, data):
+        return {result['id'] for result in data['results']}
+
+    def test_substring_and_prefix(self):
+        rm = self._add('sudo rm -rf /tmp/build')
+        kubectl = self._add('kubectl delete pod api-7f9c')
+        self._add('ls -la')
+        self.assertEqual(self._ids(self._search('rm -rf')), {str(rm.id)})
+        self.assertEqual(self._ids(self._search('DELETE POD')), {str(kubectl.id)})
+        self.assertEqual(self._ids(self._search('kubectl', match='prefix')), {str(kubectl.id)})
+        self.assertEqual(self._search('delete', match='prefix')['count'], 0)
+
+    def test_short_and_quoted_queries(self):
+        quoted = self._add('echo "hello world" > out.txt')
+        self._add('cat out.txt')
+        self.assertEqual(self._ids(self._search('"hello')), {str(quoted.id)})
+        self.assertEqual(self._search('>')['count'], 1)
+        self.assertEqual(self._search('t')['count'], 2)
+
+    def test_results_are_scoped_to_the_user(self):
+        own = self._add('git push --force')
+        other = self._add('git push --force', user=User.objects.create(username='other'))
+        self.assertEqual(self._ids(self._search('push')), {str(own.id)})
+
+        admin = APIClient()
+        admin.force_authenticate(self.admin)
+        self.assertEqual(self._ids(self._search('push', client=admin)), {str(own.id), str(other.id)})
+        self.assertEqual(self._ids(self._search('push', client=admin, user_id=other.user_id)), {str(other.id)})
+
+    def test_combines_with_list_filters(self):
+        shell = self._add('make deploy')
+        failed = self._add('make deploy', status='failed')
+        edit = self._add('make deploy notes', command_type='file_edit')
+        CommandExecution.objects.filter(pk=edit.pk).update(created_at=timezone.now() - timedelta(days=10))
+        self.assertEqual(self._ids(self._search('deploy', status='failed')), {str(failed.id)})
+        self.assertEqual(self._ids(self._search('deploy', command_type='file_edit')), {str(edit.id)})
+        today = timezone.localdate().isoformat()
+        self.assertEqual(self._ids(self._search('deploy', date_from=today)), {str(shell.id), str(failed.id)})
+
+    def test_invalid_query(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'q': 'x', 'match': 'regex'}).status_code, 400)
+
+    def test_index_follows_edits_and_deletes(self):
+        command = self._add('terraform apply')
+        CommandExecution.objects.filter(pk=command.pk).update(command='terraform destroy')
+        self.assertEqual(self._search('apply')['count'], 0)
+        self.assertEqual(self._search('destroy')['count'], 1)
+        command.delete()
+        self.assertEqual(self._search('destroy')['count'], 0)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {DOCS_TABLE}')
+                self.assertEqual(cursor.fetchone()[0], 0)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite trigger maintenance')
+    def test_dropped_triggers_are_restored(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER command_search_command_ai')
+        ensure_sqlite_triggers(connection, DOCS_TABLE, sqlite_triggers)
+        self._add('docker system prune')
+        self.assertEqual(self._search('prune')['count'], 1)
+
+    def test_query_uses_the_trigram_index(self):
+        CommandExecution.objects.bulk_create([
+            CommandExecution(user=self.user, command=f'echo {i}', command_type='shell', status='success')
+            for i in range(100)
+        ])
+        self._add('kubectl rollout restart')
+        plan = filter_commands(CommandExecution.objects.all(), 'kubectl').explain()
+        if connection.vendor == 'sqlite':
+            self.assertIn(FTS_TABLE, plan)
+            # Patterns matching most rows are cheaper to scan
+            self.assertNotIn(FTS_TABLE, filter_commands(CommandExecution.objects.all(), 'echo').explain())
+        elif connection.vendor == 'postgresql':
+            self.assertIn('trgm', plan)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite selectivity check')
+    def test_row_count_is_reused_across_searches(self):
+        self._add('kubectl rollout restart')
+        with CaptureQueriesContext(connection) as first:
+            list(filter_commands(CommandExecution.objects.all(), 'kubectl'))
+        with CaptureQueriesContext(connection) as second:
+            list(filter_commands(CommandExecution.objects.all(), 'rollout'))
+        self.assertEqual(len(second), len(first) - 1)
+        self.assertFalse(any(DOCS_TABLE in query['sql'] and 'MATCH' not in query['sql'] for query in second))
+
+
+@override_settings(**TEST_SETTINGS)
+class CommandFingerprintTests(TestCase):
+    """Commands are fingerprinted at ingest and ranked by fingerprint"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='root')
+        UserProfile(user=self.admin, role='admin').save()
+        self.user = User.objects.create(username='agent')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('command_top')
+
+    def _add(self, command, user=None, **fields):
+        fields.setdefault('command_type', 'shell')
+        fields.setdefault('status', 'success')
+        return CommandExecution.objects.create(user=user or self.user, command=command, **fields)
+
+    def _top(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['execution']['results']
+
+    def test_normalization(self):
+        cases = {
+            'kubectl delete pod api-7f9c -n prod': 'kubectl delete pod ? -n ?',
+            'rm -rf /tmp/build-42': 'rm -rf ?',
+            'FOO=1 make test 2>&1 | tee out.log': 'FOO=? make test 2>&1 | tee ?',
+            'git commit -m "fix: quoted; not an operator"': 'git commit -m ?',
+            '/usr/bin/python3 manage.py migrate --fake 0004': 'python3 ? --fake ?',
+            './deploy.sh --env=prod && echo done': 'deploy.sh --env=? && echo done',
+            'cat "unterminated': 'cat ?',
+        }
+        for command, expected in cases.items():
+            self.assertEqual(normalize_command(command), expected, command)
+        self.assertEqual(fingerprint_command('rm -rf /tmp/a'), fingerprint_command('rm  -rf   /var/b c'))
+        self.assertNotEqual(fingerprint_command('rm -rf /tmp/a'), fingerprint_command('rm -r /tmp/a'))
+
+    def test_fingerprint_is_set_at_ingest(self):
+        user_client = APIClient()
+        user_client.force_authenticate(self.user)
+        response = user_client.post(reverse('command_list_create'), {
+            'command': 'pytest tests/test_api.py -k login', 'command_type': 'shell', 'status': 'success'
+        }, format='json')
+        command = CommandExecution.objects.get(pk=response.data['execution']['id'])
+        self.assertEqual(command.fingerprint, fingerprint_command('pytest tests/test_api.py -k login'))
+
+        command.command = 'ls -la'
+        command.save(update_fields=['command'])
+        command.refresh_from_db()
+        self.assertEqual(command.fingerprint, fingerprint_command('ls -la'))
+
+    def test_top_commands_overall(self):
+        for i in range(1, 101):
+            self._add(f'pytest tests/test_{i}.py', execution_time_ms=i, status='failed' if i % 4 == 0 else 'success')
+        for i in range(3):
+            self._add('git status', execution_time_ms=None)
+        self._add('kubectl get pods', user=self.admin)
+
+        results = self._top()
+        self.assertEqual([row['count'] for row in results], [100, 3, 1])
+        pytest_row = results[0]
+        self.assertEqual(pytest_row['pattern'], 'pytest ?')
+        self.assertEqual(pytest_row['failures'], 25)
+        self.assertEqual(pytest_row['failure_rate'], 0.25)
+        self.assertEqual(pytest_row['avg_execution_time_ms'], 50.5)
+        self.assertEqual(
+            [pytest_row['p50_execution_time_ms'], pytest_row['p95_execution_time_ms'], pytest_row['p99_execution_time_ms']],
+            [50, 95, 99]
+        )
+        self.assertIsNone(results[1]['p50_execution_time_ms'])
+        self.assertEqual(len(self._top(limit=2)), 2)
+
+    def test_top_commands_per_user_and_hostname(self):
+        self._add('make build', hostname='ci-1')
+        self._add('make build', hostname='ci-1')
+        self._add('make build', user=self.admin, hostname='ci-2')
+
+        by_user = self._top(by='user')
+        self.assertEqual([(row['username'], row['count']) for row in by_user], [('agent', 2), ('root', 1)])
+        by_host = self._top(by='hostname')
+        self.assertEqual([(row['hostname'], row['count']) for row in by_host], [('ci-1', 2), ('ci-2', 1)])
+        self.assertEqual([row['count'] for row in self._top(hostname='ci-2')], [1])
+        self.assertEqual([row['count'] for row in self._top(user_id=self.user.id)], [2])
+        self.assertEqual(self._top(status='failed'), [])
+
+    def test_top_commands_validation_and_permissions(self):
+        self.assertEqual(self.client.get(self.url, {'by': 'session'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'limit': 0}).status_code, 400)
+        user_client = APIClient()
+        user_client.force_authenticate(self.user)
+        self.assertEqual(user_client.get(self.url).status_code, 403)
+
+    def test_backfill_command(self):
+        commands = [self._add(f'terraform plan -var id={i}') for i in range(5)]
+        CommandExecution.objects.update(fingerprint='')
+        out = StringIO()
+        call_command('fingerprint_commands', batch_size=2, stdout=out)
+        self.assertIn('Fingerprinted 5 commands', out.getvalue())
+        self.assertEqual(
+            set(CommandExecution.objects.values_list('fingerprint', flat=True)),
+            {fingerprint_command(commands[0].command)}
+        )
+        call_command('fingerprint_commands', stdout=out)
+        self.assertIn('Fingerprinted 0 commands', out.getvalue())
+
+
+@override_settings(**TEST_SETTINGS)
+class CommandBulkIngestTests(TestCase):
+    """Batch ingest accepts JSON or NDJSON, optionally gzip-encoded, with per-record results"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('command_bulk_create')
+        self.records = [
+            {'command': f'pytest -k case_{i}', 'command_type': 'shell', 'status': 'success', 'execution_time_ms': 10 + i, 'output': f'ok {i}\n' * 50}
+            for i in range(5)
+        ]
+
+    def _post(self, body, content_type='application/json', encoding=None):
+        extra = {'HTTP_CONTENT_ENCODING': encoding} if encoding else {}
+        return self.client.post(self.url, data=body, content_type=content_type, **extra)
+
+    def _ndjson(self, records):
+        return '\n'.join(json.dumps(record) for record in records).encode() + b'\n\n'
+
+    def test_json_array_and_records_object(self):
+        response = self._post(json.dumps(self.records))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['execution']['created'], 5)
+        response = self._post(json.dumps({'records': self.records[:2]}))
+        self.assertEqual(response.data['execution']['created'], 2)
+        self.assertEqual(CommandExecution.objects.filter(user=self.user).count(), 7)
+
+    def test_gzip_json_and_ndjson(self):
+        response = self._post(gzip.compress(json.dumps(self.records).encode()), encoding='gzip')
+        self.assertEqual((response.status_code, response.data['execution']['created']), (201, 5))
+        response = self._post(gzip.compress(self._ndjson(self.records)), content_type='application/x-ndjson', encoding='gzip')
+        self.assertEqual((response.status_code, response.data['execution']['created']), (201, 5))
+        response = self._post(self._ndjson(self.records[:1]), content_type='application/x-ndjson')
+        self.assertEqual(response.data['execution']['created'], 1)
+
+    def test_rows_are_complete(self):
+        session = Session.objects.create(user=self.user)
+        records = [dict(self.records[0], session_id=str(session.id), hostname='ci-1')]
+        response = self._post(json.dumps(records))
+        command = CommandExecution.objects.get(pk=response.data['execution']['results'][0]['id'])
+        self.assertEqual(command.session_id, session.id)
+        self.assertEqual(command.fingerprint, fingerprint_command(records[0]['command']))
+        self.assertEqual(command.read_output().decode(), records[0]['output'])
+        self.assertEqual(DailyCommandLatency.objects.get().hostname, 'ci-1')
+        self.assertEqual(self.client.get(reverse('command_search'), {'q': 'case_0'}).data['execution']['count'], 1)
+
+    def test_per_record_results(self):
+        other_session = Session.objects.create(user=User.objects.create(username='other'))
+        records = [
+            self.records[0],
+            {'command': 'ls', 'command_type': 'nope', 'status': 'success'},
+            dict(self.records[1], session_id=str(other_session.id)),
+        ]
+        response = self._post(json.dumps(records))
+        self.assertEqual(response.status_code, 201)
+        results = response.data['execution']['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'rejected', 'created'])
+        self.assertIn('command_type', results[1]['errors'])
+        # Sessions of other users are ignored, as in the single endpoint
+        self.assertIsNone(CommandExecution.objects.get(pk=results[2]['id']).session_id)
+
+        response = self._post(json.dumps(records[1:2]))
+        self.assertEqual((response.status_code, response.data['execution']['created']), (400, 0))
+
+    def test_sessions_resolved_in_one_query(self):
+        sessions = [Session.objects.create(user=self.user) for _ in range(3)]
+
+        def count_queries(size):
+            records = [dict(self.records[0], session_id=str(sessions[i % 3].id)) for i in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self._post(json.dumps(records)).status_code, 201)
+            return len(ctx.captured_queries)
+
+        # The first batch creates the day's rollup rows; later ones only update them
+        count_queries(1)
+        self.assertEqual(count_queries(3), count_queries(30))
+
+    def test_bad_bodies(self):
+        self.assertEqual(self._post(b'not gzip', encoding='gzip').status_code, 400)
+        self.assertEqual(self._post(json.dumps(self.records).encode(), encoding='br').status_code, 415)
+        self.assertEqual(self._post(b'{"command": "ls"}\n{oops', content_type='application/x-ndjson').status_code, 400)
+        self.assertEqual(self._post(json.dumps([])).status_code, 400)
+        self.assertEqual(self._post(json.dumps({'command': 'ls'})).status_code, 400)
+
+    def test_body_larger_than_django_upload_limit(self):
+        # Bodies are streamed, so DATA_UPLOAD_MAX_MEMORY_SIZE (2.5 MB) does not apply
+        records = [dict(self.records[0], output='x' * (3 * 1024 * 1024))]
+        response = self._post(json.dumps(records))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CommandExecution.objects.get().output_size, 3 * 1024 * 1024)
+
+    @override_settings(INGEST_MAX_DECOMPRESSED_BYTES=64 * 1024)
+    def test_decompressed_size_is_capped(self):
+        bomb = gzip.compress(json.dumps([dict(self.records[0], output='x' * (1024 * 1024))]).encode())
+        self.assertLess(len(bomb), 64 * 1024)
+        response = self._post(bomb, encoding='gzip')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(CommandExecution.objects.exists())
+
+
+def exact_percentile(values, percentile):
+    """Nearest-rank percentile, the definition the latency histograms estimate"""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(len(ordered) * percentile / 100)) - 1]
+
+
+@override_settings(**TEST_SETTINGS)
+class CommandLatencyTests(TestCase):
+    """Daily latency histograms are kept on ingest and merge into bounded-error percentiles"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='root')
+        UserProfile(user=self.admin, role='admin').save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('command_latency')
+
+    def _bulk(self, times, **fields):
+        fields.setdefault('command_type', 'shell')
+        fields.setdefault('status', 'success')
+        commands = CommandExecution.objects.bulk_create([
+            CommandExecution(user=self.admin, command='make', execution_time_ms=value, **fields) for value in times
+        ])
+        DailyCommandLatency.record(commands)
+        return commands
+
+    def _latency(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['execution']
+
+    def assertWithinBound(self, estimate, exact):
+        # Relative error of the histogram plus the rounding of the response
+        self.assertLessEqual(abs(estimate - exact), RELATIVE_ACCURACY * exact + 0.005, (estimate, exact))
+
+    def test_buckets_bound_relative_error(self):
+        for value in [1, 2, 3, 10, 99, 100, 101, 1234, 59999, 86400000]:
+            self.assertLessEqual(abs(bucket_value(bucket_index(value)) - value), RELATIVE_ACCURACY * value)
+        self.assertEqual(bucket_index(0), 0)
+        self.assertEqual(bucket_index(-5), 0)
+        self.assertLess(bucket_index(86400000), 1000)
+        self.assertEqual(quantiles({}, [50]), {50: None})
+
+    def test_merged_percentiles_match_exact_results(self):
+        rng = random.Random(11)
+        shell_a = [int(rng.lognormvariate(5, 1.2)) for _ in range(700)]
+        shell_b = [int(rng.lognormvariate(7, 0.5)) for _ in range(300)]
+        edits = [rng.randint(0, 20) for _ in range(200)]
+        self._bulk(shell_a, hostname='a')
+        self._bulk(shell_b, hostname='b')
+        self._bulk(edits, command_type='file_edit', hostname='a')
+
+        for params, values in [
+            ({}, shell_a + shell_b + edits),
+            ({'command_type': 'shell'}, shell_a + shell_b),
+            ({'hostname': 'a'}, shell_a + edits),
+            ({'command_type': 'shell', 'hostname': 'b'}, shell_b),
+            ({'command_type': 'file_edit'}, edits),
+        ]:
+            data = self._latency(**params)
+            self.assertEqual(data['count'], len(values))
+            for percentile in [50, 90, 99]:
+                self.assertWithinBound(data[f'p{percentile}_execution_time_ms'], exact_percentile(values, percentile))
+
+    def test_date_filter_and_empty_result(self):
+        old = self._bulk([1000] * 10)
+        CommandExecution.objects.filter(pk__in=[command.pk for command in old]).update(created_at=timezone.now() - timedelta(days=3))
+        DailyCommandLatency.objects.all().delete()
+        DailyCommandLatency.record(CommandExecution.objects.all())
+        self._bulk([10] * 10)
+
+        today = timezone.localdate().isoformat()
+        self.assertWithinBound(self._latency(date_from=today)['p99_execution_time_ms'], 10)
+        self.assertWithinBound(self._latency(date_to=(timezone.localdate() - timedelta(days=1)).isoformat())['p50_execution_time_ms'], 1000)
+        data = self._latency(hostname='nowhere')
+        self.assertEqual((data['count'], data['p50_execution_time_ms']), (0, None))
+
+    def test_ingest_updates_histograms(self):
+        for value in [5, 5, 500, None]:
+            response = self.client.post(reverse('command_list_create'), {
+                'command': 'ls', 'command_type': 'shell', 'status': 'success', 'hostname': 'dev', 'execution_time_ms': value
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(sum(DailyCommandLatency.objects.values_list('count', flat=True)), 3)
+        self.assertEqual(DailyCommandLatency.objects.count(), 2)
+        data = self._latency(hostname='dev')
+        self.assertWithinBound(data['p50_execution_time_ms'], 5)
+        self.assertWithinBound(data['p99_execution_time_ms'], 500)
+
+    def test_record_without_upsert_support(self):
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            self._bulk([7, 7, 700])
+            self._bulk([7])
+        self.assertEqual(sorted(DailyCommandLatency.objects.values_list('count', flat=True)), [1, 3])
+
+    def test_rebuild_command(self):
+        self._bulk([3, 30, 300])
+        DailyCommandLatency.objects.update(count=99)
+        today = timezone.localdate().isoformat()
+        out = StringIO()
+        call_command('rebuild_command_latency', date_from=today, date_to=today, stdout=out)
+        self.assertIn('Rebuilt 3 histogram buckets (replaced 3)', out.getvalue())
+        self.assertEqual(self._latency()['count'], 3)
+
+    def test_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='agent'))
+        self.assertEqual(client.get(self.url).status_code, 403)
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS)
+class CommandSearchBenchmark(TestCase):
+    """Indexed substring search vs a LIKE scan (ZAPFIX_COMMAND_CORPUS commands, default 10M)"""
+
+    def test_search_latency(self):
+        corpus = int(os.environ.get('ZAPFIX_COMMAND_CORPUS', 10000000))
+        users = [User.objects.create(username=f'bench{i}') for i in range(50)]
+        admin = users[0]
+        UserProfile(user=admin, role='admin').save()
+        verbs = ['ls', 'cat', 'git status', 'git diff', 'make', 'npm test', 'pytest', 'docker ps', 'kubectl get pods']
+        rng = random.Random(7)
+        batch = 10000
+        started = time.perf_counter()
+        for start in range(0, corpus, batch):
+            CommandExecution.objects.bulk_create([
+                CommandExecution(
+                    user=rng.choice(users), command_type='shell', status='success',
+                    command=f'{rng.choice(verbs)} /srv/app/{rng.getrandbits(40):x}/src'
+                )
+                for _ in range(start, min(start + batch, corpus))
+            ])
+        CommandExecution.objects.bulk_create([
+            CommandExecution(user=users[1], command_type='shell', status='failed', command='rm -rf /srv/app/cache'),
+            CommandExecution(user=users[2], command_type='shell', status='failed', command='kubectl delete ns staging'),
+        ])
+        # Planner statistics, as a periodic ANALYZE / PRAGMA optimize would keep them
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        print(f'\nloaded {corpus:,} commands in {time.perf_counter() - started:.0f} s')
+
+        client = APIClient()
+        client.force_authenticate(admin)
+        params = {'page_size': 20}
+        for q, match in [('rm -rf', 'contains'), ('kubectl delete', 'prefix'), ('kubectl get', 'contains')]:
+            started = time.perf_counter()
+            for _ in range(10):
+                response = client.get(reverse('command_search'), {'q': q, 'match': match, **params})
+            indexed = (time.perf_counter() - started) / 10
+            # The same request as a LIKE scan
+            with mock.patch('CommandExecution.search.MIN_INDEXED_LENGTH', len(q) + 1):
+                started = time.perf_counter()
+                scanned = client.get(reverse('command_search'), {'q': q, 'match': match, **params})
+                scan = time.perf_counter() - started
+            self.assertEqual(scanned.data['execution']['count'], response.data['execution']['count'])
+            print(
+                f'{q!r} ({match}): index {indexed * 1000:.1f} ms, LIKE scan {scan * 1000:.1f} ms '
+                f'({response.data["execution"]["count"]:,} hits)'
+            )
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS)
+class CommandBulkIngestBenchmark(TestCase):
+    """Rows/sec of the batch endpoint vs one POST per command"""
+
+    def test_ingest_throughput(self):
+        user = User.objects.create(username='bench')
+        sessions = [Session.objects.create(user=user) for _ in range(10)]
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = random.Random(3)
+        records = [
+            {
+                'command': f'make test TARGET={rng.getrandbits(32):x}', 'command_type': 'shell', 'status': 'success',
+                'session_id': str(sessions[i % 10].id), 'execution_time_ms': rng.randint(1, 5000),
+                'output': ''.join(f'test_{j} ... ok\n' for j in range(rng.randint(0, 200))),
+            }
+            for i in range(2000)
+        ]
+
+        started = time.perf_counter()
+        for record in records[:500]:
+            client.post(reverse('command_list_create'), record, format='json')
+        single = 500 / (time.perf_counter() - started)
+        print(f'\nsingle POST: {single:,.0f} rows/s')
+
+        body = json.dumps(records).encode()
+        ndjson = '\n'.join(json.dumps(record) for record in records).encode()
+        for label, data, content_type, encoding in [
+            ('bulk JSON', body, 'application/json', None),
+            ('bulk JSON gzip', gzip.compress(body), 'application/json', 'gzip'),
+            ('bulk NDJSON gzip', gzip.compress(ndjson), 'application/x-ndjson', 'gzip'),
+        ]:
+            extra = {'HTTP_CONTENT_ENCODING': encoding} if encoding else {}
+            started = time.perf_counter()
+            response = client.post(reverse('command_bulk_create'), data=data, content_type=content_type, **extra)
+            elapsed = time.perf_counter() - started
+            self.assertEqual(response.data['execution']['created'], len(records))
+            print(f'{label}: {len(records) / elapsed:,.0f} rows/s ({len(records) / elapsed / single:.1f}x), body {len(data) / 1024:,.0f} KiB')
@@ -3,5 +3,10 @@ from . import views
 
 urlpatterns = [
     path('', views.command_list_create, name='command_list_create'),  # GET: List, POST: Create
+    path('bulk/', views.command_bulk_create, name='command_bulk_create'),  # POST: Batch ingest (JSON/NDJSON, gzip)
+    path('search/', views.command_search, name='command_search'),  # GET: Substring/prefix search
+    path('top/', views.command_top, name='command_top'),  # GET: Top command fingerprints (Admin only)
+    path('latency/', views.command_latency, name='command_latency'),  # GET: Execution time percentiles (Admin only)
+    path('<uuid:command_id>/', views.command_detail, name='command_detail'),  # GET: Detail with output tail/range
 ]
 
@@ -1,19 +1,31 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.pagination import PageNumberPagination
-from django.utils.dateparse import parse_date
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Avg, Count, F, Min, Q, Sum, Window
+from django.db.models.functions import Ceil, RowNumber
+from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from .models import CommandExecution
+from .models import CommandExecution, CommandOutputChunk, DailyCommandLatency
+from .fingerprint import fingerprint_command, normalize_command
+from .latency import RELATIVE_ACCURACY, quantiles
+from .search import filter_commands
 from .serializers import (
     CommandExecutionCreateSerializer,
     CommandExecutionListSerializer,
     CommandExecutionDetailSerializer
 )
-from users.views import is_admin
+from users.views import is_admin, AdminPermission
+from zapfix_backend.filters import DateRangeFilter
+from zapfix_backend.parsers import DecompressingJSONParser, NDJSONParser
+from Activitylogs.models import DailyUserActivity
+from Activitylogs.audit import log_activity
 
 
 class CommandPagination(PageNumberPagination):
@@ -23,17 +35,59 @@ class CommandPagination(PageNumberPagination):
     max_page_size = 100
 
 
+LIST_FILTER_PARAMETERS = [
+    openapi.Parameter('user_id', openapi.IN_QUERY, description='Filter by user ID (Admin only)', type=openapi.TYPE_INTEGER),
+    openapi.Parameter('command_type', openapi.IN_QUERY, description='Filter by command type', type=openapi.TYPE_STRING, enum=['shell', 'file_read', 'file_write', 'file_edit', 'other']),
+    openapi.Parameter('status', openapi.IN_QUERY, description='Filter by status', type=openapi.TYPE_STRING, enum=['success', 'failed', 'error']),
+    openapi.Parameter('date_from', openapi.IN_QUERY, description='Start date (YYYY-MM-DD)', type=openapi.TYPE_STRING),
+    openapi.Parameter('date_to', openapi.IN_QUERY, description='End date (YYYY-MM-DD)', type=openapi.TYPE_STRING),
+    openapi.Parameter('tz', openapi.IN_QUERY, description='IANA timezone the dates are interpreted in (default UTC)', type=openapi.TYPE_STRING),
+    openapi.Parameter('page', openapi.IN_QUERY, description='Page number', type=openapi.TYPE_INTEGER),
+    openapi.Parameter('page_size', openapi.IN_QUERY, description='Items per page', type=openapi.TYPE_INTEGER),
+]
+
+
+def _filtered_commands(request):
+    """Commands visible to the user, narrowed by the list query filters"""
+    # Get command executions based on user role
+    if is_admin(request.user):
+        # Admin can see all commands, optionally filtered by user_id
+        commands = CommandExecution.objects.select_related('user')
+        
+        # Filter by user_id if provided (admin only)
+        user_id = request.GET.get('user_id')
+        if user_id:
+            try:
+                commands = commands.filter(user_id=int(user_id))
+            except (ValueError, TypeError):
+                pass
+    else:
+        # Regular users see only their own commands
+        commands = CommandExecution.objects.select_related('user').filter(user=request.user)
+    
+    # Filter by command_type
+    command_type = request.GET.get('command_type')
+    if command_type in ['shell', 'file_read', 'file_write', 'file_edit', 'other']:
+        commands = commands.filter(command_type=command_type)
+    
+    # Filter by status
+    status_filter = request.GET.get('status')
+    if status_filter in ['success', 'failed', 'error']:
+        commands = commands.filter(status=status_filter)
+    
+    # Filter by date range
+    commands = DateRangeFilter.from_request(request).filter(commands)
+    
+    # Load only the listed columns
+    return commands.only(
+        'id', 'user__id', 'user__username', 'session', 'command',
+        'command_type', 'status', 'execution_time_ms', 'created_at'
+    )
+
+
 @swagger_auto_schema(
     method='get',
-    manual_parameters=[
-        openapi.Parameter('user_id', openapi.IN_QUERY, description='Filter by user ID (Admin only)', type=openapi.TYPE_INTEGER),
-        openapi.Parameter('command_type', openapi.IN_QUERY, description='Filter by command type', type=openapi.TYPE_STRING, enum=['shell', 'file_read', 'file_write', 'file_edit', 'other']),
-        openapi.Parameter('status', openapi.IN_QUERY, description='Filter by status', type=openapi.TYPE_STRING, enum=['success', 'failed', 'error']),
-        openapi.Parameter('date_from', openapi.IN_QUERY, description='Start date (YYYY-MM-DD)', type=openapi.TYPE_STRING),
-        openapi.Parameter('date_to', openapi.IN_QUERY, description='End date (YYYY-MM-DD)', type=openapi.TYPE_STRING),
-        openapi.Parameter('page', openapi.IN_QUERY, description='Page number', type=openapi.TYPE_INTEGER),
-        openapi.Parameter('page_size', openapi.IN_QUERY, description='Items per page', type=openapi.TYPE_INTEGER),
-    ],
+    manual_parameters=LIST_FILTER_PARAMETERS,
     responses={200: openapi.Response('List of command executions', CommandExecutionListSerializer)},
     tags=['Commands'],
     security=[{'Bearer': []}]
@@ -53,51 +107,8 @@ class CommandPagination(PageNumberPagination):
 def command_list_create(request):
     """List command executions (GET) or Create new command execution (POST)"""
     if request.method == 'GET':
-        # Get command executions based on user role
-        if is_admin(request.user):
-            # Admin can see all commands, optionally filtered by user_id
-            commands = CommandExecution.objects.all()
-            
-            # Filter by user_id if provided (admin only)
-            user_id = request.GET.get('user_id')
-            if user_id:
-                try:
-                    commands = commands.filter(user_id=int(user_id))
-                except (ValueError, TypeError):
-                    pass
-        else:
-            # Regular users see only their own commands
-            commands = CommandExecution.objects.filter(user=request.user)
-        
-        # Filter by command_type
-        command_type = request.GET.get('command_type')
-        if command_type in ['shell', 'file_read', 'file_write', 'file_edit', 'other']:
-            commands = commands.filter(command_type=command_type)
-        
-        # Filter by status
-        status_filter = request.GET.get('status')
-        if status_filter in ['success', 'failed', 'error']:
-            commands = commands.filter(status=status_filter)
-        
-        # Filter by date range
-        date_from = request.GET.get('date_from')
-        date_to = request.GET.get('date_to')
-        
-        if date_from:
-            try:
-                date_from_parsed = parse_date(date_from)
-                if date_from_parsed:
-                    commands = commands.filter(created_at__date__gte=date_from_parsed)
-            except (ValueError, TypeError):
-                pass
-        
-        if date_to:
-            try:
-                date_to_parsed = parse_date(date_to)
-                if date_to_parsed:
-                    commands = commands.filter(created_at__date__lte=date_to_parsed)
-            except (ValueError, TypeError):
-                pass
+        # Get command executions based on user role and query filters
+        commands = _filtered_commands(request)
         
         # Pagination
         paginator = CommandPagination()
@@ -124,7 +135,10 @@ def command_list_create(request):
         # Create new command execution
         serializer = CommandExecutionCreateSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            command = serializer.save()
+            with transaction.atomic():
+                command = serializer.save()
+                DailyUserActivity.record(request.user.id, at=command.created_at, commands=1)
+            log_activity(request, 'command_executed', metadata={'command_id': str(command.id), 'command_type': command.command_type, 'status': command.status})
             # Return simplified response as per API spec
             return Response({
                 'chat': 'Command execution logged successfully',
@@ -151,3 +165,420 @@ def command_list_create(request):
             ],
             'execution': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
+
+
+COMMANDS_BULK_MAX_RECORDS = 5000
+COMMANDS_BULK_CHUNK_SIZE = 500
+
+
+@swagger_auto_schema(
+    method='post',
+    manual_parameters=[
+        openapi.Parameter('Content-Encoding', openapi.IN_HEADER, description='gzip to send a compressed body', type=openapi.TYPE_STRING, enum=['gzip', 'identity']),
+    ],
+    request_body=openapi.Schema(
+        type=openapi.TYPE_ARRAY,
+        items=openapi.Schema(type=openapi.TYPE_OBJECT),
+        description=(
+            f'Up to {COMMANDS_BULK_MAX_RECORDS} command executions, same fields as POST /api/commands/, '
+            'as a JSON array, {"records": [...]}, or NDJSON (Content-Type: application/x-ndjson)'
+        )
+    ),
+    responses={
+        201: openapi.Response('At least one command was logged; per-record results'),
+        400: openapi.Response('Bad request - no command was logged'),
+        413: openapi.Response('Body too large once decompressed')
+    },
+    tags=['Commands'],
+    security=[{'Bearer': []}]
+)
+@api_view(['POST'])
+@parser_classes([DecompressingJSONParser, NDJSONParser])
+@permission_classes([IsAuthenticated])
+def command_bulk_create(request):
+    """Log a batch of command executions (e.g. replayed by an agent that was offline)"""
+    records = request.data.get('records') if isinstance(request.data, dict) else request.data
+    if not isinstance(records, list) or not records:
+        return Response({
+            'chat': 'Bulk command logging failed - no records',
+            'plan': ['Authenticate user', 'Parse records', 'Return validation errors'],
+            'execution': {'error': 'records must be a non-empty list'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if len(records) > COMMANDS_BULK_MAX_RECORDS:
+        return Response({
+            'chat': 'Bulk command logging failed - too many records',
+            'plan': ['Authenticate user', 'Parse records', 'Return validation errors'],
+            'execution': {'error': f'At most {COMMANDS_BULK_MAX_RECORDS} records can be sent at once'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Validate every record with one instance of the single-record serializer,
+    # so its fields are built once rather than per record
+    results = []
+    valid = []
+    validator = CommandExecutionCreateSerializer(context={'request': request})
+    for index, record in enumerate(records):
+        try:
+            valid.append((index, validator.run_validation(record)))
+        except ValidationError as exc:
+            results.append({'index': index, 'status': 'rejected', 'errors': exc.detail})
+    
+    # Resolve all referenced sessions with one query; unknown IDs are ignored as in POST /api/commands/
+    sessions = CommandExecutionCreateSerializer.resolve_sessions(request.user, [data.get('session_id') for _, data in valid])
+    
+    commands = []
+    chunks = []
+    for index, data in valid:
+        data = dict(data)
+        session_id = data.pop('session_id', None)
+        output = data.pop('output', '').encode('utf-8')
+        command = CommandExecution(
+            user=request.user,
+            session=sessions.get(session_id),
+            output_size=len(output),
+            # bulk_create skips CommandExecution.save(), which fingerprints the command
+            fingerprint=fingerprint_command(data['command']),
+            **data
+        )
+        commands.append((index, command))
+        chunks.extend(CommandOutputChunk.split(command, output))
+    
+    if commands:
+        with transaction.atomic():
+            CommandExecution.objects.bulk_create([command for _, command in commands], batch_size=COMMANDS_BULK_CHUNK_SIZE)
+            CommandOutputChunk.objects.bulk_create(chunks, batch_size=COMMANDS_BULK_CHUNK_SIZE)
+            DailyCommandLatency.record(command for _, command in commands)
+            DailyUserActivity.record(request.user.id, at=commands[0][1].created_at, commands=len(commands))
+        log_activity(request, 'command_executed', metadata={'records': len(commands)})
+    
+    for index, command in commands:
+        results.append({
+            'index': index,
+            'status': 'created',
+            'id': str(command.id),
+            'created_at': command.created_at.isoformat()
+        })
+    results.sort(key=lambda result: result['index'])
+    
+    return Response({
+        'chat': 'Command executions logged' if commands else 'Bulk command logging failed - validation errors',
+        'plan': [
+            'Authenticate user',
+            'Decompress and parse records',
+            'Validate each record',
+            'Resolve sessions in one query',
+            'Insert commands and output in chunks',
+            'Return per-record results'
+        ],
+        'execution': {
+            'created': len(commands),
+            'rejected': len(records) - len(commands),
+            'results': results
+        }
+    }, status=status.HTTP_201_CREATED if commands else status.HTTP_400_BAD_REQUEST)
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, description='Text the command contains (case-insensitive)', type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('match', openapi.IN_QUERY, description='contains (default) or prefix', type=openapi.TYPE_STRING, enum=['contains', 'prefix']),
+    ] + LIST_FILTER_PARAMETERS,
+    responses={
+        200: openapi.Response('Matching command executions, newest first', CommandExecutionListSerializer),
+        400: openapi.Response('Bad request - missing query')
+    },
+    tags=['Commands'],
+    security=[{'Bearer': []}]
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def command_search(request):
+    """Search command executions by substring or prefix (admins: all users, users: their own)"""
+    query = request.GET.get('q', '').strip()
+    match = request.GET.get('match', 'contains')
+    if not query or match not in ('contains', 'prefix'):
+        return Response({
+            'chat': 'Command search failed - invalid query',
+            'plan': ['Authenticate user', 'Validate search query', 'Return validation errors'],
+            'execution': {'error': 'q is required and match must be "contains" or "prefix"'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Narrow through the trigram index, then apply the usual list filters
+    commands = filter_commands(_filtered_commands(request), query, prefix=match == 'prefix')
+    
+    # Pagination
+    paginator = CommandPagination()
+    paginated_commands = paginator.paginate_queryset(commands, request)
+    
+    serializer = CommandExecutionListSerializer(paginated_commands, many=True)
+    
+    return Response({
+        'chat': 'Command search completed successfully',
+        'plan': [
+            'Authenticate user',
+            'Filter commands based on user role',
+            'Match the query against the command index',
+            'Apply query filters',
+            'Paginate results',
+            'Return matching commands'
+        ],
+        'execution': {
+            'count': paginator.page.paginator.count,
+            'results': serializer.data
+        }
+    })
+
+
+TOP_COMMANDS_LIMIT = 10
+TOP_COMMANDS_MAX_LIMIT = 100
+TOP_COMMANDS_GROUPS = {
+    'command': [],
+    'user': ['user_id'],
+    'hostname': ['hostname'],
+}
+EXECUTION_TIME_PERCENTILES = [50, 95, 99]
+
+
+def _execution_time_percentiles(commands, keys, fingerprints):
+    """
+    Nearest-rank execution_time_ms percentiles per group of `keys`, for the given fingerprints.
+    
+    Each percentile is one query that numbers the group's timed rows with a
+    window function and keeps the row at rank ceil(p% of n), so only the
+    percentile values leave the database.
+    """
+    partition = [F(key) for key in keys]
+    timed = commands.filter(fingerprint__in=fingerprints, execution_time_ms__isnull=False).annotate(
+        position=Window(RowNumber(), partition_by=partition, order_by=F('execution_time_ms').asc()),
+        timed_count=Window(Count('pk'), partition_by=partition)
+    )
+    percentiles = {}
+    for percentile in EXECUTION_TIME_PERCENTILES:
+        rows = timed.filter(position=Ceil(F('timed_count') * percentile / 100.0)).values_list(*keys, 'execution_time_ms')
+        for *group, value in rows:
+            percentiles.setdefault(tuple(group), {})[f'p{percentile}'] = value
+    return percentiles
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('by', openapi.IN_QUERY, description='Rank commands overall (default) or per user / hostname', type=openapi.TYPE_STRING, enum=list(TOP_COMMANDS_GROUPS)),
+        openapi.Parameter('limit', openapi.IN_QUERY, description=f'Number of groups (default {TOP_COMMANDS_LIMIT}, max {TOP_COMMANDS_MAX_LIMIT})', type=openapi.TYPE_INTEGER),
+        openapi.Parameter('hostname', openapi.IN_QUERY, description='Filter by hostname', type=openapi.TYPE_STRING),
+    ] + [parameter for parameter in LIST_FILTER_PARAMETERS if parameter.name not in ('page', 'page_size')],
+    responses={
+        200: openapi.Response('Most frequent command fingerprints with failure rate and execution time statistics'),
+        400: openapi.Response('Bad request - invalid grouping or limit'),
+        403: openapi.Response('Forbidden - Admin access required')
+    },
+    tags=['Commands'],
+    security=[{'Bearer': []}]
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, AdminPermission])
+def command_top(request):
+    """Top-N command fingerprints overall, per user or per hostname (Admin only)"""
+    by = request.GET.get('by', 'command')
+    try:
+        limit = int(request.GET.get('limit') or TOP_COMMANDS_LIMIT)
+    except (ValueError, TypeError):
+        limit = 0
+    if by not in TOP_COMMANDS_GROUPS or not 0 < limit <= TOP_COMMANDS_MAX_LIMIT:
+        return Response({
+            'chat': 'Top commands failed - invalid parameters',
+            'plan': ['Authenticate user', 'Validate parameters', 'Return validation errors'],
+            'execution': {'error': f'by must be one of {", ".join(TOP_COMMANDS_GROUPS)} and limit between 1 and {TOP_COMMANDS_MAX_LIMIT}'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Same filters as the command list
+    commands = _filtered_commands(request).order_by()
+    hostname = request.GET.get('hostname')
+    if hostname:
+        commands = commands.filter(hostname=hostname)
+    
+    # Group on the short indexed fingerprint, never on command text
+    keys = ['fingerprint'] + TOP_COMMANDS_GROUPS[by]
+    groups = list(commands.values(*keys).annotate(
+        count=Count('pk'),
+        failures=Count('pk', filter=Q(status__in=['failed', 'error'])),
+        avg_execution_time_ms=Avg('execution_time_ms')
+    ).order_by('-count', *keys)[:limit])
+    
+    # One sample command per fingerprint shows what it stands for
+    fingerprints = {group['fingerprint'] for group in groups}
+    examples = dict(
+        commands.filter(fingerprint__in=fingerprints).values('fingerprint').annotate(example=Min('command')).values_list('fingerprint', 'example')
+    )
+    percentiles = _execution_time_percentiles(commands, keys, fingerprints) if groups else {}
+    usernames = dict(User.objects.filter(pk__in={group['user_id'] for group in groups}).values_list('id', 'username')) if by == 'user' else {}
+    
+    results = []
+    for group in groups:
+        row = {
+            'fingerprint': group['fingerprint'],
+            'pattern': normalize_command(examples.get(group['fingerprint'], '')),
+        }
+        if by == 'user':
+            row['user_id'] = group['user_id']
+            row['username'] = usernames.get(group['user_id'])
+        elif by == 'hostname':
+            row['hostname'] = group['hostname']
+        timings = percentiles.get(tuple(group[key] for key in keys), {})
+        row.update({
+            'count': group['count'],
+            'failures': group['failures'],
+            'failure_rate': round(group['failures'] / group['count'], 4),
+            'avg_execution_time_ms': round(group['avg_execution_time_ms'], 2) if group['avg_execution_time_ms'] is not None else None,
+            **{f'p{percentile}_execution_time_ms': timings.get(f'p{percentile}') for percentile in EXECUTION_TIME_PERCENTILES},
+        })
+        results.append(row)
+    
+    return Response({
+        'chat': 'Top commands retrieved successfully',
+        'plan': [
+            'Authenticate admin',
+            'Apply query filters',
+            'Group commands by fingerprint',
+            'Compute failure rate and execution time percentiles',
+            'Return top commands'
+        ],
+        'execution': {
+            'by': by,
+            'results': results
+        }
+    })
+
+
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('command_type', openapi.IN_QUERY, description='Filter by command type', type=openapi.TYPE_STRING, enum=['shell', 'file_read', 'file_write', 'file_edit', 'other']),
+        openapi.Parameter('hostname', openapi.IN_QUERY, description='Filter by hostname', type=openapi.TYPE_STRING),
+        openapi.Parameter('date_from', openapi.IN_QUERY, description='Start date (YYYY-MM-DD)', type=openapi.TYPE_STRING),
+        openapi.Parameter('date_to', openapi.IN_QUERY, description='End date (YYYY-MM-DD)', type=openapi.TYPE_STRING),
+    ],
+    responses={
+        200: openapi.Response('Execution time percentiles merged from the daily histograms'),
+        403: openapi.Response('Forbidden - Admin access required')
+    },
+    tags=['Commands'],
+    security=[{'Bearer': []}]
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, AdminPermission])
+def command_latency(request):
+    """Execution time p50/p90/p99 for any command type, hostname and date range (Admin only)"""
+    histograms = DailyCommandLatency.objects.all()
+    
+    # Filter by command_type
+    command_type = request.GET.get('command_type')
+    if command_type in ['shell', 'file_read', 'file_write', 'file_edit', 'other']:
+        histograms = histograms.filter(command_type=command_type)
+    
+    # Filter by hostname
+    hostname = request.GET.get('hostname')
+    if hostname is not None:
+        histograms = histograms.filter(hostname=hostname)
+    
+    # Filter by date range (days are the server's local dates, as in the rollups)
+    histograms = DateRangeFilter.from_request(request).filter_days(histograms)
+    
+    # Merge the selected histograms: at most one row per bucket
+    counts = dict(histograms.values('bucket').annotate(total=Sum('count')).order_by().values_list('bucket', 'total'))
+    estimates = quantiles(counts, LATENCY_PERCENTILES)
+    
+    return Response({
+        'chat': 'Command latency percentiles retrieved successfully',
+        'plan': [
+            'Authenticate admin',
+            'Apply query filters',
+            'Merge daily latency histograms',
+            'Estimate percentiles',
+            'Return latency percentiles'
+        ],
+        'execution': {
+            'count': sum(counts.values()),
+            'relative_error': RELATIVE_ACCURACY,
+            **{
+                f'p{percentile}_execution_time_ms': round(value, 2) if value is not None else None
+                for percentile, value in estimates.items()
+            },
+        }
+    })
+
+
+COMMAND_OUTPUT_MAX_BYTES = 1024 * 1024
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('tail', openapi.IN_QUERY, description='Return only the last N lines of output', type=openapi.TYPE_INTEGER),
+        openapi.Parameter('offset', openapi.IN_QUERY, description='Start of a byte range of output (default 0)', type=openapi.TYPE_INTEGER),
+        openapi.Parameter('length', openapi.IN_QUERY, description=f'Length of the byte range (at most {COMMAND_OUTPUT_MAX_BYTES})', type=openapi.TYPE_INTEGER),
+    ],
+    responses={
+        200: openapi.Response('Command execution with the requested part of its output', CommandExecutionDetailSerializer),
+        404: openapi.Response('Not found')
+    },
+    tags=['Commands'],
+    security=[{'Bearer': []}]
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def command_detail(request, command_id):
+    """Get a command execution with its output, the last N lines of it, or a byte range"""
+    commands = CommandExecution.objects.select_related('user')
+    if not is_admin(request.user):
+        commands = commands.filter(user=request.user)
+    command = get_object_or_404(commands, pk=command_id)
+    
+    try:
+        tail = int(request.GET['tail']) if request.GET.get('tail') else None
+        offset = int(request.GET.get('offset') or 0)
+        length = int(request.GET['length']) if request.GET.get('length') else COMMAND_OUTPUT_MAX_BYTES
+    except (ValueError, TypeError):
+        return Response({
+            'chat': 'Invalid output range',
+            'plan': ['Authenticate user', 'Validate output range', 'Return validation errors'],
+            'execution': {'error': 'tail, offset and length must be integers'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if (tail is not None and tail < 0) or offset < 0 or length < 0:
+        return Response({
+            'chat': 'Invalid output range',
+            'plan': ['Authenticate user', 'Validate output range', 'Return validation errors'],
+            'execution': {'error': 'tail, offset and length must not be negative'}
+        }, status=status.HTTP_400_BAD_REQUEST)
+    length = min(length, COMMAND_OUTPUT_MAX_BYTES)
+    
+    # Read only the chunks covering the requested part
+    if tail is not None:
+        output, start = command.tail_output(tail)
+        if len(output) > length:
+            output = output[-length:]
+            start = command.output_size - length
+    else:
+        output = command.read_output(offset, offset + length)
+        start = min(offset, command.output_size)
+    
+    data = CommandExecutionDetailSerializer(command).data
+    data['output'] = output.decode('utf-8', errors='replace')
+    data['output_range'] = {
+        'start': start,
+        'end': start + len(output),
+        'size': command.output_size,
+    }
+    return Response({
+        'chat': 'Command execution retrieved successfully',
+        'plan': [
+            'Authenticate user',
+            'Check access to the command',
+            'Read the requested output chunks',
+            'Return command data'
+        ],
+        'execution': data
+    })
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class TokenusageConfig(AppConfig):
     name = 'Tokenusage'
+
+    def ready(self):
+        # Edits and deletes keep the hourly cube in step with token_usage
+        from . import signals  # noqa: F401
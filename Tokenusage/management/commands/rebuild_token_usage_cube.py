@@ -0,0 +1,52 @@
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+from django.utils.dateparse import parse_date
+
+from Tokenusage.models import TokenUsage, HourlyTokenUsage
+from zapfix_backend.filters import DateRangeFilter
+
+
+class Command(BaseCommand):
+    help = "Rebuild the hourly token usage cube from raw token_usage rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', help='First UTC day to rebuild (YYYY-MM-DD); default is the oldest row')
+        parser.add_argument('--date-to', help='Last UTC day to rebuild, inclusive (YYYY-MM-DD); default is the newest row')
+
+    def handle(self, *args, **options):
+        date_from = parse_date(options['date_from']) if options['date_from'] else None
+        date_to = parse_date(options['date_to']) if options['date_to'] else None
+        if (options['date_from'] and not date_from) or (options['date_to'] and not date_to):
+            raise CommandError('--date-from and --date-to must be dates in YYYY-MM-DD format')
+
+        date_range = DateRangeFilter(date_from, date_to)
+        raw = date_range.filter(TokenUsage.objects.all())
+        buckets = [
+            HourlyTokenUsage(
+                hour=item['hour'],
+                user_id=item['user_id'],
+                model_used=item['model_used'],
+                tokens_input=item['tokens_input'] or 0,
+                tokens_output=item['tokens_output'] or 0,
+                tokens_total=item['tokens_total'] or 0,
+                cost_usd=item['cost_usd'] or 0,
+                row_count=item['row_count'],
+            )
+            for item in raw.annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc)).values('hour', 'user_id', 'model_used').annotate(
+                tokens_input=Sum('tokens_input'),
+                tokens_output=Sum('tokens_output'),
+                tokens_total=Sum('tokens_total'),
+                cost_usd=Sum('cost_usd'),
+                row_count=Count('pk')
+            ).order_by()
+        ]
+
+        with transaction.atomic():
+            deleted, _ = date_range.filter(HourlyTokenUsage.objects.all(), field='hour').delete()
+            HourlyTokenUsage.objects.bulk_create(buckets, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(buckets)} hourly buckets (replaced {deleted})'))
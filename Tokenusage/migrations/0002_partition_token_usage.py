@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from zapfix_backend.partitioning import partition_table, unpartition_table
+
+
+def forwards(apps, schema_editor):
+    partition_table(schema_editor, 'token_usage')
+
+
+def backwards(apps, schema_editor):
+    unpartition_table(schema_editor, 'token_usage')
+
+
+class Migration(migrations.Migration):
+    """Range-partition token_usage by month on PostgreSQL; no-op elsewhere"""
+
+    dependencies = [
+        ('Tokenusage', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 12:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Tokenusage', '0002_partition_token_usage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyTokenUsage',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('hour', models.DateTimeField()),
+                ('model_used', models.CharField(max_length=100)),
+                ('tokens_input', models.BigIntegerField(default=0)),
+                ('tokens_output', models.BigIntegerField(default=0)),
+                ('tokens_total', models.BigIntegerField(default=0)),
+                ('cost_usd', models.DecimalField(decimal_places=6, default=0, max_digits=16)),
+                ('row_count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_token_usages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'token_usage_hourly',
+                'indexes': [models.Index(fields=['hour'], name='token_usage_hour_63599f_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'hour', 'model_used'), name='token_usage_hourly_uniq')],
+            },
+        ),
+    ]
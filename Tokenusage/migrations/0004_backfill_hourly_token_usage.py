@@ -0,0 +1,44 @@
+from datetime import timezone as dt_timezone
+
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+
+
+def backfill(apps, schema_editor):
+    TokenUsage = apps.get_model('Tokenusage', 'TokenUsage')
+    HourlyTokenUsage = apps.get_model('Tokenusage', 'HourlyTokenUsage')
+    grouped = TokenUsage.objects.annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc)).values(
+        'hour', 'user_id', 'model_used'
+    ).annotate(
+        tokens_input_sum=Sum('tokens_input'),
+        tokens_output_sum=Sum('tokens_output'),
+        tokens_total_sum=Sum('tokens_total'),
+        cost_usd_sum=Sum('cost_usd'),
+        row_count=Count('pk')
+    ).order_by()
+    HourlyTokenUsage.objects.bulk_create([
+        HourlyTokenUsage(
+            hour=item['hour'],
+            user_id=item['user_id'],
+            model_used=item['model_used'],
+            tokens_input=item['tokens_input_sum'] or 0,
+            tokens_output=item['tokens_output_sum'] or 0,
+            tokens_total=item['tokens_total_sum'] or 0,
+            cost_usd=item['cost_usd_sum'] or 0,
+            row_count=item['row_count'],
+        )
+        for item in grouped
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    """Populate the hourly cube from token usage recorded before it existed"""
+
+    dependencies = [
+        ('Tokenusage', '0003_hourlytokenusage'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
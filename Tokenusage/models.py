@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models import F
 from django.conf import settings
+from datetime import timezone as dt_timezone
+from decimal import Decimal
 import uuid
 
 class TokenUsage(models.Model):
@@ -28,3 +31,74 @@ class TokenUsage(models.Model):
 
     def __str__(self):
         return f"{getattr(self.user, 'username', str(getattr(self.user, 'id', 'unknown')))} | {self.model_used} | {self.tokens_total} tokens"
+
+
+class HourlyTokenUsage(models.Model):
+    """Hour x user x model rollup of TokenUsage, maintained on insert, edit and delete"""
+    id = models.BigAutoField(primary_key=True)
+    hour = models.DateTimeField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='hourly_token_usages')
+    model_used = models.CharField(max_length=100)
+    tokens_input = models.BigIntegerField(default=0)
+    tokens_output = models.BigIntegerField(default=0)
+    tokens_total = models.BigIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=16, decimal_places=6, default=0)
+    row_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'token_usage_hourly'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'hour', 'model_used'], name='token_usage_hourly_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} | {self.user_id} | {self.model_used} | {self.tokens_total} tokens"
+
+    @staticmethod
+    def truncate(value):
+        """Start of the UTC hour containing `value`"""
+        return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def _deltas(cls, usages):
+        """{(hour, user_id, model_used): [tokens_input, tokens_output, tokens_total, cost_usd, row_count]}"""
+        deltas = {}
+        for usage in usages:
+            key = (cls.truncate(usage.created_at), usage.user_id, usage.model_used)
+            delta = deltas.setdefault(key, [0, 0, 0, Decimal('0'), 0])
+            delta[0] += usage.tokens_input or 0
+            delta[1] += usage.tokens_output or 0
+            delta[2] += usage.tokens_total or 0
+            delta[3] += usage.cost_usd or 0
+            delta[4] += 1
+        return deltas
+
+    @classmethod
+    def record(cls, usages):
+        """Add TokenUsage rows to their hourly buckets with F() increments"""
+        for (hour, user_id, model_used), (tokens_input, tokens_output, tokens_total, cost_usd, row_count) in cls._deltas(usages).items():
+            bucket, _ = cls.objects.get_or_create(hour=hour, user_id=user_id, model_used=model_used)
+            cls.objects.filter(pk=bucket.pk).update(
+                tokens_input=F('tokens_input') + tokens_input,
+                tokens_output=F('tokens_output') + tokens_output,
+                tokens_total=F('tokens_total') + tokens_total,
+                cost_usd=F('cost_usd') + cost_usd,
+                row_count=F('row_count') + row_count,
+            )
+
+    @classmethod
+    def retract(cls, usages):
+        """Subtract TokenUsage rows (deleted, or as stored before an edit) from their buckets; emptied buckets are dropped"""
+        for (hour, user_id, model_used), (tokens_input, tokens_output, tokens_total, cost_usd, row_count) in cls._deltas(usages).items():
+            buckets = cls.objects.filter(hour=hour, user_id=user_id, model_used=model_used)
+            buckets.update(
+                tokens_input=F('tokens_input') - tokens_input,
+                tokens_output=F('tokens_output') - tokens_output,
+                tokens_total=F('tokens_total') - tokens_total,
+                cost_usd=F('cost_usd') - cost_usd,
+                row_count=F('row_count') - row_count,
+            )
+            buckets.filter(row_count__lte=0).delete()
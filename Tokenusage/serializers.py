@@ -17,33 +17,39 @@ class TokenUsageCreateSerializer(serializers.ModelSerializer):
             'cost_usd': {'required': False, 'allow_null': True},
         }
     
+    @staticmethod
+    def resolve_references(user, session_ids, message_ids):
+        """
+        Look up the sessions and messages `user` owns among the given IDs.
+        
+        Returns ({session_id: Session}, {message_id: Message}) using one query per
+        table; IDs that don't exist or belong to another user are simply absent.
+        """
+        from session.models import Session
+        from message.models import Message
+        
+        session_ids = {pk for pk in session_ids if pk}
+        message_ids = {pk for pk in message_ids if pk}
+        sessions = {}
+        if session_ids:
+            sessions = Session.objects.filter(pk__in=session_ids, user=user).in_bulk()
+        messages = {}
+        if message_ids:
+            messages = Message.objects.filter(pk__in=message_ids, session__user=user).in_bulk()
+        return sessions, messages
+    
     def create(self, validated_data):
         request = self.context['request']
         session_id = validated_data.pop('session_id', None)
         message_id = validated_data.pop('message_id', None)
         
-        # Get session if session_id provided
-        session = None
-        if session_id:
-            from session.models import Session
-            try:
-                session = Session.objects.get(pk=session_id, user=request.user)
-            except Session.DoesNotExist:
-                pass  # session_id is optional
-        
-        # Get message if message_id provided
-        message = None
-        if message_id:
-            from message.models import Message
-            try:
-                message = Message.objects.get(pk=message_id, session__user=request.user)
-            except Message.DoesNotExist:
-                pass  # message_id is optional
+        # session_id and message_id are optional; unknown IDs are ignored
+        sessions, messages = self.resolve_references(request.user, [session_id], [message_id])
         
         return TokenUsage.objects.create(
             user=request.user,
-            session=session,
-            message=message,
+            session=sessions.get(session_id),
+            message=messages.get(message_id),
             **validated_data
         )
 
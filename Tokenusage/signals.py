@@ -0,0 +1,44 @@
+"""
+Keep HourlyTokenUsage in step with edits and deletes of TokenUsage.
+
+Inserts are added to the cube explicitly by the views (bulk_create sends no
+signals); edits through the admin site or `save()` and deletes from anywhere
+but a user's cascade (which removes the user's buckets too) are handled here.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import HourlyTokenUsage, TokenUsage
+
+CUBE_FIELDS = ['created_at', 'user_id', 'model_used', 'tokens_input', 'tokens_output', 'tokens_total', 'cost_usd']
+
+
+def _cube_key(usage):
+    return tuple(getattr(usage, field) for field in CUBE_FIELDS)
+
+
+@receiver(pre_save, sender=TokenUsage)
+def remember_stored_usage(sender, instance, **kwargs):
+    """Keep the row as stored so post_save can move an edit between buckets"""
+    instance._stored_usage = None
+    if not instance._state.adding:
+        instance._stored_usage = sender.objects.filter(pk=instance.pk).only(*CUBE_FIELDS).first()
+
+
+@receiver(post_save, sender=TokenUsage)
+def update_cube_on_edit(sender, instance, created, **kwargs):
+    stored = getattr(instance, '_stored_usage', None)
+    if created or stored is None or _cube_key(stored) == _cube_key(instance):
+        return
+    HourlyTokenUsage.retract([stored])
+    HourlyTokenUsage.record([instance])
+
+
+@receiver(post_delete, sender=TokenUsage)
+def update_cube_on_delete(sender, instance, origin=None, **kwargs):
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if issubclass(origin_model, get_user_model()):
+        return
+    HourlyTokenUsage.retract([instance])
@@ -1,3 +1,234 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+import os
+import random
+import time
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.db.models.functions import TruncDate, TruncWeek, TruncMonth
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from users.models import UserProfile
+from session.models import Session
+from message.models import Message
+from Activitylogs.models import DailyUserActivity
+from .models import TokenUsage, HourlyTokenUsage
+
+TEST_SETTINGS = {
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+    'AUDIT_LOG': {'ENABLED': False},
+}
+
+
+def _cost(value):
+    # Costs are stored with 6 decimal places; SQLite sums them as floats
+    return float(Decimal(value).quantize(Decimal('0.000001'))) if value else None
+
+
+@override_settings(**TEST_SETTINGS)
+class HourlyTokenUsageCubeTests(TestCase):
+    """The cube-backed /api/tokens/usage/ must match aggregates over raw rows exactly"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass12345!')
+        UserProfile(user=cls.admin, role='admin').save()
+        cls.users = []
+        for name in ['alice', 'bob']:
+            user = User.objects.create_user(username=name, password='pass12345!')
+            UserProfile(user=user, role='user', admin_id=cls.admin).save()
+            cls.users.append(user)
+
+        rng = random.Random(42)
+        base = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        for _ in range(300):
+            usage = TokenUsage.objects.create(
+                user=rng.choice(cls.users),
+                model_used=rng.choice(['gpt-4o', 'claude', 'llama']),
+                tokens_input=rng.randint(0, 500),
+                tokens_output=rng.randint(0, 500),
+                cost_usd=rng.choice([None, Decimal('0.001250'), Decimal('0.020000')]),
+            )
+            created_at = base + timedelta(minutes=rng.randint(0, 60 * 24 * 70))
+            TokenUsage.objects.filter(pk=usage.pk).update(created_at=created_at)
+        call_command('rebuild_token_usage_cube', stdout=StringIO())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('tokens_usage')
+
+    def _expected(self, params, group_by):
+        from zapfix_backend.filters import DateRangeFilter
+        from django.test import RequestFactory
+        queryset = DateRangeFilter.from_request(RequestFactory().get('/', params)).filter(TokenUsage.objects.all())
+        totals = queryset.aggregate(total=Sum('tokens_total'), cost=Sum('cost_usd'))
+        trunc = {'day': TruncDate, 'week': TruncWeek, 'month': TruncMonth}.get(group_by)
+        if trunc:
+            grouped = queryset.annotate(key=trunc('created_at')).values('key')
+        else:
+            grouped = queryset.values('model_used')
+        rows = grouped.annotate(
+            total=Sum('tokens_total'), tokens_in=Sum('tokens_input'), tokens_out=Sum('tokens_output'), cost=Sum('cost_usd')
+        ).order_by(*(['key'] if trunc else ['model_used']))
+        breakdown = [
+            (row['total'], row['tokens_in'], row['tokens_out'], _cost(row['cost']))
+            for row in rows
+        ]
+        return totals['total'] or 0, _cost(totals['cost']), breakdown
+
+    def _assert_matches_raw(self, params):
+        for group_by in ['day', 'week', 'month', 'model']:
+            response = self.client.get(self.url, {**params, 'group_by': group_by})
+            self.assertEqual(response.status_code, 200)
+            total, cost, breakdown = self._expected(params, group_by)
+            self.assertEqual(response.data['total_tokens'], total)
+            self.assertEqual(response.data['total_cost_usd'], cost)
+            self.assertEqual(
+                [(row['tokens_total'], row['tokens_input'], row['tokens_output'], row['cost_usd']) for row in response.data['breakdown']],
+                breakdown
+            )
+
+    def test_unbounded_range_matches_raw(self):
+        self._assert_matches_raw({})
+
+    def test_utc_range_matches_raw(self):
+        self._assert_matches_raw({'date_from': '2026-03-10', 'date_to': '2026-04-20'})
+
+    def test_whole_hour_range_never_reads_raw_rows(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url, {'date_from': '2026-03-10', 'date_to': '2026-04-20', 'group_by': 'month'})
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'FROM "token_usage"' in q['sql']])
+
+    def test_half_hour_timezone_edges_match_raw(self):
+        # Asia/Kolkata days start at hh:30 UTC, so both edges are partial hours
+        self._assert_matches_raw({'date_from': '2026-03-10', 'date_to': '2026-04-20', 'tz': 'Asia/Kolkata'})
+
+    def test_user_breakdown_and_period(self):
+        response = self.client.get(self.url, {'group_by': 'user'})
+        keys = [row['group_key'] for row in response.data['breakdown']]
+        self.assertEqual(keys, [f'alice (ID: {self.users[0].id})', f'bob (ID: {self.users[1].id})'])
+        first = TokenUsage.objects.order_by('created_at').first().created_at.date().isoformat()
+        last = TokenUsage.objects.order_by('-created_at').first().created_at.date().isoformat()
+        self.assertEqual(response.data['period'], {'from': first, 'to': last})
+
+    def test_create_updates_cube(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        before = HourlyTokenUsage.objects.aggregate(total=Sum('tokens_total'), rows=Sum('row_count'))
+        client.post(reverse('tokens_create'), {'model_used': 'claude', 'tokens_input': 11, 'tokens_output': 4}, format='json')
+        after = HourlyTokenUsage.objects.aggregate(total=Sum('tokens_total'), rows=Sum('row_count'))
+        self.assertEqual(after['total'] - before['total'], 15)
+        self.assertEqual(after['rows'] - before['rows'], 1)
+
+
+    def test_edits_and_deletes_keep_cube_in_step(self):
+        usages = list(TokenUsage.objects.order_by('created_at')[:3])
+        # Edited as the admin site does it: save() on the existing row
+        usages[0].tokens_input += 100
+        usages[0].cost_usd = Decimal('1.500000')
+        usages[0].save()
+        usages[1].model_used = 'mistral'
+        usages[1].save()
+        usages[2].delete()
+        TokenUsage.objects.filter(user=self.users[1], model_used='llama').delete()
+        self._assert_matches_raw({})
+        self._assert_matches_raw({'date_from': '2026-03-01', 'date_to': '2026-03-02'})
+        self.assertFalse(HourlyTokenUsage.objects.filter(row_count__lte=0).exists())
+        self.assertFalse(HourlyTokenUsage.objects.filter(user=self.users[1], model_used='llama').exists())
+
+    def test_deleting_a_user_drops_its_buckets(self):
+        self.users[0].delete()
+        self.assertFalse(HourlyTokenUsage.objects.filter(user_id=self.users[0].id).exists())
+        self._assert_matches_raw({})
+
+
+@override_settings(**TEST_SETTINGS)
+class TokensBulkCreateTests(TestCase):
+    """Tests for the batch token usage ingestion endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='agent', password='pass12345!')
+        self.other = User.objects.create_user(username='other', password='pass12345!')
+        self.session = Session.objects.create(user=self.user)
+        self.message = Message.objects.create(session=self.session, role='assistant', content='hi')
+        self.foreign_session = Session.objects.create(user=self.other)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('tokens_bulk_create')
+
+    def _records(self, count):
+        return [
+            {'session_id': str(self.session.id), 'message_id': str(self.message.id), 'model_used': 'claude', 'tokens_input': 10, 'tokens_output': i}
+            for i in range(count)
+        ]
+
+    def test_creates_records_and_reports_per_item(self):
+        records = self._records(3)
+        records.insert(1, {'model_used': 'claude', 'tokens_input': 'many'})
+        records.append({'session_id': str(self.foreign_session.id), 'model_used': 'gpt', 'tokens_input': 1, 'tokens_output': 1})
+        response = self.client.post(self.url, {'records': records}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['rejected']), (4, 1))
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['created', 'rejected', 'created', 'created', 'created'])
+        self.assertIn('tokens_input', response.data['results'][1]['errors'])
+
+        usages = TokenUsage.objects.filter(user=self.user)
+        self.assertEqual(usages.filter(session=self.session, message=self.message).count(), 3)
+        # Sessions owned by someone else are ignored, as in the single-record endpoint
+        self.assertEqual(usages.filter(session__isnull=True).count(), 1)
+        self.assertEqual(usages.aggregate(total=Sum('tokens_total'))['total'], 30 + 3 + 2)
+        self.assertEqual(HourlyTokenUsage.objects.filter(user=self.user).aggregate(rows=Sum('row_count'))['rows'], 4)
+        self.assertEqual(DailyUserActivity.objects.get(user=self.user).tokens_total, 35)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def queries_for(count):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(self.url, {'records': self._records(count)}, format='json')
+            self.assertEqual(response.status_code, 201)
+            return len(ctx.captured_queries)
+        # The first batch creates the rollup rows; later batches only update them
+        queries_for(1)
+        self.assertEqual(queries_for(2), queries_for(40))
+
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.client.post(self.url, {'records': []}, format='json').status_code, 400)
+        response = self.client.post(self.url, {'records': self._records(501)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(TokenUsage.objects.count(), 0)
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS)
+class TokensBulkCreateBenchmark(TestCase):
+    """Records/sec through the single-record and bulk endpoints"""
+
+    def test_bulk_vs_single_throughput(self):
+        user = User.objects.create_user(username='bench', password='pass12345!')
+        session = Session.objects.create(user=user)
+        client = APIClient()
+        client.force_authenticate(user)
+        record = {'session_id': str(session.id), 'model_used': 'claude', 'tokens_input': 10, 'tokens_output': 5}
+        total = 2000
+
+        started = time.perf_counter()
+        for _ in range(total):
+            client.post(reverse('tokens_create'), record, format='json')
+        single = total / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(total // 500):
+            client.post(reverse('tokens_bulk_create'), {'records': [record] * 500}, format='json')
+        bulk = total / (time.perf_counter() - started)
+
+        print(f'\ntoken usage ingest: single {single:.0f} rows/s, bulk(500) {bulk:.0f} rows/s ({bulk / single:.1f}x)')
+        self.assertEqual(TokenUsage.objects.count(), total * 2)
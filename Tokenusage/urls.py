@@ -3,5 +3,6 @@ from . import views
 
 urlpatterns = [
     path('', views.tokens_create, name='tokens_create'),
+    path('bulk/', views.tokens_bulk_create, name='tokens_bulk_create'),
     path('usage/', views.tokens_usage, name='tokens_usage'),
 ]
\ No newline at end of file
@@ -2,17 +2,21 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.utils.dateparse import parse_date
 from django.db.models import Sum, Q, Min, Max
+from django.db.models.functions import TruncDate, TruncWeek, TruncMonth
 from django.utils import timezone
-from datetime import datetime, timedelta
+from django.db import transaction
+from datetime import timedelta
 from decimal import Decimal
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from .models import TokenUsage
+from .models import TokenUsage, HourlyTokenUsage
 from .serializers import TokenUsageCreateSerializer, TokenUsageResponseSerializer
 from users.views import is_admin
+from zapfix_backend.filters import DateRangeFilter
+from Activitylogs.models import DailyUserActivity
+from Activitylogs.audit import log_activity
 
 
 @swagger_auto_schema(
@@ -31,18 +35,215 @@ def tokens_create(request):
     """Record token usage"""
     serializer = TokenUsageCreateSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
-        token_usage = serializer.save()
+        with transaction.atomic():
+            token_usage = serializer.save()
+            HourlyTokenUsage.record([token_usage])
+            DailyUserActivity.record(
+                request.user.id,
+                at=token_usage.created_at,
+                tokens_input=token_usage.tokens_input,
+                tokens_output=token_usage.tokens_output,
+                cost_usd=token_usage.cost_usd
+            )
+        log_activity(request, 'token_usage', metadata={'token_usage_id': str(token_usage.id), 'model_used': token_usage.model_used, 'tokens_total': token_usage.tokens_total})
         response_serializer = TokenUsageResponseSerializer(token_usage)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+TOKENS_BULK_MAX_RECORDS = 500
+
+
+@swagger_auto_schema(
+    method='post',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['records'],
+        properties={
+            'records': openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                description=f'Up to {TOKENS_BULK_MAX_RECORDS} token usage records, same fields as POST /api/tokens/'
+            ),
+        }
+    ),
+    responses={
+        201: openapi.Response('At least one record was created; per-record results'),
+        400: openapi.Response('Bad request - no record was created')
+    },
+    tags=['Tokens'],
+    security=[{'Bearer': []}]
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def tokens_bulk_create(request):
+    """Record a batch of token usage records"""
+    records = request.data.get('records') if isinstance(request.data, dict) else request.data
+    if not isinstance(records, list) or not records:
+        return Response({
+            'error': 'records must be a non-empty list'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if len(records) > TOKENS_BULK_MAX_RECORDS:
+        return Response({
+            'error': f'At most {TOKENS_BULK_MAX_RECORDS} records can be sent at once'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Validate every record with the single-record serializer
+    results = []
+    valid = []
+    for index, record in enumerate(records):
+        serializer = TokenUsageCreateSerializer(data=record, context={'request': request})
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results.append({'index': index, 'status': 'rejected', 'errors': serializer.errors})
+    
+    # Resolve all referenced sessions and messages with one query each
+    sessions, messages = TokenUsageCreateSerializer.resolve_references(
+        request.user,
+        [data.get('session_id') for _, data in valid],
+        [data.get('message_id') for _, data in valid]
+    )
+    
+    usages = []
+    for index, data in valid:
+        data = dict(data)
+        session_id = data.pop('session_id', None)
+        message_id = data.pop('message_id', None)
+        usage = TokenUsage(
+            user=request.user,
+            session=sessions.get(session_id),
+            message=messages.get(message_id),
+            **data
+        )
+        # bulk_create skips TokenUsage.save(), which derives the total
+        usage.tokens_total = (usage.tokens_input or 0) + (usage.tokens_output or 0)
+        usages.append((index, usage))
+    
+    if usages:
+        with transaction.atomic():
+            TokenUsage.objects.bulk_create([usage for _, usage in usages])
+            HourlyTokenUsage.record(usage for _, usage in usages)
+            _record_daily_token_usage(request.user, [usage for _, usage in usages])
+        log_activity(request, 'token_usage', metadata={'records': len(usages), 'tokens_total': sum(usage.tokens_total for _, usage in usages)})
+    
+    for index, usage in usages:
+        results.append({
+            'index': index,
+            'status': 'created',
+            'id': str(usage.id),
+            'tokens_total': usage.tokens_total,
+            'created_at': usage.created_at.isoformat()
+        })
+    results.sort(key=lambda result: result['index'])
+    
+    return Response({
+        'created': len(usages),
+        'rejected': len(records) - len(usages),
+        'results': results
+    }, status=status.HTTP_201_CREATED if usages else status.HTTP_400_BAD_REQUEST)
+
+
+def _record_daily_token_usage(user, usages):
+    """Add a batch of TokenUsage rows to the user's daily activity rollup"""
+    per_day = {}
+    for usage in usages:
+        day = per_day.setdefault(timezone.localdate(usage.created_at), {'at': usage.created_at, 'in': 0, 'out': 0, 'cost': Decimal('0')})
+        day['at'] = max(day['at'], usage.created_at)
+        day['in'] += usage.tokens_input or 0
+        day['out'] += usage.tokens_output or 0
+        day['cost'] += usage.cost_usd or 0
+    for day in per_day.values():
+        DailyUserActivity.record(user.id, at=day['at'], tokens_input=day['in'], tokens_output=day['out'], cost_usd=day['cost'])
+
+
+COST_QUANTUM = Decimal('0.000001')
+
+TOKEN_SUMS = {
+    'tokens_total': Sum('tokens_total'),
+    'tokens_input': Sum('tokens_input'),
+    'tokens_output': Sum('tokens_output'),
+    'cost_usd': Sum('cost_usd'),
+}
+
+
+def _token_usage_sources(filters, date_range):
+    """
+    Split the requested range into querysets that together cover it exactly.
+
+    Whole UTC hours are answered by HourlyTokenUsage (time field `hour`); the
+    partial hours at either edge, e.g. for a `tz` with a half-hour offset, are
+    answered by raw TokenUsage rows (time field `created_at`). Both models share
+    the `user`, `model_used` and token/cost column names, so the same filters
+    and aggregates apply to every source.
+    """
+    start, end = date_range.start, date_range.end
+    cube_start = HourlyTokenUsage.truncate(start) if start else None
+    if cube_start is not None and cube_start < start:
+        cube_start += timedelta(hours=1)
+    cube_end = HourlyTokenUsage.truncate(end) if end else None
+    
+    if cube_start is not None and cube_end is not None and cube_start >= cube_end:
+        # The range never spans a whole hour
+        return [(TokenUsage.objects.filter(filters, created_at__gte=start, created_at__lt=end), 'created_at')]
+    
+    cube = HourlyTokenUsage.objects.filter(filters)
+    if cube_start is not None:
+        cube = cube.filter(hour__gte=cube_start)
+    if cube_end is not None:
+        cube = cube.filter(hour__lt=cube_end)
+    sources = [(cube, 'hour')]
+    
+    if start is not None and start < cube_start:
+        sources.append((TokenUsage.objects.filter(filters, created_at__gte=start, created_at__lt=cube_start), 'created_at'))
+    if end is not None and cube_end < end:
+        sources.append((TokenUsage.objects.filter(filters, created_at__gte=cube_end, created_at__lt=end), 'created_at'))
+    return sources
+
+
+def _merge_totals(aggregates):
+    """Add up TOKEN_SUMS aggregates from several sources, keeping None for empty sums"""
+    merged = dict.fromkeys(TOKEN_SUMS)
+    for aggregate in aggregates:
+        for field, value in aggregate.items():
+            if value is not None:
+                merged[field] = value if merged[field] is None else merged[field] + value
+    if merged['cost_usd'] is not None:
+        # Backends without a native decimal type (SQLite) add in floating point
+        merged['cost_usd'] = Decimal(merged['cost_usd']).quantize(COST_QUANTUM)
+    return merged
+
+
+def _merge_groups(grouped_querysets):
+    """Aggregate each `.values(...)` queryset with TOKEN_SUMS and merge rows by group key"""
+    merged = {}
+    for queryset in grouped_querysets:
+        key_fields = None
+        for item in queryset.annotate(**TOKEN_SUMS).order_by():
+            if key_fields is None:
+                key_fields = [field for field in item if field not in TOKEN_SUMS]
+            key = tuple(item[field] for field in key_fields)
+            merged[key] = _merge_totals([merged.get(key, {}), {field: item[field] for field in TOKEN_SUMS}])
+    return sorted(merged.items(), key=lambda entry: tuple((value is None, value) for value in entry[0]))
+
+
+def _breakdown_row(group_key, item):
+    return {
+        'group_key': group_key,
+        'tokens_total': item['tokens_total'] or 0,
+        'tokens_input': item['tokens_input'] or 0,
+        'tokens_output': item['tokens_output'] or 0,
+        'cost_usd': float(item['cost_usd']) if item['cost_usd'] else None
+    }
+
+
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
         openapi.Parameter('user_id', openapi.IN_QUERY, description='Filter by user ID (Admin only)', type=openapi.TYPE_INTEGER),
         openapi.Parameter('date_from', openapi.IN_QUERY, description='Start date (YYYY-MM-DD)', type=openapi.TYPE_STRING),
         openapi.Parameter('date_to', openapi.IN_QUERY, description='End date (YYYY-MM-DD)', type=openapi.TYPE_STRING),
+        openapi.Parameter('tz', openapi.IN_QUERY, description='IANA timezone the dates are interpreted in (default UTC)', type=openapi.TYPE_STRING),
         openapi.Parameter('group_by', openapi.IN_QUERY, description='Group by', type=openapi.TYPE_STRING, enum=['day', 'week', 'month', 'user', 'model']),
         openapi.Parameter('model_used', openapi.IN_QUERY, description='Filter by model', type=openapi.TYPE_STRING),
     ],
@@ -54,73 +255,50 @@ def tokens_create(request):
 @permission_classes([IsAuthenticated])
 def tokens_usage(request):
     """Get token usage statistics"""
-    # Get base queryset based on user role
+    # Build the filters shared by raw rows and the hourly cube
+    filters = Q()
     if is_admin(request.user):
         # Admin can see all token usage, optionally filtered by user_id
-        queryset = TokenUsage.objects.all()
-        
-        # Filter by user_id if provided (admin only)
         user_id = request.GET.get('user_id')
         if user_id:
             try:
-                queryset = queryset.filter(user_id=int(user_id))
+                filters &= Q(user_id=int(user_id))
             except (ValueError, TypeError):
                 pass
     else:
         # Regular users see only their own token usage
-        queryset = TokenUsage.objects.filter(user=request.user)
-    
-    # Filter by date range
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    
-    if date_from:
-        try:
-            date_from_parsed = parse_date(date_from)
-            if date_from_parsed:
-                queryset = queryset.filter(created_at__date__gte=date_from_parsed)
-        except (ValueError, TypeError):
-            pass
-    
-    if date_to:
-        try:
-            date_to_parsed = parse_date(date_to)
-            if date_to_parsed:
-                # Include the entire day
-                date_to_parsed = date_to_parsed + timedelta(days=1)
-                queryset = queryset.filter(created_at__date__lt=date_to_parsed)
-        except (ValueError, TypeError):
-            pass
+        filters &= Q(user=request.user)
     
     # Filter by model_used
     model_used = request.GET.get('model_used')
     if model_used:
-        queryset = queryset.filter(model_used=model_used)
+        filters &= Q(model_used=model_used)
+    
+    # Whole hours come from the cube, partial edge hours from raw rows
+    date_range = DateRangeFilter.from_request(request)
+    sources = _token_usage_sources(filters, date_range)
     
     # Calculate totals
-    totals = queryset.aggregate(
-        total_tokens=Sum('tokens_total'),
-        total_tokens_input=Sum('tokens_input'),
-        total_tokens_output=Sum('tokens_output'),
-        total_cost=Sum('cost_usd')
-    )
+    totals = _merge_totals(queryset.aggregate(**TOKEN_SUMS) for queryset, _ in sources)
     
-    total_tokens = totals['total_tokens'] or 0
-    total_cost_usd = float(totals['total_cost']) if totals['total_cost'] else None
+    total_tokens = totals['tokens_total'] or 0
+    total_cost_usd = float(totals['cost_usd']) if totals['cost_usd'] else None
     
     # Determine date range for period
-    if date_from and date_to:
-        period_from = date_from
-        period_to = date_to
+    if date_range.date_from and date_range.date_to:
+        period_from = date_range.date_from
+        period_to = date_range.date_to
     else:
         # Get actual date range from data
-        date_range = queryset.aggregate(
-            min_date=Min('created_at'),
-            max_date=Max('created_at')
-        )
-        if date_range['min_date'] and date_range['max_date']:
-            period_from = date_range['min_date'].date().isoformat()
-            period_to = date_range['max_date'].date().isoformat()
+        bounds = [
+            queryset.aggregate(min_date=Min(time_field), max_date=Max(time_field))
+            for queryset, time_field in sources
+        ]
+        min_dates = [item['min_date'] for item in bounds if item['min_date']]
+        max_dates = [item['max_date'] for item in bounds if item['max_date']]
+        if min_dates and max_dates:
+            period_from = min(min_dates).date().isoformat()
+            period_to = max(max_dates).date().isoformat()
         else:
             period_from = timezone.now().date().isoformat()
             period_to = timezone.now().date().isoformat()
@@ -129,105 +307,39 @@ def tokens_usage(request):
     group_by = request.GET.get('group_by', 'day')
     breakdown = []
     
-    if group_by == 'day':
-        # Group by day
-        from django.db.models.functions import TruncDate
-        grouped = queryset.annotate(
-            date=TruncDate('created_at')
-        ).values('date').annotate(
-            tokens_total=Sum('tokens_total'),
-            tokens_input=Sum('tokens_input'),
-            tokens_output=Sum('tokens_output'),
-            cost_usd=Sum('cost_usd')
-        ).order_by('date')
-        
-        for item in grouped:
-            breakdown.append({
-                'group_key': item['date'].isoformat() if item['date'] else None,
-                'tokens_total': item['tokens_total'] or 0,
-                'tokens_input': item['tokens_input'] or 0,
-                'tokens_output': item['tokens_output'] or 0,
-                'cost_usd': float(item['cost_usd']) if item['cost_usd'] else None
-            })
-    
-    elif group_by == 'week':
-        # Group by week
-        from django.db.models.functions import TruncWeek
-        grouped = queryset.annotate(
-            week=TruncWeek('created_at')
-        ).values('week').annotate(
-            tokens_total=Sum('tokens_total'),
-            tokens_input=Sum('tokens_input'),
-            tokens_output=Sum('tokens_output'),
-            cost_usd=Sum('cost_usd')
-        ).order_by('week')
-        
-        for item in grouped:
-            breakdown.append({
-                'group_key': item['week'].isoformat() if item['week'] else None,
-                'tokens_total': item['tokens_total'] or 0,
-                'tokens_input': item['tokens_input'] or 0,
-                'tokens_output': item['tokens_output'] or 0,
-                'cost_usd': float(item['cost_usd']) if item['cost_usd'] else None
-            })
-    
-    elif group_by == 'month':
-        # Group by month
-        from django.db.models.functions import TruncMonth
-        grouped = queryset.annotate(
-            month=TruncMonth('created_at')
-        ).values('month').annotate(
-            tokens_total=Sum('tokens_total'),
-            tokens_input=Sum('tokens_input'),
-            tokens_output=Sum('tokens_output'),
-            cost_usd=Sum('cost_usd')
-        ).order_by('month')
-        
-        for item in grouped:
-            breakdown.append({
-                'group_key': item['month'].strftime('%Y-%m') if item['month'] else None,
-                'tokens_total': item['tokens_total'] or 0,
-                'tokens_input': item['tokens_input'] or 0,
-                'tokens_output': item['tokens_output'] or 0,
-                'cost_usd': float(item['cost_usd']) if item['cost_usd'] else None
-            })
+    if group_by in ('day', 'week', 'month'):
+        trunc = {'day': TruncDate, 'week': TruncWeek, 'month': TruncMonth}[group_by]
+        grouped = _merge_groups(
+            queryset.annotate(period=trunc(time_field)).values('period')
+            for queryset, time_field in sources
+        )
+        for (period,), item in grouped:
+            if period is None:
+                group_key = None
+            elif group_by == 'month':
+                group_key = period.strftime('%Y-%m')
+            else:
+                group_key = period.isoformat()
+            breakdown.append(_breakdown_row(group_key, item))
     
     elif group_by == 'user':
         # Group by user (admin only)
         if is_admin(request.user):
-            grouped = queryset.values('user_id', 'user__username').annotate(
-                tokens_total=Sum('tokens_total'),
-                tokens_input=Sum('tokens_input'),
-                tokens_output=Sum('tokens_output'),
-                cost_usd=Sum('cost_usd')
-            ).order_by('user_id')
-            
-            for item in grouped:
-                breakdown.append({
-                    'group_key': f"{item['user__username']} (ID: {item['user_id']})",
-                    'tokens_total': item['tokens_total'] or 0,
-                    'tokens_input': item['tokens_input'] or 0,
-                    'tokens_output': item['tokens_output'] or 0,
-                    'cost_usd': float(item['cost_usd']) if item['cost_usd'] else None
-                })
+            grouped = _merge_groups(
+                queryset.values('user_id', 'user__username')
+                for queryset, _ in sources
+            )
+            for (user_id, username), item in grouped:
+                breakdown.append(_breakdown_row(f"{username} (ID: {user_id})", item))
     
     elif group_by == 'model':
         # Group by model
-        grouped = queryset.values('model_used').annotate(
-            tokens_total=Sum('tokens_total'),
-            tokens_input=Sum('tokens_input'),
-            tokens_output=Sum('tokens_output'),
-            cost_usd=Sum('cost_usd')
-        ).order_by('model_used')
-        
-        for item in grouped:
-            breakdown.append({
-                'group_key': item['model_used'] or 'Unknown',
-                'tokens_total': item['tokens_total'] or 0,
-                'tokens_input': item['tokens_input'] or 0,
-                'tokens_output': item['tokens_output'] or 0,
-                'cost_usd': float(item['cost_usd']) if item['cost_usd'] else None
-            })
+        grouped = _merge_groups(
+            queryset.values('model_used')
+            for queryset, _ in sources
+        )
+        for (model,), item in grouped:
+            breakdown.append(_breakdown_row(model or 'Unknown', item))
     
     return Response({
         'total_tokens': total_tokens,
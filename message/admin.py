@@ -8,7 +8,7 @@ class MessageAdmin(admin.ModelAdmin):
     list_display = ['id', 'session', 'role', 'content_preview', 'tokens_used', 'model_used', 'created_at', 'sequence_number']
     list_filter = ['role', 'created_at', 'session__status']
     search_fields = ['content', 'session__title', 'session__user__username']
-    readonly_fields = ['id', 'created_at', 'sequence_number']
+    readonly_fields = ['id', 'created_at', 'sequence_number', 'version']
     
     def content_preview(self, obj):
         """Return a short preview of the content for the admin list display."""
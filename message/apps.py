@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class MessageConfig(AppConfig):
     name = 'message'
+
+    def ready(self):
+        from zapfix_backend.triggers import restore_after_migrate
+        from .search import DOCS_TABLE, sqlite_triggers
+        # The message delete trigger keeps the search documents in step
+        restore_after_migrate(self, DOCS_TABLE, sqlite_triggers)
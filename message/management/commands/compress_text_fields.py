@@ -0,0 +1,57 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.db.models.functions import Length
+
+from zapfix_backend.fields import CODEC_PREFIX, CompressedTextField
+
+
+class Command(BaseCommand):
+    help = "Compress large values written before their column became a CompressedTextField"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', help='Only this model, as app_label.ModelName (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Count rows that would be compressed without rewriting them')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows to rewrite per batch')
+
+    def handle(self, *args, **options):
+        if options['model']:
+            try:
+                models = [apps.get_model(label) for label in options['model']]
+            except (LookupError, ValueError) as exc:
+                raise CommandError(str(exc))
+        else:
+            models = apps.get_models()
+
+        for model in models:
+            fields = [field for field in model._meta.concrete_fields if isinstance(field, CompressedTextField)]
+            for field in fields:
+                count = self._compress(model, field, options['batch_size'], options['dry_run'])
+                action = 'Would compress' if options['dry_run'] else 'Compressed'
+                self.stdout.write(f'{model._meta.label}.{field.name}: {action.lower()} {count} rows')
+
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def _compress(self, model, field, batch_size, dry_run):
+        """Rewrite plain values of at least `compress_threshold` characters, walking the table by primary key"""
+        rows = model._default_manager.annotate(
+            _length=Length(field.name)
+        ).filter(
+            _length__gte=field.compress_threshold
+        ).exclude(
+            Q(**{f'{field.name}__startswith': CODEC_PREFIX})
+        ).order_by('pk')
+        if dry_run:
+            return rows.count()
+
+        rewritten = 0
+        last_pk = None
+        while True:
+            batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+            batch = list(batch.only('pk', field.name)[:batch_size])
+            if not batch:
+                return rewritten
+            # Saving the loaded (plain) value runs it through the field's encoder
+            model._default_manager.bulk_update(batch, [field.name])
+            rewritten += len(batch)
+            last_pk = batch[-1].pk
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from message.models import Message
+from message.search import index_in_batches, supports_search
+
+
+class Command(BaseCommand):
+    help = "Re-index message content for full-text search (to repair the index)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session-id', action='append', help='Only index this session (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Messages to index per batch')
+
+    def handle(self, *args, **options):
+        if not supports_search(connection):
+            raise CommandError(f'Message search is not available on {connection.vendor}')
+
+        messages = Message.objects.all()
+        if options['session_id']:
+            messages = messages.filter(session_id__in=options['session_id'])
+
+        indexed = index_in_batches(messages, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} messages'))
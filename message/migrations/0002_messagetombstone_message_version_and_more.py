@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0001_initial'),
+        ('session', '0004_session_change_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageTombstone',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('message_id', models.UUIDField()),
+                ('sequence_number', models.IntegerField()),
+                ('version', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='version',
+            field=models.BigIntegerField(default=0, help_text='Session change_version of the last write to this message'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['session', 'version'], name='message_mes_session_6d7666_idx'),
+        ),
+        migrations.AddField(
+            model_name='messagetombstone',
+            name='session',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_tombstones', to='session.session'),
+        ),
+        migrations.AddIndex(
+            model_name='messagetombstone',
+            index=models.Index(fields=['session', 'version'], name='message_mes_session_1bc4be_idx'),
+        ),
+    ]
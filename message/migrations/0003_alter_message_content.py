@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-17 15:05
+
+import zapfix_backend.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0002_messagetombstone_message_version_and_more'),
+    ]
+
+    # The column stays text; only the Python-side encoding changes, so skip the
+    # table rebuild some backends would do for AlterField
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='message',
+                    name='content',
+                    field=zapfix_backend.fields.CompressedTextField(),
+                ),
+            ],
+        ),
+    ]
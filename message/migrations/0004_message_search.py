@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from message.search import create_search_index, drop_search_index
+
+
+def forwards(apps, schema_editor):
+    create_search_index(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    drop_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+    """Full-text index for message content: tsvector + GIN on PostgreSQL, FTS5 on SQLite"""
+
+    dependencies = [
+        ('message', '0003_alter_message_content'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
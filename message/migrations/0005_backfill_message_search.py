@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from message.search import index_in_batches, supports_search
+
+
+def backfill(apps, schema_editor):
+    if not supports_search(schema_editor.connection):
+        return
+    Message = apps.get_model('message', 'Message')
+    index_in_batches(Message.objects.all())
+
+
+class Migration(migrations.Migration):
+    """Index the messages written before the search index existed"""
+
+    dependencies = [
+        ('message', '0004_message_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 import uuid
 
+from zapfix_backend.fields import CompressedTextField
+
 class Message(models.Model):
     """Message model for session messages"""
     ROLE_CHOICES = [
@@ -12,28 +14,54 @@ class Message(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     session = models.ForeignKey('session.Session', on_delete=models.CASCADE, related_name='messages')
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
-    content = models.TextField()
+    content = CompressedTextField()
     tokens_used = models.IntegerField(default=0)
     model_used = models.CharField(max_length=100, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     sequence_number = models.IntegerField(default=0)
+    version = models.BigIntegerField(default=0, help_text="Session change_version of the last write to this message")
 
     class Meta:
         ordering = ['sequence_number', 'created_at']
         indexes = [
             models.Index(fields=['session', 'sequence_number']),
+            models.Index(fields=['session', 'version']),
         ]
     
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
     
     def save(self, *args, **kwargs):
-        """Auto-increment sequence_number"""
+        """Auto-increment sequence_number and keep the search index current"""
+        from .search import index_messages
         is_new = self._state.adding
         
-        if is_new and not self.sequence_number:
-            # Get next sequence number for this session
-            last_message = Message.objects.filter(session=self.session).order_by('-sequence_number').first()
-            self.sequence_number = (last_message.sequence_number + 1) if last_message else 1
-        
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if is_new and not self.sequence_number:
+                # Take the next number and change version from the session's
+                # counters in the same transaction as the insert
+                from session.models import Session
+                self.sequence_number, self.version = Session.allocate_messages(self.session_id)
+            super().save(*args, **kwargs)
+            
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None or 'content' in update_fields:
+                index_messages([self])
+
+
+class MessageTombstone(models.Model):
+    """Record of a deleted message, kept so sync clients can drop it"""
+    id = models.BigAutoField(primary_key=True)
+    session = models.ForeignKey('session.Session', on_delete=models.CASCADE, related_name='message_tombstones')
+    message_id = models.UUIDField()
+    sequence_number = models.IntegerField()
+    version = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'version']),
+        ]
+    
+    def __str__(self):
+        return f"Deleted message {self.message_id} (v{self.version})"
@@ -0,0 +1,217 @@
+"""
+Full-text search over message content.
+
+PostgreSQL keeps a `search_vector` tsvector column on the message table with a
+GIN index. SQLite keeps an FTS5 index over `message_search_docs` (external
+content), and a trigger drops a message's document when the message is deleted
+(re-created after each migrate, see zapfix_backend/triggers.py). Both
+structures are created by migration only, so the Message model does not carry
+(or SELECT) them.
+
+Message.content may be stored compressed (see CompressedTextField), so the
+database cannot index it by itself. `index_messages` is called with the plain
+text whenever messages are created or edited; deletes are handled in the
+database. Migration 0005 indexes the messages that predate the index, and the
+rebuild_message_search command re-indexes on demand, both via
+`index_in_batches`.
+"""
+import html
+import re
+
+from django.db import NotSupportedError, connection, transaction
+
+SEARCH_CONFIG = 'english'
+DOCS_TABLE = 'message_search_docs'
+FTS_TABLE = 'message_search'
+# Placeholders the database wraps matches in; swapped for <mark> after escaping
+SNIPPET_START = '\x02'
+SNIPPET_STOP = '\x03'
+
+
+def supports_search(connection):
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def _message_table():
+    from .models import Message
+    return Message._meta.db_table
+
+
+def sqlite_triggers(quote):
+    """Triggers on the message table: deleting a message (directly or by cascade) drops its document"""
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS message_search_message_ad AFTER DELETE ON {quote(_message_table())} BEGIN '
+        f'DELETE FROM {quote(DOCS_TABLE)} WHERE message_id = old.id; END'
+    ]
+
+
+def create_search_index(schema_editor):
+    """Create the backend's search structures (called from a migration)"""
+    vendor = schema_editor.connection.vendor
+    quote = schema_editor.quote_name
+    table = quote(_message_table())
+    if vendor == 'postgresql':
+        schema_editor.execute(f'ALTER TABLE {table} ADD COLUMN search_vector tsvector')
+        schema_editor.execute(f'CREATE INDEX message_search_vector_idx ON {table} USING GIN (search_vector)')
+    elif vendor == 'sqlite':
+        docs, fts = quote(DOCS_TABLE), quote(FTS_TABLE)
+        schema_editor.execute(
+            f'CREATE TABLE {docs} (id INTEGER PRIMARY KEY, message_id char(32) NOT NULL UNIQUE, content TEXT NOT NULL)'
+        )
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5(content, content={docs}, content_rowid='id', tokenize='porter unicode61')"
+        )
+        # Keep the FTS index in step with the documents table
+        schema_editor.execute(
+            f'CREATE TRIGGER message_search_docs_ai AFTER INSERT ON {docs} BEGIN '
+            f'INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER message_search_docs_ad AFTER DELETE ON {docs} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); END"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER message_search_docs_au AFTER UPDATE ON {docs} BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); "
+            f'INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END'
+        )
+        for statement in sqlite_triggers(quote):
+            schema_editor.execute(statement)
+
+
+def drop_search_index(schema_editor):
+    """Remove the backend's search structures (called from a migration)"""
+    vendor = schema_editor.connection.vendor
+    quote = schema_editor.quote_name
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS message_search_vector_idx')
+        schema_editor.execute(f'ALTER TABLE {quote(_message_table())} DROP COLUMN IF EXISTS search_vector')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TRIGGER IF EXISTS message_search_message_ad')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {quote(FTS_TABLE)}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {quote(DOCS_TABLE)}')
+
+
+def index_messages(messages):
+    """Add or refresh the search entries of `messages` (saved Message instances)"""
+    from .models import Message
+
+    if not supports_search(connection):
+        return
+    pk = Message._meta.pk
+    rows = [(pk.get_db_prep_value(message.pk, connection), message.content or '') for message in messages]
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.executemany(
+                f'UPDATE {quote(_message_table())} SET search_vector = to_tsvector(%s, %s) WHERE id = %s',
+                [(SEARCH_CONFIG, content, message_id) for message_id, content in rows]
+            )
+        else:
+            cursor.executemany(
+                f'INSERT INTO {quote(DOCS_TABLE)} (message_id, content) VALUES (%s, %s) '
+                f'ON CONFLICT (message_id) DO UPDATE SET content = excluded.content',
+                rows
+            )
+
+
+def index_in_batches(messages, batch_size=1000):
+    """Index a Message queryset in primary-key batches, one transaction each; returns the count indexed"""
+    messages = messages.only('id', 'content').order_by('pk')
+    indexed = 0
+    last_pk = None
+    while True:
+        batch = messages if last_pk is None else messages.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            return indexed
+        with transaction.atomic():
+            index_messages(batch)
+        indexed += len(batch)
+        last_pk = batch[-1].pk
+
+
+def _highlight(snippet):
+    """HTML-escape a snippet and turn the match placeholders into <mark> tags"""
+    return html.escape(snippet or '').replace(SNIPPET_START, '<mark>').replace(SNIPPET_STOP, '</mark>')
+
+
+def _fts5_query(query):
+    """Turn free text into an FTS5 query: every word must match, quoted so operators are literal"""
+    return ' '.join('"%s"' % word for word in re.findall(r'\w+', query))
+
+
+def search_messages(user, query, session_id=None, role=None, date_range=None, limit=20, offset=0):
+    """
+    Rank the user's messages matching `query`.
+
+    Returns a list of (message_id, rank, snippet) with the best match first.
+    Snippets are HTML-escaped with matched terms wrapped in <mark>…</mark>.
+    """
+    from session.models import Session
+    from .models import Message
+
+    if not supports_search(connection):
+        raise NotSupportedError(f'Message search is not available on {connection.vendor}')
+
+    quote = connection.ops.quote_name
+    pk = Message._meta.pk
+    messages = quote(_message_table())
+    sessions = quote(Session._meta.db_table)
+    conditions = ['s.user_id = %s']
+    params = [user.pk]
+    if session_id is not None:
+        conditions.append('m.session_id = %s')
+        params.append(Session._meta.pk.get_db_prep_value(session_id, connection))
+    if role is not None:
+        conditions.append('m.role = %s')
+        params.append(role)
+    if date_range is not None and date_range.start is not None:
+        conditions.append('m.created_at >= %s')
+        params.append(connection.ops.adapt_datetimefield_value(date_range.start))
+    if date_range is not None and date_range.end is not None:
+        conditions.append('m.created_at < %s')
+        params.append(connection.ops.adapt_datetimefield_value(date_range.end))
+    where = ' AND '.join(conditions)
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f'SELECT m.id, ts_rank(m.search_vector, q) AS rank '
+                f'FROM {messages} m JOIN {sessions} s ON s.id = m.session_id, websearch_to_tsquery(%s, %s) q '
+                f'WHERE m.search_vector @@ q AND {where} '
+                f'ORDER BY rank DESC, m.created_at DESC LIMIT %s OFFSET %s',
+                [SEARCH_CONFIG, query] + params + [limit, offset]
+            )
+            ranked = [(pk.to_python(row[0]), row[1]) for row in cursor.fetchall()]
+            if not ranked:
+                return []
+            # Headlines are built from the plain text, which only Python can read
+            contents = dict(Message.objects.filter(pk__in=[message_id for message_id, _ in ranked]).values_list('id', 'content'))
+            cursor.execute(
+                'SELECT ts_headline(%s, t.content, websearch_to_tsquery(%s, %s), %s) '
+                'FROM unnest(%s::text[]) WITH ORDINALITY AS t(content, position) ORDER BY t.position',
+                [
+                    SEARCH_CONFIG, SEARCH_CONFIG, query,
+                    f'StartSel="{SNIPPET_START}", StopSel="{SNIPPET_STOP}", MaxWords=30, MinWords=10',
+                    [contents.get(message_id, '') for message_id, _ in ranked],
+                ]
+            )
+            snippets = [row[0] for row in cursor.fetchall()]
+            return [(message_id, rank, _highlight(snippet)) for (message_id, rank), snippet in zip(ranked, snippets)]
+
+        match = _fts5_query(query)
+        if not match:
+            return []
+        fts, docs = quote(FTS_TABLE), quote(DOCS_TABLE)
+        cursor.execute(
+            f"SELECT d.message_id, -bm25({fts}) AS rank, snippet({fts}, 0, %s, %s, '…', 16) "
+            f'FROM {fts} JOIN {docs} d ON d.id = {fts}.rowid '
+            f'JOIN {messages} m ON m.id = d.message_id JOIN {sessions} s ON s.id = m.session_id '
+            f'WHERE {fts} MATCH %s AND {where} '
+            f'ORDER BY bm25({fts}), m.created_at DESC LIMIT %s OFFSET %s',
+            [SNIPPET_START, SNIPPET_STOP, match] + params + [limit, offset]
+        )
+        return [(pk.to_python(row[0]), row[1], _highlight(row[2])) for row in cursor.fetchall()]
@@ -1,3 +1,203 @@
-from django.test import TestCase
+import os
+import random
+import time
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from session.models import Session
+from .models import Message
+from .search import DOCS_TABLE, index_messages
+from .views import message_detail
+
+TEST_SETTINGS = {
+    'AUDIT_LOG': {'ENABLED': False},
+}
+
+
+@override_settings(**TEST_SETTINGS)
+class MessageSearchTests(TestCase):
+    """Full-text message search is ranked, highlighted, scoped and kept in sync"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.session = Session.objects.create(user=self.user, title='Deploy')
+        self.other_session = Session.objects.create(user=self.user, title='Refactor')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('session_message_search')
+
+    def _add(self, content, session=None, role='assistant'):
+        return Message.objects.create(session=session or self.session, role=role, content=content)
+
+    def _search(self, q, **params):
+        response = self.client.get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def _ids(self, data):
+        return [result['id'] for result in data['results']]
+
+    def test_ranked_results_with_snippets(self):
+        weak = self._add('the migration ran after a long wait and then everything else happened as usual')
+        strong = self._add('migration failed: migration lock held by another migration')
+        self._add('nothing to see here')
+        data = self._search('migration')
+        self.assertEqual(self._ids(data), [str(strong.id), str(weak.id)])
+        self.assertIn('<mark>migration</mark>', data['results'][0]['snippet'])
+        self.assertEqual(data['results'][0]['session_title'], 'Deploy')
+
+    def test_stemming_and_escaping(self):
+        message = self._add('<script>alert(1)</script> the tests are running')
+        data = self._search('run')
+        self.assertEqual(self._ids(data), [str(message.id)])
+        self.assertIn('&lt;script&gt;', data['results'][0]['snippet'])
+        self.assertNotIn('<script>', data['results'][0]['snippet'])
+
+    def test_operator_characters_are_literal(self):
+        message = self._add('error: "quoted" AND NOT (grouped)*')
+        self.assertEqual(self._ids(self._search('"quoted" AND (grouped')), [str(message.id)])
+        self.assertEqual(self._search('*')['results'], [])
+
+    def test_results_are_scoped_to_the_user(self):
+        other = Session.objects.create(user=User.objects.create(username='other'))
+        self._add('secret deployment token', session=other)
+        self.assertEqual(self._search('deployment')['results'], [])
+
+    def test_filters(self):
+        in_session = self._add('cache warmup', role='user')
+        elsewhere = self._add('cache warmup', session=self.other_session)
+        self.assertEqual(self._ids(self._search('cache', session_id=self.session.id)), [str(in_session.id)])
+        self.assertEqual(self._ids(self._search('cache', role='assistant')), [str(elsewhere.id)])
+
+        Message.objects.filter(pk=elsewhere.pk).update(created_at=timezone.now() - timedelta(days=10))
+        today = timezone.localdate().isoformat()
+        self.assertEqual(self._ids(self._search('cache', date_from=today)), [str(in_session.id)])
+        self.assertEqual(self.client.get(self.url, {'q': 'cache', 'session_id': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+    def test_pagination(self):
+        for i in range(5):
+            self._add(f'flaky test number {i}')
+        first = self._search('flaky', limit=3)
+        self.assertEqual((len(first['results']), first['next_offset']), (3, 3))
+        second = self._search('flaky', limit=3, offset=3)
+        self.assertEqual((len(second['results']), second['next_offset']), (2, None))
+        self.assertFalse(set(self._ids(first)) & set(self._ids(second)))
+
+    def test_index_follows_edits_and_deletes(self):
+        message = self._add('original wording')
+        factory = APIRequestFactory()
+        request = factory.patch('/', {'content': 'rewritten text'}, format='json')
+        force_authenticate(request, self.user)
+        self.assertEqual(message_detail(request, message_id=message.id).status_code, 200)
+        self.assertEqual(self._search('original')['results'], [])
+        self.assertEqual(self._ids(self._search('rewritten')), [str(message.id)])
+
+        request = factory.delete('/')
+        force_authenticate(request, self.user)
+        message_detail(request, message_id=message.id)
+        self.assertEqual(self._search('rewritten')['results'], [])
+
+        self._add('gone with the session', session=self.other_session)
+        self.other_session.delete()
+        self.assertEqual(self._search('session')['results'], [])
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {DOCS_TABLE}')
+                self.assertEqual(cursor.fetchone()[0], 0)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite trigger maintenance')
+    def test_migrate_restores_dropped_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER message_search_message_ad')
+        emit_post_migrate_signal(0, False, connection.alias)
+        self._add('temporary note').delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {DOCS_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_large_compressed_content_is_searchable(self):
+        message = self._add('filler line\n' * 1000 + 'needle at the end')
+        self.assertEqual(self._ids(self._search('needle')), [str(message.id)])
+
+    def test_bulk_append_is_indexed(self):
+        response = self.client.post(
+            reverse('session_add_messages_bulk', args=[self.session.id]),
+            [{'role': 'user', 'content': 'bulk alpha'}, {'role': 'assistant', 'content': 'bulk beta'}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self._search('bulk')['results']), 2)
+
+    def test_rebuild_command_indexes_existing_messages(self):
+        Message.objects.bulk_create([
+            Message(session=self.session, role='user', content='legacy row', sequence_number=100 + i)
+            for i in range(3)
+        ])
+        self.assertEqual(self._search('legacy')['results'], [])
+        out = StringIO()
+        call_command('rebuild_message_search', batch_size=2, stdout=out)
+        self.assertIn('Indexed 3 messages', out.getvalue())
+        self.assertEqual(len(self._search('legacy')['results']), 3)
+
+    def test_migration_indexes_existing_messages(self):
+        Message.objects.bulk_create([
+            Message(session=self.session, role='user', content=f'archived note {i}', sequence_number=200 + i)
+            for i in range(3)
+        ])
+        self.assertEqual(self._search('archived')['results'], [])
+        migration = ('message', '0005_backfill_message_search')
+        state = MigrationExecutor(connection).loader.project_state(migration)
+        import_module('message.migrations.0005_backfill_message_search').backfill(state.apps, connection.schema_editor())
+        self.assertEqual(len(self._search('archived')['results']), 3)
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS)
+class MessageSearchBenchmark(TestCase):
+    """Indexed search vs a LIKE scan over a large corpus (ZAPFIX_SEARCH_CORPUS messages, default 1M)"""
+
+    def test_search_latency(self):
+        corpus = int(os.environ.get('ZAPFIX_SEARCH_CORPUS', 1000000))
+        user = User.objects.create(username='bench')
+        sessions = [Session.objects.create(user=user) for _ in range(100)]
+        words = [f'word{i}' for i in range(20000)]
+        rng = random.Random(7)
+        batch = 5000
+        started = time.perf_counter()
+        for start in range(0, corpus, batch):
+            messages = Message.objects.bulk_create([
+                Message(
+                    session=sessions[i % len(sessions)], role='assistant', sequence_number=i + 1,
+                    content=' '.join(rng.choice(words) for _ in range(30))
+                )
+                for i in range(start, min(start + batch, corpus))
+            ])
+            index_messages(messages)
+        print(f'\nloaded and indexed {corpus:,} messages in {time.perf_counter() - started:.0f} s')
+
+        client = APIClient()
+        client.force_authenticate(user)
+        for term in ['word17', 'word17 word4242']:
+            started = time.perf_counter()
+            for _ in range(20):
+                response = client.get(reverse('session_message_search'), {'q': term})
+            indexed = (time.perf_counter() - started) / 20
+            started = time.perf_counter()
+            scanned = list(
+                Message.objects.filter(session__user=user, content__icontains=term.split()[0]).values_list('id', flat=True)[:20]
+            )
+            scan = time.perf_counter() - started
+            print(f'{term!r}: index {indexed * 1000:.1f} ms ({len(response.data["results"])} hits), LIKE scan {scan * 1000:.1f} ms ({len(scanned)} hits)')
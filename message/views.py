@@ -4,12 +4,12 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum
-from django.utils import timezone
+from django.db import transaction
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from .models import Message
+from .models import Message, MessageTombstone
+from session.models import Session
 from .serializers import MessageSerializer, MessageCreateSerializer, MessageUpdateSerializer
 
 
@@ -109,54 +109,57 @@ def message_list(request):
 @permission_classes([IsAuthenticated])
 def message_detail(request, message_id):
     """Get, update, or delete a specific message"""
-    message = get_object_or_404(Message, pk=message_id, session__user=request.user)
-    
     if request.method == 'GET':
+        message = get_object_or_404(Message, pk=message_id, session__user=request.user)
         serializer = MessageSerializer(message)
         return Response(serializer.data)
     
-    elif request.method == 'PUT':
-        # Full update
-        serializer = MessageUpdateSerializer(message, data=request.data)
-        if serializer.is_valid():
-            updated_message = serializer.save()
-            
-            # Update session statistics
-            session = updated_message.session
-            session.message_count = session.messages.count()
-            session.total_tokens_used = session.messages.aggregate(total=Sum('tokens_used'))['total'] or 0
-            session.last_activity_at = timezone.now()
-            session.save(update_fields=['message_count', 'total_tokens_used', 'last_activity_at'])
-            
-            response_serializer = MessageSerializer(updated_message)
-            return Response(response_serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
-    elif request.method == 'PATCH':
-        # Partial update
-        serializer = MessageUpdateSerializer(message, data=request.data, partial=True)
-        if serializer.is_valid():
-            updated_message = serializer.save()
-            
-            # Update session statistics
-            session = updated_message.session
-            session.message_count = session.messages.count()
-            session.total_tokens_used = session.messages.aggregate(total=Sum('tokens_used'))['total'] or 0
-            session.last_activity_at = timezone.now()
-            session.save(update_fields=['message_count', 'total_tokens_used', 'last_activity_at'])
-            
-            response_serializer = MessageSerializer(updated_message)
-            return Response(response_serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
-    elif request.method == 'DELETE':
-        session = message.session
-        message.delete()
+    with transaction.atomic():
+        # Lock the message so concurrent edits compute token deltas from the latest value
+        message = get_object_or_404(
+            Message.objects.select_for_update(of=('self',)),
+            pk=message_id,
+            session__user=request.user
+        )
+        previous_tokens = message.tokens_used or 0
+        
+        if request.method == 'PUT':
+            # Full update
+            serializer = MessageUpdateSerializer(message, data=request.data)
+            if serializer.is_valid():
+                updated_message = serializer.save(version=Session.allocate_version(message.session_id))
+                
+                # Update session statistics
+                Session.bump_counters(updated_message.session_id, tokens=(updated_message.tokens_used or 0) - previous_tokens)
+                
+                response_serializer = MessageSerializer(updated_message)
+                return Response(response_serializer.data)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Update session statistics after deletion
-        session.message_count = session.messages.count()
-        session.total_tokens_used = session.messages.aggregate(total=Sum('tokens_used'))['total'] or 0
-        session.last_activity_at = timezone.now()
-        session.save(update_fields=['message_count', 'total_tokens_used', 'last_activity_at'])
+        elif request.method == 'PATCH':
+            # Partial update
+            serializer = MessageUpdateSerializer(message, data=request.data, partial=True)
+            if serializer.is_valid():
+                updated_message = serializer.save(version=Session.allocate_version(message.session_id))
+                
+                # Update session statistics
+                Session.bump_counters(updated_message.session_id, tokens=(updated_message.tokens_used or 0) - previous_tokens)
+                
+                response_serializer = MessageSerializer(updated_message)
+                return Response(response_serializer.data)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        elif request.method == 'DELETE':
+            session_id = message.session_id
+            MessageTombstone.objects.create(
+                session_id=session_id,
+                message_id=message.id,
+                sequence_number=message.sequence_number,
+                version=Session.allocate_version(session_id)
+            )
+            message.delete()
+            
+            # Update session statistics after deletion
+            Session.bump_counters(session_id, messages=-1, tokens=-previous_tokens)
+            
+            return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,218 @@
+"""
+Fan-out of session events to Server-Sent Events streams.
+
+Views publish events after their transaction commits; every open stream holds a
+subscription to its session's channel and receives events on its own asyncio
+queue, so an idle stream costs a queue and a pending `await`, not a thread.
+
+The backend is chosen by settings.SESSION_EVENTS['BACKEND']. The default
+InMemoryBackend only reaches streams served by the same process; deployments
+with several workers need a backend that relays between them (e.g. over Redis
+or PostgreSQL LISTEN/NOTIFY) implementing the same subscribe/publish methods.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+DEFAULT_SESSION_EVENTS = {
+    'BACKEND': 'session.events.InMemoryBackend',
+    'KEEPALIVE_INTERVAL': 15.0,
+    'QUEUE_SIZE': 1000,
+}
+
+
+def get_config():
+    return {**DEFAULT_SESSION_EVENTS, **getattr(settings, 'SESSION_EVENTS', {})}
+
+
+def session_channel(session_id):
+    return f'session:{session_id}'
+
+
+class Subscription:
+    """A stream's view of one channel: a bounded queue filled on the stream's event loop"""
+
+    def __init__(self, backend, channel, loop, queue_size):
+        self.backend = backend
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Queue `event`; must run on `loop`. A full queue marks the subscription as overflowed"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        """Wait for the next event; raises asyncio.TimeoutError after `timeout` seconds"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def drain(self):
+        """Drop queued events and clear the overflow flag"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflowed = False
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class InMemoryBackend:
+    """
+    Delivers events to subscriptions in this process.
+
+    `publish` is safe to call from any thread: events are handed to each
+    subscriber's event loop with `call_soon_threadsafe`.
+    """
+
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, channel):
+        """Subscribe the running event loop to `channel`"""
+        subscription = Subscription(self, channel, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def has_subscribers(self, channel):
+        return bool(self._subscriptions.get(channel))
+
+    def publish(self, channel, event):
+        """Send `event` to every subscription of `channel`; returns the number reached"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        delivered = 0
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The stream's loop is closed; it will unsubscribe on its way out
+                continue
+            delivered += 1
+        return delivered
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide backend, creating it from settings.SESSION_EVENTS on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = get_config()
+                _backend = import_string(config['BACKEND'])(queue_size=config['QUEUE_SIZE'])
+    return _backend
+
+
+def publish_messages(session_id, messages):
+    """
+    Publish `messages` (new rows of one session) and the session's counters
+    once the current transaction commits.
+    """
+    def publish():
+        from .models import Session
+        from .serializers import MessageSerializer
+
+        backend = get_backend()
+        channel = session_channel(session_id)
+        if not backend.has_subscribers(channel):
+            return
+        for data in MessageSerializer(sorted(messages, key=lambda m: m.sequence_number), many=True).data:
+            backend.publish(channel, {'type': 'message', 'data': data})
+        counters = Session.objects.filter(pk=session_id).values('message_count', 'total_tokens_used', 'last_activity_at').first()
+        if counters is not None:
+            backend.publish(channel, {'type': 'session', 'data': counters})
+
+    transaction.on_commit(publish)
+
+
+def format_event(event_type, data, event_id=None):
+    """Encode one SSE frame"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append('data: ' + json.dumps(data, default=str))
+    return '\n'.join(lines) + '\n\n'
+
+
+async def _messages_after(session_id, sequence_number):
+    from message.models import Message
+    from .serializers import MessageSerializer
+
+    messages = [
+        message async for message in
+        Message.objects.filter(session_id=session_id, sequence_number__gt=sequence_number).order_by('sequence_number')
+    ]
+    return MessageSerializer(messages, many=True).data
+
+
+async def stream_session_events(session_id, last_sequence, keepalive_interval=None):
+    """
+    Yield SSE frames for a session, starting after `last_sequence`.
+
+    Messages are always emitted in sequence_number order. Published messages
+    are sent straight from the event when they are the next expected number;
+    after a gap (commits finishing out of order) or a queue overflow the stream
+    catches up from the database instead.
+    """
+    if keepalive_interval is None:
+        keepalive_interval = get_config()['KEEPALIVE_INTERVAL']
+    subscription = get_backend().subscribe(session_channel(session_id))
+    try:
+        # Subscribe first, then catch up, so nothing committed in between is lost
+        for data in await _messages_after(session_id, last_sequence):
+            last_sequence = data['sequence_number']
+            yield format_event('message', data, event_id=last_sequence)
+
+        while True:
+            try:
+                event = await subscription.get(timeout=keepalive_interval)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+
+            if subscription.overflowed:
+                subscription.drain()
+                event = None
+
+            if event is not None and event['type'] != 'message':
+                yield format_event(event['type'], event['data'])
+                continue
+
+            if event is not None:
+                sequence_number = event['data']['sequence_number']
+                if sequence_number <= last_sequence:
+                    continue
+                if sequence_number == last_sequence + 1:
+                    last_sequence = sequence_number
+                    yield format_event('message', event['data'], event_id=sequence_number)
+                    continue
+
+            for data in await _messages_after(session_id, last_sequence):
+                last_sequence = data['sequence_number']
+                yield format_event('message', data, event_id=last_sequence)
+    finally:
+        subscription.close()
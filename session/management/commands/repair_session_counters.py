@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from message.models import Message
+from session.models import Session
+
+
+class Command(BaseCommand):
+    help = "Recompute message_count and total_tokens_used for sessions whose counters drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session-id', action='append', help='Only check this session (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted sessions without fixing them')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions to fix per batch')
+
+    def handle(self, *args, **options):
+        messages = Message.objects.filter(session=OuterRef('pk')).order_by().values('session')
+        sessions = Session.objects.annotate(
+            actual_count=Coalesce(Subquery(messages.annotate(total=Count('pk')).values('total'), output_field=IntegerField()), 0),
+            actual_tokens=Coalesce(Subquery(messages.annotate(total=Sum('tokens_used')).values('total'), output_field=IntegerField()), 0),
+        ).exclude(message_count=F('actual_count'), total_tokens_used=F('actual_tokens'))
+        if options['session_id']:
+            sessions = sessions.filter(pk__in=options['session_id'])
+
+        drifted = []
+        for session in sessions.only('id', 'message_count', 'total_tokens_used').iterator(chunk_size=options['batch_size']):
+            drifted.append(session)
+            self.stdout.write(
+                f'{session.id}: message_count {session.message_count} -> {session.actual_count}, '
+                f'total_tokens_used {session.total_tokens_used} -> {session.actual_tokens}'
+            )
+
+        if not options['dry_run'] and drifted:
+            for session in drifted:
+                session.message_count = session.actual_count
+                session.total_tokens_used = session.actual_tokens
+            Session.objects.bulk_update(drifted, ['message_count', 'total_tokens_used'], batch_size=options['batch_size'])
+
+        action = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{action} {len(drifted)} drifted sessions'))
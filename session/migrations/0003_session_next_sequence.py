@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-17 13:10
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def initialize_next_sequence(apps, schema_editor):
+    Session = apps.get_model('session', 'Session')
+    Message = apps.get_model('message', 'Message')
+    highest = Message.objects.filter(session=OuterRef('pk')).order_by().values('session').annotate(
+        highest=Max('sequence_number')
+    ).values('highest')
+    Session.objects.update(next_sequence=Coalesce(Subquery(highest), 0) + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('session', '0002_rename_session_user_created_idx_session_ses_user_id_108f96_idx_and_more'),
+        ('message', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='next_sequence',
+            field=models.IntegerField(default=1, help_text='Next message sequence_number to hand out'),
+        ),
+        migrations.RunPython(initialize_next_sequence, migrations.RunPython.noop),
+    ]
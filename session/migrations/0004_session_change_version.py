@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('session', '0003_session_next_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='change_version',
+            field=models.BigIntegerField(default=0, help_text='Bumped on every message write; stamped on the written message'),
+        ),
+    ]
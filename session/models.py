@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
 import uuid
 
 
@@ -20,6 +22,8 @@ class Session(models.Model):
     last_activity_at = models.DateTimeField(auto_now=True)
     total_tokens_used = models.IntegerField(default=0)
     message_count = models.IntegerField(default=0)
+    next_sequence = models.IntegerField(default=1, help_text="Next message sequence_number to hand out")
+    change_version = models.BigIntegerField(default=0, help_text="Bumped on every message write; stamped on the written message")
 
     class Meta:
         ordering = ['-created_at']
@@ -30,7 +34,68 @@ class Session(models.Model):
     
     def __str__(self):
         return f"{self.title or 'Untitled'} - {self.status}"
-
-
-
-
+    
+    @classmethod
+    def _advance(cls, session_id, **steps):
+        """
+        Add `steps` to the given counter columns in a single UPDATE.
+        
+        Returns {column: new value}. Concurrent callers serialize on the session
+        row, so each gets a disjoint range of values.
+        """
+        columns = list(steps)
+        if connection.features.can_return_columns_from_insert:
+            # PostgreSQL and SQLite >= 3.35 support UPDATE ... RETURNING
+            quote = connection.ops.quote_name
+            assignments = ', '.join(f'{quote(column)} = {quote(column)} + %s' for column in columns)
+            returning = ', '.join(quote(column) for column in columns)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {quote(cls._meta.db_table)} SET {assignments} WHERE id = %s RETURNING {returning}',
+                    [steps[column] for column in columns] + [cls._meta.pk.get_db_prep_value(session_id, connection)]
+                )
+                row = cursor.fetchone()
+            if row is None:
+                raise cls.DoesNotExist(f'Session {session_id} does not exist')
+            return dict(zip(columns, row))
+        
+        with transaction.atomic():
+            updated = cls.objects.filter(pk=session_id).update(
+                **{column: F(column) + step for column, step in steps.items()}
+            )
+            if not updated:
+                raise cls.DoesNotExist(f'Session {session_id} does not exist')
+            return cls.objects.filter(pk=session_id).values(*columns).get()
+    
+    @classmethod
+    def allocate_sequence(cls, session_id, count=1):
+        """
+        Reserve `count` consecutive message sequence numbers for a session.
+        
+        Returns the first number of the block.
+        """
+        return cls._advance(session_id, next_sequence=count)['next_sequence'] - count
+    
+    @classmethod
+    def allocate_version(cls, session_id):
+        """Take the next change version of a session for a message edit or delete"""
+        return cls._advance(session_id, change_version=1)['change_version']
+    
+    @classmethod
+    def allocate_messages(cls, session_id, count=1):
+        """
+        Reserve sequence numbers and a change version for `count` new messages.
+        
+        Returns (first sequence number, version) from one UPDATE.
+        """
+        values = cls._advance(session_id, next_sequence=count, change_version=1)
+        return values['next_sequence'] - count, values['change_version']
+    
+    @classmethod
+    def bump_counters(cls, session_id, messages=0, tokens=0):
+        """Apply message_count/total_tokens_used deltas and mark the session active"""
+        cls.objects.filter(pk=session_id).update(
+            message_count=F('message_count') + messages,
+            total_tokens_used=F('total_tokens_used') + tokens,
+            last_activity_at=timezone.now()
+        )
@@ -40,19 +40,31 @@ class SessionListSerializer(serializers.ModelSerializer):
 
 
 class SessionDetailSerializer(serializers.ModelSerializer):
-    """Serializer for session detail with messages"""
-    messages = MessageSerializer(many=True, read_only=True)
+    """
+    Serializer for session detail with messages
+    
+    Serializes the messages passed in context['messages'] (a window chosen by
+    the view), or every message of the session when none are given.
+    """
+    messages = serializers.SerializerMethodField()
     
     class Meta:
         model = Session
         fields = [
             'id', 'title', 'status', 'created_at', 'updated_at',
-            'last_activity_at', 'total_tokens_used', 'message_count', 'messages'
+            'last_activity_at', 'total_tokens_used', 'message_count',
+            'change_version', 'messages'
         ]
         read_only_fields = [
             'id', 'created_at', 'updated_at', 'last_activity_at',
-            'total_tokens_used', 'message_count', 'messages'
+            'total_tokens_used', 'message_count', 'change_version', 'messages'
         ]
+    
+    def get_messages(self, obj):
+        messages = self.context.get('messages')
+        if messages is None:
+            messages = obj.messages.all()
+        return MessageSerializer(messages, many=True).data
 
 
 class SessionCreateSerializer(serializers.ModelSerializer):
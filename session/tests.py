@@ -1,3 +1,575 @@
-from django.test import TestCase
+import asyncio
+import os
+import threading
+import time
+import tracemalloc
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, OperationalError
+from asgiref.sync import sync_to_async
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from message.models import Message
+from message.views import message_detail
+from .events import InMemoryBackend, session_channel, stream_session_events
+from .models import Session
+
+
+TEST_SETTINGS = {
+    'AUDIT_LOG': {'ENABLED': False},
+}
+
+
+class SequenceAllocationTests(TestCase):
+    """Tests for per-session message sequence allocation"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.session = Session.objects.create(user=self.user)
+
+    def test_messages_get_consecutive_numbers_per_session(self):
+        other = Session.objects.create(user=self.user)
+        first = Message.objects.create(session=self.session, role='user', content='a')
+        Message.objects.create(session=other, role='user', content='b')
+        second = Message.objects.create(session=self.session, role='assistant', content='c')
+        self.assertEqual((first.sequence_number, second.sequence_number), (1, 2))
+        self.assertEqual(other.messages.get().sequence_number, 1)
+
+    def test_allocation_is_a_single_statement(self):
+        with self.assertNumQueries(1 if connection.features.can_return_columns_from_insert else 3):
+            Session.allocate_sequence(self.session.id)
+
+    def test_block_allocation(self):
+        self.assertEqual(Session.allocate_sequence(self.session.id, count=5), 1)
+        self.assertEqual(Session.allocate_sequence(self.session.id, count=3), 6)
+        self.assertEqual(Message.objects.create(session=self.session, role='user', content='x').sequence_number, 9)
+
+    def test_unknown_session(self):
+        with self.assertRaises(Session.DoesNotExist):
+            Session.allocate_sequence('00000000-0000-0000-0000-000000000000')
+
+
+class ConcurrentSequenceAllocationTests(TransactionTestCase):
+    """Many threads appending to one session must never share a sequence number"""
+
+    def test_no_duplicate_sequence_numbers_under_contention(self):
+        user = User.objects.create(username='agent')
+        session = Session.objects.create(user=user)
+        threads_count, per_thread = 8, 25
+        errors = []
+
+        def append():
+            try:
+                for i in range(per_thread):
+                    while True:
+                        try:
+                            Message.objects.create(session_id=session.id, role='user', content=str(i))
+                            break
+                        except OperationalError as exc:
+                            # SQLite serialises writers and reports contention as a lock error
+                            if 'locked' not in str(exc):
+                                raise
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=append) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        numbers = list(Message.objects.filter(session=session).values_list('sequence_number', flat=True))
+        self.assertEqual(len(numbers), threads_count * per_thread)
+        self.assertEqual(sorted(numbers), list(range(1, threads_count * per_thread + 1)))
+
+
+@override_settings(**TEST_SETTINGS)
+class SessionCounterTests(TestCase):
+    """Session message_count/total_tokens_used are kept with delta updates"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.session = Session.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.factory = APIRequestFactory()
+
+    def _add(self, tokens):
+        response = self.client.post(
+            reverse('session_add_message', args=[self.session.id]),
+            {'role': 'assistant', 'content': 'ok', 'tokens_used': tokens},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def _detail(self, method, message_id, data=None):
+        request = getattr(self.factory, method)('/', data, format='json')
+        force_authenticate(request, self.user)
+        return message_detail(request, message_id=message_id)
+
+    def _counters(self):
+        self.session.refresh_from_db()
+        return self.session.message_count, self.session.total_tokens_used
+
+    def test_add_edit_and_delete_apply_deltas(self):
+        first = self._add(10)
+        second = self._add(5)
+        self.assertEqual(self._counters(), (2, 15))
+
+        self.assertEqual(self._detail('patch', first, {'tokens_used': 7}).status_code, 200)
+        self.assertEqual(self._counters(), (2, 12))
+
+        self.assertEqual(self._detail('put', second, {'content': 'new', 'tokens_used': 9}).status_code, 200)
+        self.assertEqual(self._counters(), (2, 16))
+
+        self.assertEqual(self._detail('delete', first).status_code, 204)
+        self.assertEqual(self._counters(), (1, 9))
+
+    def test_add_does_not_rescan_the_session(self):
+        Message.objects.bulk_create([
+            Message(session=self.session, role='user', content='x', sequence_number=i, tokens_used=1)
+            for i in range(1, 200)
+        ])
+        with CaptureQueriesContext(connection) as ctx:
+            self._add(3)
+        scans = [q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql'] or 'SUM(' in q['sql']]
+        self.assertEqual(scans, [])
+
+    def test_repair_command_fixes_drift(self):
+        self._add(4)
+        self._add(6)
+        Session.objects.filter(pk=self.session.pk).update(message_count=99, total_tokens_used=1)
+        healthy = Session.objects.create(user=self.user)
+        out = StringIO()
+        call_command('repair_session_counters', dry_run=True, stdout=out)
+        self.assertIn('Found 1 drifted sessions', out.getvalue())
+        self.assertEqual(self._counters(), (99, 1))
+        call_command('repair_session_counters', stdout=StringIO())
+        self.assertEqual(self._counters(), (2, 10))
+        healthy.refresh_from_db()
+        self.assertEqual((healthy.message_count, healthy.total_tokens_used), (0, 0))
+
+
+@override_settings(**TEST_SETTINGS)
+class SessionMessageWindowTests(TestCase):
+    """Session detail embeds a cursor-paginated window of messages"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.session = Session.objects.create(user=self.user, next_sequence=121, message_count=120)
+        Message.objects.bulk_create([
+            Message(session=self.session, role='user', content=f'm{i}', sequence_number=i)
+            for i in range(1, 121)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('session_detail_update', args=[self.session.id])
+
+    def _sequences(self, response):
+        return [message['sequence_number'] for message in response.data['messages']]
+
+    def test_default_window_is_newest_messages(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._sequences(response), list(range(71, 121)))
+        self.assertEqual(response.data['messages_page'], {
+            'limit': 50, 'before': 71, 'after': 120,
+            'has_more_before': True, 'has_more_after': False,
+        })
+
+    def test_before_pages_backwards(self):
+        response = self.client.get(self.url, {'before': 71, 'limit': 60})
+        self.assertEqual(self._sequences(response), list(range(11, 71)))
+        self.assertTrue(response.data['messages_page']['has_more_before'])
+        self.assertTrue(response.data['messages_page']['has_more_after'])
+
+        response = self.client.get(self.url, {'before': 11, 'limit': 60})
+        self.assertEqual(self._sequences(response), list(range(1, 11)))
+        self.assertFalse(response.data['messages_page']['has_more_before'])
+
+    def test_after_pages_forwards(self):
+        response = self.client.get(self.url, {'after': 100, 'limit': 15})
+        self.assertEqual(self._sequences(response), list(range(101, 116)))
+        self.assertTrue(response.data['messages_page']['has_more_before'])
+        self.assertTrue(response.data['messages_page']['has_more_after'])
+
+        response = self.client.get(self.url, {'after': 120})
+        self.assertEqual(response.data['messages'], [])
+        self.assertEqual(response.data['messages_page']['after'], 120)
+        self.assertFalse(response.data['messages_page']['has_more_after'])
+
+    def test_messages_all_keeps_full_transcript(self):
+        response = self.client.get(self.url, {'messages': 'all'})
+        self.assertEqual(self._sequences(response), list(range(1, 121)))
+        self.assertNotIn('messages_page', response.data)
+
+    def test_limit_is_clamped_and_cursors_validated(self):
+        response = self.client.get(self.url, {'limit': 10000})
+        self.assertEqual(response.data['messages_page']['limit'], 200)
+        self.assertEqual(len(response.data['messages']), 120)
+        self.assertEqual(self.client.get(self.url, {'before': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'before': 5, 'after': 1}).status_code, 400)
+
+    def test_window_query_does_not_load_whole_session(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url, {'limit': 5})
+        message_queries = [q['sql'] for q in ctx.captured_queries if Message._meta.db_table in q['sql']]
+        self.assertTrue(message_queries)
+        self.assertTrue(all('LIMIT' in sql for sql in message_queries), message_queries)
+
+    def test_patch_returns_window(self):
+        response = self.client.patch(self.url, {'title': 'renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'renamed')
+        self.assertEqual(len(response.data['messages']), 50)
+
+
+@override_settings(**TEST_SETTINGS)
+class SessionSyncTests(TestCase):
+    """Incremental sync returns only what changed since the client's cursors"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.session = Session.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.factory = APIRequestFactory()
+        self.url = reverse('session_sync', args=[self.session.id])
+
+    def _add(self, content):
+        response = self.client.post(
+            reverse('session_add_message', args=[self.session.id]),
+            {'role': 'assistant', 'content': content, 'tokens_used': 1},
+            format='json'
+        )
+        return response.data['id']
+
+    def _detail(self, method, message_id, data=None):
+        request = getattr(self.factory, method)('/', data, format='json')
+        force_authenticate(request, self.user)
+        return message_detail(request, message_id=message_id)
+
+    def _sync(self, after, since_version, **params):
+        response = self.client.get(self.url, {'after': after, 'since_version': since_version, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_initial_sync_returns_everything(self):
+        self._add('a')
+        self._add('b')
+        data = self._sync(0, 0)
+        self.assertEqual([m['content'] for m in data['messages']], ['a', 'b'])
+        self.assertEqual((data['after'], data['version'], data['has_more']), (2, 2, False))
+        self.assertEqual((data['updated'], data['deleted']), ([], []))
+
+    def test_sync_returns_only_changes(self):
+        first = self._add('a')
+        second = self._add('b')
+        cursor = self._sync(0, 0)
+
+        self._detail('patch', first, {'content': 'a2'})
+        self._detail('delete', second)
+        self._add('c')
+        data = self._sync(cursor['after'], cursor['version'])
+        self.assertEqual([m['content'] for m in data['messages']], ['c'])
+        self.assertEqual([m['content'] for m in data['updated']], ['a2'])
+        self.assertEqual(data['deleted'], [second])
+        self.assertEqual(data['after'], 3)
+
+        data = self._sync(data['after'], data['version'])
+        self.assertEqual((data['messages'], data['updated'], data['deleted']), ([], [], []))
+
+    def test_sync_pages_new_messages(self):
+        for i in range(5):
+            self._add(str(i))
+        data = self._sync(0, 0, limit=3)
+        self.assertEqual([m['sequence_number'] for m in data['messages']], [1, 2, 3])
+        self.assertTrue(data['has_more'])
+        data = self._sync(data['after'], data['version'], limit=3)
+        self.assertEqual([m['sequence_number'] for m in data['messages']], [4, 5])
+        self.assertFalse(data['has_more'])
+
+    def test_session_detail_exposes_version(self):
+        self._add('a')
+        response = self.client.get(reverse('session_detail_update', args=[self.session.id]))
+        self.assertEqual(response.data['change_version'], 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'after': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(**TEST_SETTINGS)
+class BulkMessageAppendTests(TestCase):
+    """Batch append allocates one block of sequence numbers in one transaction"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.session = Session.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('session_add_messages_bulk', args=[self.session.id])
+
+    def _turn(self, count=3):
+        return [{'role': 'assistant', 'content': f'm{i}', 'tokens_used': i + 1} for i in range(count)]
+
+    def test_appends_in_order_and_updates_counters(self):
+        Message.objects.create(session=self.session, role='user', content='first')
+        response = self.client.post(self.url, {'messages': self._turn()}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([m['sequence_number'] for m in response.data], [2, 3, 4])
+        self.assertEqual(
+            list(Message.objects.filter(session=self.session).values_list('content', flat=True)),
+            ['first', 'm0', 'm1', 'm2']
+        )
+        self.session.refresh_from_db()
+        self.assertEqual((self.session.message_count, self.session.total_tokens_used, self.session.next_sequence), (3, 6, 5))
+
+        # Single appends continue after the block
+        response = self.client.post(reverse('session_add_message', args=[self.session.id]), {'role': 'user', 'content': 'next'}, format='json')
+        self.assertEqual(response.data['sequence_number'], 5)
+
+    def test_batch_uses_constant_queries(self):
+        def queries_for(count):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.post(self.url, self._turn(count), format='json').status_code, 201)
+            return len(ctx.captured_queries)
+        queries_for(1)
+        self.assertEqual(queries_for(2), queries_for(50))
+
+    def test_invalid_item_rejects_whole_batch(self):
+        records = self._turn() + [{'role': 'robot', 'content': 'x'}]
+        response = self.client.post(self.url, {'messages': records}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['index'] for result in response.data['results']], [3])
+        self.assertIn('role', response.data['results'][0]['errors'])
+        self.assertFalse(Message.objects.filter(session=self.session).exists())
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.next_sequence, 1)
+
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.client.post(self.url, {'messages': []}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, self._turn(501), format='json').status_code, 400)
+
+    def test_other_users_session_is_not_found(self):
+        other = Session.objects.create(user=User.objects.create(username='other'))
+        response = self.client.post(reverse('session_add_messages_bulk', args=[other.id]), self._turn(), format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+def _event_ids(frames):
+    return [int(line[4:]) for frame in frames for line in frame.splitlines() if line.startswith('id: ')]
+
+
+@override_settings(**TEST_SETTINGS)
+class SessionEventStreamTests(TestCase):
+    """SSE stream delivers new messages in sequence_number order"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.session = Session.objects.create(user=self.user)
+        for content in ['a', 'b', 'c']:
+            Message.objects.create(session=self.session, role='user', content=content)
+        self.backend = InMemoryBackend()
+        patcher = mock.patch('session.events._backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _add(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('session_add_message', args=[self.session.id]),
+                {'role': 'assistant', 'content': content, 'tokens_used': 2},
+                format='json'
+            )
+        return response.data
+
+    async def _next(self, stream):
+        return await asyncio.wait_for(stream.__anext__(), 5)
+
+    async def test_stream_delivers_in_sequence_order(self):
+        stream = stream_session_events(self.session.id, 0, keepalive_interval=5)
+        frames = [await self._next(stream) for _ in range(3)]
+        self.assertEqual(_event_ids(frames), [1, 2, 3])
+        self.assertTrue(self.backend.has_subscribers(session_channel(self.session.id)))
+
+        # Commits can publish out of order; the stream fills the gap from the database
+        fourth = await Message.objects.acreate(session=self.session, role='user', content='d')
+        fifth = await Message.objects.acreate(session=self.session, role='user', content='e')
+        channel = session_channel(self.session.id)
+        for message in [fifth, fourth]:
+            self.backend.publish(channel, {'type': 'message', 'data': {'sequence_number': message.sequence_number}})
+        frames = [await self._next(stream) for _ in range(2)]
+        self.assertEqual(_event_ids(frames), [4, 5])
+        self.assertIn('"content": "e"', frames[1])
+
+        # A message appended through the API arrives with the counters
+        await sync_to_async(self._add)('f')
+        message_frame = await self._next(stream)
+        counters_frame = await self._next(stream)
+        self.assertEqual(_event_ids([message_frame]), [6])
+        self.assertIn('event: session', counters_frame)
+        self.assertIn('"message_count": 1', counters_frame)
+
+        await stream.aclose()
+        self.assertFalse(self.backend.has_subscribers(channel))
+
+    async def test_overflow_catches_up_from_database(self):
+        self.backend.queue_size = 1
+        stream = stream_session_events(self.session.id, 3, keepalive_interval=5)
+        keepalive = asyncio.ensure_future(self._next(stream))
+        await asyncio.sleep(0.05)
+        channel = session_channel(self.session.id)
+        for content in ['d', 'e']:
+            message = await Message.objects.acreate(session=self.session, role='user', content=content)
+            self.backend.publish(channel, {'type': 'message', 'data': {'sequence_number': message.sequence_number}})
+        frames = [await keepalive, await self._next(stream)]
+        self.assertEqual(_event_ids(frames), [4, 5])
+        await stream.aclose()
+
+    async def test_keepalive_when_idle(self):
+        stream = stream_session_events(self.session.id, 3, keepalive_interval=0.01)
+        self.assertEqual(await self._next(stream), ': keepalive\n\n')
+        await stream.aclose()
+
+    async def test_view_requires_token_and_resumes_from_last_event_id(self):
+        url = reverse('session_events', args=[self.session.id])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 401)
+
+        token = str(AccessToken.for_user(self.user))
+        response = await self.async_client.get(url, headers={'Authorization': f'Bearer {token}', 'Last-Event-ID': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        first = await asyncio.wait_for(anext(content), 5)
+        self.assertEqual(_event_ids([first.decode()]), [2])
+        await content.aclose()
+
+        other = await sync_to_async(User.objects.create)(username='other')
+        token = str(AccessToken.for_user(other))
+        response = await self.async_client.get(url, headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 404)
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS)
+class SessionCounterBenchmark(TestCase):
+    """Per-append latency should not depend on how long the session already is"""
+
+    def test_append_cost_is_flat_in_session_length(self):
+        user = User.objects.create(username='bench')
+        client = APIClient()
+        client.force_authenticate(user)
+        appends = 200
+        for length in [10, 1000, 10000, 50000]:
+            session = Session.objects.create(user=user, next_sequence=length + 1, message_count=length)
+            Message.objects.bulk_create([
+                Message(session=session, role='user', content='x', sequence_number=i + 1, tokens_used=1)
+                for i in range(length)
+            ], batch_size=2000)
+            url = reverse('session_add_message', args=[session.id])
+            started = time.perf_counter()
+            for _ in range(appends):
+                client.post(url, {'role': 'assistant', 'content': 'ok', 'tokens_used': 2}, format='json')
+            elapsed = (time.perf_counter() - started) / appends
+            print(f'\nsession length {length:>6}: {elapsed * 1000:.2f} ms per append')
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS)
+class SessionDetailMemoryBenchmark(TestCase):
+    """Peak memory of a session detail request on a long session"""
+
+    def test_window_vs_full_transcript(self):
+        user = User.objects.create(username='bench')
+        client = APIClient()
+        client.force_authenticate(user)
+        length = 50000
+        session = Session.objects.create(user=user, next_sequence=length + 1, message_count=length)
+        Message.objects.bulk_create([
+            Message(session=session, role='assistant', content='x' * 200, sequence_number=i + 1)
+            for i in range(length)
+        ], batch_size=2000)
+        url = reverse('session_detail_update', args=[session.id])
+        for params in [{}, {'messages': 'all'}]:
+            tracemalloc.start()
+            started = time.perf_counter()
+            response = client.get(url, params)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(response.status_code, 200)
+            label = params.get('messages', 'window')
+            print(f'\n{length} messages, {label:>6}: {elapsed * 1000:.0f} ms, peak {peak / 2 ** 20:.1f} MiB')
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS)
+class SessionEventStreamBenchmark(TestCase):
+    """Memory held by idle streams and the cost of fanning one event out to them"""
+
+    async def test_idle_streams(self):
+        user = await sync_to_async(User.objects.create)(username='bench')
+        session = await Session.objects.acreate(user=user)
+        backend = InMemoryBackend()
+        count = 5000
+        with mock.patch('session.events._backend', backend):
+            tracemalloc.start()
+            streams = [stream_session_events(session.id, 0, keepalive_interval=60) for _ in range(count)]
+            tasks = [asyncio.ensure_future(stream.__anext__()) for stream in streams]
+            while len(backend._subscriptions[session_channel(session.id)]) < count:
+                await asyncio.sleep(0.01)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            message = await Message.objects.acreate(session=session, role='user', content='x')
+            started = time.perf_counter()
+            backend.publish(session_channel(session.id), {'type': 'message', 'data': {'sequence_number': message.sequence_number, 'content': 'x'}})
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+            for stream in streams:
+                await stream.aclose()
+        print(f'\n{count} idle streams: peak {peak / 2 ** 20:.1f} MiB ({peak / count / 1024:.1f} KiB each), fan-out {elapsed * 1000:.0f} ms')
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS)
+class BulkMessageAppendBenchmark(TestCase):
+    """Messages/sec through single appends and the batch endpoint"""
+
+    def test_bulk_vs_single_throughput(self):
+        user = User.objects.create(username='bench')
+        client = APIClient()
+        client.force_authenticate(user)
+        total = 2000
+        record = {'role': 'assistant', 'content': 'x' * 200, 'tokens_used': 5}
+
+        session = Session.objects.create(user=user)
+        url = reverse('session_add_message', args=[session.id])
+        started = time.perf_counter()
+        for _ in range(total):
+            client.post(url, record, format='json')
+        single = total / (time.perf_counter() - started)
+
+        for batch in [5, 50, 500]:
+            session = Session.objects.create(user=user)
+            url = reverse('session_add_messages_bulk', args=[session.id])
+            started = time.perf_counter()
+            for _ in range(total // batch):
+                client.post(url, {'messages': [record] * batch}, format='json')
+            rate = total / (time.perf_counter() - started)
+            print(f'\nbatch of {batch:>3}: {rate:,.0f} messages/s ({rate / single:.1f}x single)')
+        print(f'single appends: {single:,.0f} messages/s')
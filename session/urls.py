@@ -3,6 +3,10 @@ from . import views
 
 urlpatterns = [
     path('', views.session_list_create, name='session_list_create'),  # GET: List, POST: Create
+    path('search/', views.session_message_search, name='session_message_search'),  # GET: Search messages
     path('<uuid:session_id>/', views.session_detail_update, name='session_detail_update'),  # GET: Detail, PATCH: Update
     path('<uuid:session_id>/messages/', views.session_add_message, name='session_add_message'),  # POST: Add message
+    path('<uuid:session_id>/messages/bulk/', views.session_add_messages_bulk, name='session_add_messages_bulk'),  # POST: Add messages
+    path('<uuid:session_id>/sync/', views.session_sync, name='session_sync'),  # GET: Changes since a cursor
+    path('<uuid:session_id>/events/', views.session_events, name='session_events'),  # GET: SSE stream (ASGI)
 ]
@@ -3,12 +3,24 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import AuthenticationFailed
+from users.authentication import RoleClaimsJWTAuthentication
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.views.decorators.http import require_GET
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from .models import Session
-from message.models import Message
+from message.models import Message, MessageTombstone
+from message.search import index_messages, search_messages
+from Activitylogs.models import DailyUserActivity
+from Activitylogs.audit import log_activity
+from zapfix_backend.filters import DateRangeFilter
+from .events import publish_messages, stream_session_events
 from .serializers import (
     SessionListSerializer,
     SessionDetailSerializer,
@@ -77,14 +89,91 @@ def session_list_create(request):
         # Create new session
         serializer = SessionCreateSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            session = serializer.save()
+            with transaction.atomic():
+                session = serializer.save()
+                DailyUserActivity.record(request.user.id, at=session.created_at, sessions_created=1)
+            log_activity(request, 'session_start', metadata={'session_id': str(session.id)})
             response_serializer = SessionListSerializer(session)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+MESSAGE_WINDOW_SIZE = 50
+MESSAGE_WINDOW_MAX_SIZE = 200
+
+
+def _message_window(request, session):
+    """
+    Pick the messages to embed in a session detail response.
+    
+    Returns (messages, page, error). By default the newest `limit` messages are
+    returned; `before`/`after` page backwards/forwards from a sequence_number
+    using the (session, sequence_number) index, and `messages=all` keeps the old
+    behaviour of embedding the whole transcript (page is then None).
+    """
+    if request.GET.get('messages') == 'all':
+        return None, None, None
+    
+    try:
+        limit = int(request.GET.get('limit', MESSAGE_WINDOW_SIZE))
+    except (ValueError, TypeError):
+        limit = MESSAGE_WINDOW_SIZE
+    limit = max(1, min(limit, MESSAGE_WINDOW_MAX_SIZE))
+    
+    before = request.GET.get('before')
+    after = request.GET.get('after')
+    if before and after:
+        return None, None, 'Use either before or after, not both'
+    try:
+        before = int(before) if before else None
+        after = int(after) if after else None
+    except (ValueError, TypeError):
+        return None, None, 'before and after must be sequence numbers'
+    
+    messages = Message.objects.filter(session=session)
+    if after is not None:
+        window = list(messages.filter(sequence_number__gt=after).order_by('sequence_number')[:limit + 1])
+        has_more_after = len(window) > limit
+        window = window[:limit]
+        has_more_before = messages.filter(sequence_number__lte=after).exists()
+    else:
+        if before is not None:
+            messages_before = messages.filter(sequence_number__lt=before)
+        else:
+            messages_before = messages
+        window = list(messages_before.order_by('-sequence_number')[:limit + 1])
+        has_more_before = len(window) > limit
+        window = window[:limit][::-1]
+        has_more_after = before is not None and messages.filter(sequence_number__gte=before).exists()
+    
+    page = {
+        'limit': limit,
+        'before': window[0].sequence_number if window else before,
+        'after': window[-1].sequence_number if window else after,
+        'has_more_before': has_more_before,
+        'has_more_after': has_more_after,
+    }
+    return window, page, None
+
+
+def _session_detail_response(request, session):
+    messages, page, error = _message_window(request, session)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+    data = SessionDetailSerializer(session, context={'messages': messages}).data
+    if page is not None:
+        data['messages_page'] = page
+    return Response(data)
+
+
 @swagger_auto_schema(
     method='get',
+    manual_parameters=[
+        openapi.Parameter('limit', openapi.IN_QUERY, description=f'Messages to return (default {MESSAGE_WINDOW_SIZE}, max {MESSAGE_WINDOW_MAX_SIZE})', type=openapi.TYPE_INTEGER),
+        openapi.Parameter('before', openapi.IN_QUERY, description='Return messages with a lower sequence_number', type=openapi.TYPE_INTEGER),
+        openapi.Parameter('after', openapi.IN_QUERY, description='Return messages with a higher sequence_number', type=openapi.TYPE_INTEGER),
+        openapi.Parameter('messages', openapi.IN_QUERY, description="Pass 'all' to embed the whole transcript", type=openapi.TYPE_STRING, enum=['all']),
+    ],
     responses={200: openapi.Response('Session details', SessionDetailSerializer)},
     tags=['Sessions'],
     security=[{'Bearer': []}]
@@ -102,21 +191,19 @@ def session_list_create(request):
 @api_view(['GET', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def session_detail_update(request, session_id):
-    """Get session with messages (GET) or Update session (PATCH)"""
+    """Get session with a window of its messages (GET) or Update session (PATCH)"""
     session = get_object_or_404(Session, pk=session_id, user=request.user)
     
     if request.method == 'GET':
-        # Get session with all messages
-        serializer = SessionDetailSerializer(session)
-        return Response(serializer.data)
+        # Get session with the requested window of messages
+        return _session_detail_response(request, session)
     
     elif request.method == 'PATCH':
         # Update session
         serializer = SessionUpdateSerializer(session, data=request.data, partial=True)
         if serializer.is_valid():
             session = serializer.save()
-            response_serializer = SessionDetailSerializer(session)
-            return Response(response_serializer.data)
+            return _session_detail_response(request, session)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -138,16 +225,290 @@ def session_add_message(request, session_id):
     
     serializer = MessageCreateSerializer(data=request.data)
     if serializer.is_valid():
-        message = serializer.save(session=session)
-        
-        # Update session statistics
-        from django.db.models import Sum
-        from django.utils import timezone
-        session.message_count = session.messages.count()
-        session.total_tokens_used = session.messages.aggregate(total=Sum('tokens_used'))['total'] or 0
-        session.last_activity_at = timezone.now()
-        session.save(update_fields=['message_count', 'total_tokens_used', 'last_activity_at'])
+        with transaction.atomic():
+            message = serializer.save(session=session)
+            
+            # Update session statistics
+            Session.bump_counters(session.id, messages=1, tokens=message.tokens_used or 0)
+            
+            DailyUserActivity.record(request.user.id, at=message.created_at, messages=1)
+            
+            # Push to open event streams once committed
+            publish_messages(session.id, [message])
+        log_activity(request, 'message_sent', metadata={'session_id': str(session.id), 'message_id': str(message.id), 'role': message.role})
         
         response_serializer = MessageSerializer(message)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+MESSAGES_BULK_MAX_RECORDS = 500
+
+
+@swagger_auto_schema(
+    method='post',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['messages'],
+        properties={
+            'messages': openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                description=f'Up to {MESSAGES_BULK_MAX_RECORDS} messages in transcript order, same fields as POST /api/sessions/{{session_id}}/messages/'
+            ),
+        }
+    ),
+    responses={
+        201: openapi.Response('Messages added', MessageSerializer(many=True)),
+        400: openapi.Response('Bad request - validation errors per message; nothing was added')
+    },
+    tags=['Sessions'],
+    security=[{'Bearer': []}]
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def session_add_messages_bulk(request, session_id):
+    """Append a batch of messages to a session, all or nothing"""
+    session = get_object_or_404(Session, pk=session_id, user=request.user)
+    
+    records = request.data.get('messages') if isinstance(request.data, dict) else request.data
+    if not isinstance(records, list) or not records:
+        return Response({
+            'error': 'messages must be a non-empty list'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if len(records) > MESSAGES_BULK_MAX_RECORDS:
+        return Response({
+            'error': f'At most {MESSAGES_BULK_MAX_RECORDS} messages can be sent at once'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Validate every message with the single-message serializer
+    valid = []
+    errors = []
+    for index, record in enumerate(records):
+        serializer = MessageCreateSerializer(data=record)
+        if serializer.is_valid():
+            valid.append(serializer.validated_data)
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+    if errors:
+        return Response({
+            'error': 'No messages were added',
+            'results': errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    with transaction.atomic():
+        # One UPDATE reserves the whole block of sequence numbers
+        first_sequence, version = Session.allocate_messages(session.id, count=len(records))
+        messages = [
+            Message(session=session, sequence_number=first_sequence + offset, version=version, **data)
+            for offset, data in enumerate(valid)
+        ]
+        Message.objects.bulk_create(messages)
+        index_messages(messages)
+        
+        # Update session statistics once for the batch
+        tokens = sum(message.tokens_used or 0 for message in messages)
+        Session.bump_counters(session.id, messages=len(messages), tokens=tokens)
+        
+        DailyUserActivity.record(request.user.id, at=messages[0].created_at, messages=len(messages))
+        
+        # Push to open event streams once committed
+        publish_messages(session.id, messages)
+    log_activity(request, 'message_sent', metadata={'session_id': str(session.id), 'messages': len(messages), 'first_sequence': first_sequence})
+    
+    response_serializer = MessageSerializer(messages, many=True)
+    return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, description='Words to search for', type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('session_id', openapi.IN_QUERY, description='Only search this session', type=openapi.TYPE_STRING, format=openapi.FORMAT_UUID),
+        openapi.Parameter('role', openapi.IN_QUERY, description='Filter by role', type=openapi.TYPE_STRING, enum=['user', 'assistant', 'system']),
+        openapi.Parameter('date_from', openapi.IN_QUERY, description='Start date (YYYY-MM-DD)', type=openapi.TYPE_STRING),
+        openapi.Parameter('date_to', openapi.IN_QUERY, description='End date (YYYY-MM-DD)', type=openapi.TYPE_STRING),
+        openapi.Parameter('tz', openapi.IN_QUERY, description='IANA timezone the dates are interpreted in (default UTC)', type=openapi.TYPE_STRING),
+        openapi.Parameter('limit', openapi.IN_QUERY, description=f'Results per page (default {SEARCH_PAGE_SIZE}, max {SEARCH_MAX_PAGE_SIZE})', type=openapi.TYPE_INTEGER),
+        openapi.Parameter('offset', openapi.IN_QUERY, description='Results to skip', type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: openapi.Response('Ranked matching messages with highlighted snippets')},
+    tags=['Sessions'],
+    security=[{'Bearer': []}]
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def session_message_search(request):
+    """Full-text search over the user's messages, best match first"""
+    query = (request.GET.get('q') or '').strip()
+    if not query:
+        return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        limit = int(request.GET.get('limit', SEARCH_PAGE_SIZE))
+        offset = int(request.GET.get('offset', 0))
+    except (ValueError, TypeError):
+        return Response({'error': 'limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    
+    # Filter by session_id
+    session_id = request.GET.get('session_id') or None
+    if session_id:
+        try:
+            session_id = Session._meta.pk.to_python(session_id)
+        except ValidationError:
+            return Response({'error': 'session_id must be a UUID'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Filter by role
+    role = request.GET.get('role')
+    if role not in ['user', 'assistant', 'system']:
+        role = None
+    
+    hits = search_messages(
+        request.user, query,
+        session_id=session_id,
+        role=role,
+        date_range=DateRangeFilter.from_request(request),
+        limit=limit + 1,
+        offset=offset
+    )
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    
+    messages = Message.objects.select_related('session').only(
+        'id', 'role', 'sequence_number', 'created_at', 'session__id', 'session__title'
+    ).in_bulk([message_id for message_id, _, _ in hits])
+    results = []
+    for message_id, rank, snippet in hits:
+        message = messages.get(message_id)
+        if message is None:
+            continue
+        results.append({
+            'id': str(message.id),
+            'session_id': str(message.session.id),
+            'session_title': message.session.title,
+            'role': message.role,
+            'sequence_number': message.sequence_number,
+            'created_at': message.created_at.isoformat(),
+            'rank': rank,
+            'snippet': snippet,
+        })
+    
+    return Response({
+        'query': query,
+        'results': results,
+        'next_offset': offset + limit if has_more else None,
+    })
+
+
+SYNC_PAGE_SIZE = 200
+SYNC_MAX_PAGE_SIZE = 1000
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('after', openapi.IN_QUERY, description='Highest sequence_number the client already has (default 0)', type=openapi.TYPE_INTEGER),
+        openapi.Parameter('since_version', openapi.IN_QUERY, description='change_version the client last synced to (default 0)', type=openapi.TYPE_INTEGER),
+        openapi.Parameter('limit', openapi.IN_QUERY, description=f'New messages to return (default {SYNC_PAGE_SIZE}, max {SYNC_MAX_PAGE_SIZE})', type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: openapi.Response('Messages changed since the given cursors')},
+    tags=['Sessions'],
+    security=[{'Bearer': []}]
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def session_sync(request, session_id):
+    """
+    Incremental sync of a session's messages.
+    
+    Returns messages appended after `after`, plus messages at or below `after`
+    that were edited or deleted after `since_version`. Clients pass back the
+    returned `after` and `version` on the next poll.
+    """
+    # The version is read before the messages, so anything written after this
+    # point is picked up again on the next poll
+    session = get_object_or_404(Session, pk=session_id, user=request.user)
+    
+    try:
+        after = int(request.GET.get('after', 0))
+        since_version = int(request.GET.get('since_version', 0))
+    except (ValueError, TypeError):
+        return Response({'error': 'after and since_version must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = int(request.GET.get('limit', SYNC_PAGE_SIZE))
+    except (ValueError, TypeError):
+        limit = SYNC_PAGE_SIZE
+    limit = max(1, min(limit, SYNC_MAX_PAGE_SIZE))
+    
+    # New messages, oldest first
+    new_messages = list(
+        Message.objects.filter(session=session, sequence_number__gt=after)
+        .order_by('sequence_number')[:limit + 1]
+    )
+    has_more = len(new_messages) > limit
+    new_messages = new_messages[:limit]
+    
+    # Edits and deletes of messages the client already has
+    updated = []
+    deleted = []
+    if since_version < session.change_version:
+        updated = Message.objects.filter(
+            session=session, version__gt=since_version, sequence_number__lte=after
+        ).order_by('sequence_number')
+        deleted = MessageTombstone.objects.filter(
+            session=session, version__gt=since_version, sequence_number__lte=after
+        ).order_by('version').values_list('message_id', flat=True)
+    
+    return Response({
+        'version': session.change_version,
+        'after': new_messages[-1].sequence_number if new_messages else after,
+        'has_more': has_more,
+        'message_count': session.message_count,
+        'total_tokens_used': session.total_tokens_used,
+        'messages': MessageSerializer(new_messages, many=True).data,
+        'updated': MessageSerializer(updated, many=True).data,
+        'deleted': [str(message_id) for message_id in deleted],
+    })
+
+
+@require_GET
+async def session_events(request, session_id):
+    """
+    Server-Sent Events stream of a session's new messages and counters.
+    
+    Async view meant to be served over ASGI, where an idle stream holds no
+    thread. Authenticates with the same `Authorization: Bearer` JWT as the API.
+    Resumes after the `Last-Event-ID` header (or `after` query parameter) when
+    given, otherwise starts with messages appended from now on.
+    """
+    try:
+        authenticated = await sync_to_async(RoleClaimsJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as exc:
+        return JsonResponse({'detail': str(exc.detail)}, status=401)
+    if authenticated is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    user = authenticated[0]
+    
+    session = await Session.objects.filter(pk=session_id, user=user).values('next_sequence').afirst()
+    if session is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    try:
+        last_sequence = int(last_event_id) if last_event_id else session['next_sequence'] - 1
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Last-Event-ID must be a sequence number'}, status=400)
+    
+    response = StreamingHttpResponse(
+        stream_session_events(session_id, last_sequence),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,207 @@
+"""
+JWT authentication for the API.
+
+Every authenticated request used to load its user with `SELECT ... FROM
+auth_user WHERE id = ?`. RoleClaimsJWTAuthentication resolves users through
+UserCache, a bounded per-process LRU whose entries expire after MAX_STALENESS
+seconds. Saving or deleting a User or UserProfile drops the entry in the
+process that made the change (see users/signals.py); other processes, and
+changes that bypass signals such as `QuerySet.update(is_active=False)`, are
+picked up once the entry expires, so MAX_STALENESS bounds how long a
+deactivated user keeps access. The user is loaded together with its
+profile's role_version, so the same bound applies to role changes.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+from copy import copy
+
+from django.conf import settings
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .tokens import ADMIN_ID_CLAIM, ROLE_CLAIM, ROLE_VERSION_CLAIM
+
+DEFAULT_AUTH_USER_CACHE = {
+    'ENABLED': True,
+    'MAX_SIZE': 10000,
+    'MAX_STALENESS': 30.0,
+}
+
+
+class UserCache:
+    """
+    Thread-safe LRU of user objects keyed on user id, with a time-to-live.
+
+    Ids are keyed as strings, the form they take in the token claim. Entries
+    are stored without cached relations and `get` hands out copies, so
+    per-request attributes and relations never leak between requests.
+    """
+
+    def __init__(self, max_size=10000, max_staleness=30.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.max_staleness = max_staleness
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def get(self, user_id):
+        """The cached user (a copy), or None when absent or older than `max_staleness`"""
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            loaded_at, user = entry
+            if self._clock() - loaded_at > self.max_staleness:
+                del self._entries[user_id]
+                self.counters['misses'] += 1
+                self.counters['expired'] += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.counters['hits'] += 1
+        return copy(user)
+
+    def set(self, user_id, user):
+        user_id = str(user_id)
+        user = copy(user)
+        user._state.fields_cache = {}
+        with self._lock:
+            self._entries[user_id] = (self._clock(), user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(str(user_id), None) is not None:
+                self.counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def record_latency(self, hit, seconds):
+        with self._lock:
+            kind = 'hit' if hit else 'miss'
+            self.counters[f'{kind}_seconds'] += seconds
+            self.counters[f'{kind}_lookups'] += 1
+
+    def stats(self):
+        """Return cache counters and mean user resolution latency for monitoring"""
+        with self._lock:
+            counters = Counter(self.counters)
+            size = len(self._entries)
+        lookups = counters['hits'] + counters['misses']
+        return {
+            'size': size,
+            'max_size': self.max_size,
+            'max_staleness': self.max_staleness,
+            'hits': counters['hits'],
+            'misses': counters['misses'],
+            'hit_rate': counters['hits'] / lookups if lookups else None,
+            'expired': counters['expired'],
+            'evictions': counters['evictions'],
+            'invalidations': counters['invalidations'],
+            'avg_hit_ms': _mean_ms(counters['hit_seconds'], counters['hit_lookups']),
+            'avg_miss_ms': _mean_ms(counters['miss_seconds'], counters['miss_lookups']),
+        }
+
+
+def _mean_ms(seconds, count):
+    return round(seconds * 1000 / count, 4) if count else None
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def auth_user_cache_settings():
+    return {**DEFAULT_AUTH_USER_CACHE, **getattr(settings, 'AUTH_USER_CACHE', {})}
+
+
+def get_user_cache():
+    """Return the process-wide user cache, creating it from settings.AUTH_USER_CACHE on first use"""
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                config = auth_user_cache_settings()
+                _user_cache = UserCache(max_size=config['MAX_SIZE'], max_staleness=config['MAX_STALENESS'])
+    return _user_cache
+
+
+class RoleClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves users through UserCache and exposes the
+    token's role claims as `user.role_claims`.
+
+    Tokens carrying role claims from before the user's last role change (an
+    older `role_version`) are rejected, so clients refresh and receive the
+    current role (see users/tokens.py). A token newer than the cached user
+    was refreshed after a change made elsewhere, so the user is reloaded
+    before comparing.
+    """
+
+    def get_user(self, validated_token):
+        user = self._cached_user(validated_token)
+        if ROLE_CLAIM in validated_token:
+            token_version = validated_token.get(ROLE_VERSION_CLAIM, 0)
+            if user.role_version is None or token_version > user.role_version:
+                get_user_cache().invalidate(user.pk)
+                user = self._cached_user(validated_token)
+            if user.role_version is None or token_version != user.role_version:
+                raise InvalidToken('Token was issued before a role change; refresh it')
+            user.role_claims = {
+                ROLE_CLAIM: validated_token[ROLE_CLAIM],
+                ADMIN_ID_CLAIM: validated_token.get(ADMIN_ID_CLAIM),
+            }
+        return user
+
+    def _cached_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+        if not auth_user_cache_settings()['ENABLED']:
+            return self._load_user(validated_token, user_id)
+
+        user_cache = get_user_cache()
+        started = time.perf_counter()
+        user = user_cache.get(user_id)
+        if user is None:
+            user = self._load_user(validated_token, user_id)
+            user_cache.set(user_id, user)
+            user_cache.record_latency(False, time.perf_counter() - started)
+            return user
+
+        self._check_user(validated_token, user)
+        user_cache.record_latency(True, time.perf_counter() - started)
+        return user
+
+    def _load_user(self, validated_token, user_id):
+        """The user with its profile's `role_version` (None without a profile), in one query"""
+        try:
+            user = self.user_model.objects.annotate(role_version=F('profile__role_version')).get(
+                **{api_settings.USER_ID_FIELD: user_id}
+            )
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found') from e
+        self._check_user(validated_token, user)
+        return user
+
+    def _check_user(self, validated_token, user):
+        """JWTAuthentication's active and revocation checks"""
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
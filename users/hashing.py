@@ -0,0 +1,41 @@
+"""
+Password hashing across worker processes, for bulk provisioning.
+
+Kept free of model imports: spawned workers import this module, and only need
+the pickled hasher, not Django settings or the app registry.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from django.contrib.auth.hashers import get_hasher
+
+
+def _encode(hasher, password):
+    return hasher.encode(password, hasher.salt())
+
+
+def spawn_pool(workers):
+    """A process pool of `workers` spawned (not forked, which is safe from threaded servers) interpreters"""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def hash_passwords(passwords, workers=None, pool=None):
+    """
+    Hash `passwords` with the preferred hasher, in order.
+
+    Hashes on `pool`, a long-lived pool of `workers` processes, when given;
+    otherwise starts a pool of `workers` processes (default: one per CPU) for
+    this call. With one worker or one password it hashes inline.
+    """
+    passwords = list(passwords)
+    hasher = get_hasher()
+    workers = min(workers or os.cpu_count() or 1, len(passwords))
+    if workers <= 1:
+        return [_encode(hasher, password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    if pool is not None:
+        return list(pool.map(_encode, repeat(hasher), passwords, chunksize=chunksize))
+    with spawn_pool(workers) as pool:
+        return list(pool.map(_encode, repeat(hasher), passwords, chunksize=chunksize))
@@ -0,0 +1,125 @@
+"""
+Support for the async login view.
+
+Password hashes (PBKDF2 by default) are deliberately slow, tens of
+milliseconds of CPU each. `user_login` verifies them on PasswordPool, a
+bounded thread pool, so the ASGI event loop and Django's shared sync thread
+keep serving other requests during a login storm. hashlib, bcrypt and argon2
+release the GIL while hashing, so the pool's threads hash in parallel on
+separate cores. At most HASH_MAX_PENDING verifications are queued or running;
+beyond that logins are shed with 503 rather than queued without bound.
+
+Attempts are throttled per username and per client IP with in-memory
+sliding windows (see users/throttling.py) before any hashing happens. Behind
+reverse proxies REMOTE_ADDR is the proxy, so set TRUSTED_PROXIES to the number
+of proxies in front of the app and the client address is read from
+CLIENT_IP_HEADER instead (see `client_ip`). Clients behind one NAT still share
+an address: size IP_ATTEMPTS for the largest such site, or set it to 0 to
+throttle by username only.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+from .throttling import SlidingWindowThrottle
+
+DEFAULT_LOGIN = {
+    'HASH_WORKERS': 4,
+    'HASH_MAX_PENDING': 64,
+    'USERNAME_ATTEMPTS': 10,
+    'IP_ATTEMPTS': 100,
+    'ATTEMPT_WINDOW': 60.0,
+    'CLIENT_IP_HEADER': 'HTTP_X_FORWARDED_FOR',
+    'TRUSTED_PROXIES': 0,
+}
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when HASH_MAX_PENDING password verifications are already in flight"""
+
+
+class PasswordPool:
+    """Bounded pool that checks and hashes passwords off the calling thread"""
+
+    def __init__(self, workers=4, max_pending=64):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    async def check(self, password, encoded):
+        """Return (valid, must_update) for `password` against the stored hash `encoded`"""
+        upgrade = []
+        valid = await self._run(check_password, password, encoded, upgrade.append)
+        return valid, bool(upgrade)
+
+    async def make(self, password):
+        """Hash `password` with the preferred hasher"""
+        return await self._run(make_password, password)
+
+    async def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            return await asyncio.wrap_future(self._executor.submit(func, *args))
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def login_settings():
+    return {**DEFAULT_LOGIN, **getattr(settings, 'LOGIN', {})}
+
+
+def client_ip(request):
+    """
+    The address to throttle `request` by.
+
+    With no trusted proxies this is REMOTE_ADDR. Each of the TRUSTED_PROXIES
+    proxies appends the address it saw to CLIENT_IP_HEADER, so the client is
+    that many entries from the right; entries further left are whatever the
+    client sent and are ignored.
+    """
+    config = login_settings()
+    if config['TRUSTED_PROXIES'] > 0:
+        forwarded = [address.strip() for address in request.META.get(config['CLIENT_IP_HEADER'], '').split(',')]
+        forwarded = [address for address in forwarded if address]
+        if forwarded:
+            return forwarded[-min(config['TRUSTED_PROXIES'], len(forwarded))]
+    return request.META.get('REMOTE_ADDR') or ''
+
+
+_password_pool = None
+_throttles = None
+_lock = threading.Lock()
+
+
+def get_password_pool():
+    """Return the process-wide password pool, created from settings.LOGIN on first use"""
+    global _password_pool
+    if _password_pool is None:
+        with _lock:
+            if _password_pool is None:
+                config = login_settings()
+                _password_pool = PasswordPool(workers=config['HASH_WORKERS'], max_pending=config['HASH_MAX_PENDING'])
+    return _password_pool
+
+
+def get_login_throttles():
+    """
+    Return the process-wide (username, ip) attempt throttles, created from
+    settings.LOGIN on first use; the ip throttle is None when IP_ATTEMPTS is 0.
+    """
+    global _throttles
+    if _throttles is None:
+        with _lock:
+            if _throttles is None:
+                config = login_settings()
+                _throttles = (
+                    SlidingWindowThrottle(config['USERNAME_ATTEMPTS'], config['ATTEMPT_WINDOW']),
+                    SlidingWindowThrottle(config['IP_ATTEMPTS'], config['ATTEMPT_WINDOW']) if config['IP_ATTEMPTS'] else None,
+                )
+    return _throttles
@@ -0,0 +1,61 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.provisioning import provision_users
+
+
+class Command(BaseCommand):
+    help = "Create users and profiles in bulk from a CSV (with a header row) or JSON file of register records"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSON file of records, or - for stdin")
+        parser.add_argument('--format', choices=['csv', 'json'], help='Input format (default: from the file extension)')
+        parser.add_argument('--workers', type=int, help='Password hashing processes (default: one per CPU)')
+        parser.add_argument('--report', help='Write the per-record results to this JSON file')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json' if path.lower().endswith('.json') else None)
+        if input_format is None:
+            raise CommandError('Cannot tell the input format from the file name; pass --format')
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        try:
+            handle = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+        try:
+            if input_format == 'csv':
+                # Empty cells are left out so optional fields keep their defaults
+                records = [
+                    {column: value for column, value in row.items() if column and value not in ('', None)}
+                    for row in csv.DictReader(handle)
+                ]
+            else:
+                records = json.load(handle)
+                if isinstance(records, dict):
+                    records = records.get('records')
+        except (csv.Error, ValueError) as exc:
+            raise CommandError(f'Cannot parse {path}: {exc}')
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+        if not isinstance(records, list):
+            raise CommandError('JSON input must be a list of records or {"records": [...]}')
+
+        results = provision_users(records, hash_workers=options['workers'])
+        created = sum(result['status'] == 'created' for result in results)
+
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as report:
+                json.dump(results, report, indent=2)
+        else:
+            for result in results:
+                if result['status'] == 'rejected':
+                    self.stdout.write(self.style.WARNING(f"record {result['index']}: {json.dumps(result['errors'])}"))
+
+        self.stdout.write(self.style.SUCCESS(f'Created {created} users, rejected {len(results) - created}'))
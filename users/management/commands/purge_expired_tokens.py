@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding and blacklisted JWTs in small batches "
+        "(schedule it, e.g. daily from cron; replaces simplejwt's single-statement flushexpiredtokens)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Outstanding tokens to delete per transaction')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches, to leave room for live traffic')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['sleep'] < 0:
+            raise CommandError('--sleep must not be negative')
+
+        # Walk the primary key so each batch continues where the last one
+        # stopped instead of rescanning rows that are still live
+        expired = OutstandingToken.objects.filter(expires_at__lte=timezone.now()).order_by('pk')
+        outstanding = blacklisted = 0
+        last_pk = None
+        while True:
+            batch = expired if last_pk is None else expired.filter(pk__gt=last_pk)
+            ids = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                outstanding += OutstandingToken.objects.filter(pk__in=ids).delete()[0]
+            last_pk = ids[-1]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {outstanding} expired outstanding tokens and {blacklisted} blacklisted entries'
+        ))
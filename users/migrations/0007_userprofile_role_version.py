@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_remove_last_login_fix_admin_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='role_version',
+            field=models.PositiveIntegerField(default=0, help_text='Incremented whenever role or admin_id changes; tokens carrying an older version are rejected'),
+        ),
+    ]
@@ -22,6 +22,7 @@ class UserProfile(models.Model):
         related_name='managed_users',
         help_text="Required if role is 'user'. Must reference an admin user. NULL if role is 'admin'."
     )
+    role_version = models.PositiveIntegerField(default=0,help_text="Incremented whenever role or admin_id changes; tokens carrying an older version are rejected")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -0,0 +1,171 @@
+"""
+Bulk user provisioning, shared by POST /api/auth/register/bulk/ and the
+provision_users management command.
+
+Records carry the same fields as POST /api/auth/register/. Instead of the
+per-user path (two uniqueness queries, an admin lookup and a serial password
+hash each), a batch is validated with one serializer instance, checked for
+username/email uniqueness and admin references with set-based queries,
+hashed on a process pool (users/hashing.py) and inserted with chunked
+bulk_create.
+
+Hashing is deliberately slow (hundreds of milliseconds of CPU per password),
+so the HTTP endpoint takes at most USER_PROVISIONING['HTTP_MAX_RECORDS']
+records and hashes them on one long-lived pool of HASH_WORKERS processes
+shared by every request of the worker; concurrent bulk requests queue on it
+rather than each claiming every core. Larger onboardings go through the
+provision_users management command, which hashes on a pool of its own.
+"""
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+
+from .hashing import hash_passwords, spawn_pool
+from .models import UserProfile
+from .serializers import UserBulkCreateSerializer
+
+DEFAULT_USER_PROVISIONING = {
+    'HTTP_MAX_RECORDS': 100,
+    'HASH_WORKERS': 2,
+}
+
+CHUNK_SIZE = 500
+# Values per IN (...) list in the set-based checks
+LOOKUP_CHUNK_SIZE = 1000
+
+
+def provisioning_settings():
+    return {**DEFAULT_USER_PROVISIONING, **getattr(settings, 'USER_PROVISIONING', {})}
+
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def get_hash_pool():
+    """
+    Return the process-wide hashing pool for the HTTP endpoint, started from
+    settings.USER_PROVISIONING on first use, or None when HASH_WORKERS is 1
+    (hash inline).
+    """
+    global _hash_pool
+    workers = provisioning_settings()['HASH_WORKERS']
+    if workers <= 1:
+        return None
+    if _hash_pool is None:
+        with _hash_pool_lock:
+            if _hash_pool is None:
+                _hash_pool = spawn_pool(workers)
+    return _hash_pool
+
+
+def _existing(field, values):
+    """The subset of `values` already taken by a user's `field`"""
+    values = list(values)
+    taken = set()
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        chunk = values[start:start + LOOKUP_CHUNK_SIZE]
+        taken.update(User.objects.filter(**{f'{field}__in': chunk}).values_list(field, flat=True))
+    return taken
+
+
+def _admin_roles(admin_ids):
+    """{user id: profile role or None} for the referenced admin_ids that exist"""
+    admin_ids = list(admin_ids)
+    roles = {}
+    for start in range(0, len(admin_ids), LOOKUP_CHUNK_SIZE):
+        chunk = admin_ids[start:start + LOOKUP_CHUNK_SIZE]
+        roles.update(User.objects.filter(id__in=chunk).values_list('id', 'profile__role'))
+    return roles
+
+
+def _rejected(index, errors):
+    return {'index': index, 'status': 'rejected', 'errors': errors}
+
+
+def provision_users(records, hash_workers=None, hash_pool=None):
+    """
+    Create users and profiles for every valid record in `records`.
+
+    Returns one result per record, in input order: `{'index', 'status':
+    'created', 'id', 'username'}` or `{'index', 'status': 'rejected',
+    'errors'}`. A username or email that already exists, or repeats an
+    earlier record of the batch, rejects the record. Each chunk of
+    CHUNK_SIZE users is inserted in its own transaction; a chunk that hits a
+    concurrent registration is rejected as a whole and can be resent.
+    Passwords are hashed on `hash_pool` (of `hash_workers` processes) when
+    given, else on a pool started for this call.
+    """
+    results = {}
+    valid = []
+    validator = UserBulkCreateSerializer()
+    for index, record in enumerate(records):
+        try:
+            valid.append((index, validator.run_validation(record)))
+        except ValidationError as exc:
+            results[index] = _rejected(index, exc.detail)
+
+    taken_usernames = _existing('username', {data['username'] for _, data in valid})
+    taken_emails = _existing('email', {data['email'] for _, data in valid})
+    admin_roles = _admin_roles({data['admin_id'] for _, data in valid if data.get('admin_id')})
+
+    accepted = []
+    for index, data in valid:
+        errors = {}
+        if data['username'] in taken_usernames:
+            errors['username'] = ['User with this username already exists.']
+        if data['email'] in taken_emails:
+            errors['email'] = ['User with this email already exists.']
+        admin_id = data.get('admin_id')
+        if admin_id and admin_id not in admin_roles:
+            errors['admin_id'] = ['Admin user with this ID does not exist.']
+        elif admin_id and admin_roles[admin_id] != 'admin':
+            errors['admin_id'] = ['admin_id must reference a user with admin role.']
+        if errors:
+            results[index] = _rejected(index, errors)
+            continue
+        # Later records of the batch may not reuse this username or email
+        taken_usernames.add(data['username'])
+        taken_emails.add(data['email'])
+        accepted.append((index, data))
+
+    passwords = hash_passwords([data['password'] for _, data in accepted], workers=hash_workers, pool=hash_pool)
+
+    for start in range(0, len(accepted), CHUNK_SIZE):
+        chunk = accepted[start:start + CHUNK_SIZE]
+        users = [
+            User(
+                username=data['username'],
+                email=data['email'],
+                password=password,
+                first_name=data.get('first_name', ''),
+                last_name=data.get('last_name', ''),
+                is_active=data.get('is_active', True),
+            )
+            for (_, data), password in zip(chunk, passwords[start:start + CHUNK_SIZE])
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                if any(user.pk is None for user in users):
+                    # Backends that cannot return ids from a bulk insert
+                    ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+                    for user in users:
+                        user.pk = ids[user.username]
+                UserProfile.objects.bulk_create([
+                    UserProfile(user=user, role=data['role'], admin_id_id=data.get('admin_id'))
+                    for (_, data), user in zip(chunk, users)
+                ])
+        except IntegrityError:
+            for index, _ in chunk:
+                results[index] = _rejected(index, {
+                    'non_field_errors': ['Conflicted with a concurrent registration; send this record again.']
+                })
+            continue
+        for (index, _), user in zip(chunk, users):
+            results[index] = {'index': index, 'status': 'created', 'id': user.pk, 'username': user.username}
+
+    return [results[index] for index in sorted(results)]
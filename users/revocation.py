@@ -0,0 +1,207 @@
+"""
+Per-process Bloom filter of blacklisted refresh tokens.
+
+Every refresh used to look its token up in token_blacklist_blacklistedtoken
+(joined to the outstanding tokens) before doing anything else. RevocationFilter
+answers "certainly not blacklisted" for almost every live token without a
+query; only tokens the filter may contain (real revocations and ~0.1% false
+positives) are looked up.
+
+The filter is rebuilt from the live blacklist (rows whose token has not
+expired) every REBUILD_INTERVAL seconds on a background thread, and tokens
+this process blacklists are added immediately. A token blacklisted by another
+worker since the last rebuild is not in the filter, so skipping the lookup is
+only safe because refresh rotates and blacklists the presented token:
+RoleRefreshToken.blacklist rejects the refresh when the blacklist row already
+exists (see users/tokens.py). The filter is therefore only consulted when
+ROTATE_REFRESH_TOKENS and BLACKLIST_AFTER_ROTATION are both on.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_REVOCATION = {
+    'ENABLED': True,
+    'FALSE_POSITIVE_RATE': 0.001,
+    'MIN_CAPACITY': 100000,
+    'REBUILD_INTERVAL': 300.0,
+}
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter of strings, sized for `capacity` keys at `false_positive_rate`"""
+
+    def __init__(self, capacity, false_positive_rate):
+        self.capacity = max(1, capacity)
+        bits = math.ceil(-self.capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        self._bits = bytearray((bits + 7) // 8)
+        self._size = len(self._bits) * 8
+        self._hashes = max(1, round(self._size / self.capacity * math.log(2)))
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing over one 128-bit digest (Kirsch-Mitzenmacher)
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self._size for i in range(self._hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationFilter:
+    """
+    Bloom filter of live blacklisted token jtis, rebuilt periodically.
+
+    Until the first build completes every token counts as possibly revoked,
+    so callers fall back to the database. `background=False` rebuilds on the
+    calling thread instead of a background one.
+    """
+
+    def __init__(self, false_positive_rate=0.001, min_capacity=100000, rebuild_interval=300.0,
+                 background=True, clock=time.monotonic):
+        self.false_positive_rate = false_positive_rate
+        self.min_capacity = min_capacity
+        self.rebuild_interval = rebuild_interval
+        self.background = background
+        self._clock = clock
+        self._filter = None
+        self._built_at = None
+        self._pending = None
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self.counters = Counter()
+
+    def might_be_revoked(self, jti):
+        """False when `jti` is certainly not blacklisted (as of the last build plus local additions)"""
+        self._maybe_rebuild()
+        bloom = self._filter
+        if bloom is None:
+            outcome = 'unbuilt'
+        elif jti in bloom:
+            outcome = 'positive'
+        else:
+            outcome = 'negative'
+        with self._lock:
+            self.counters[outcome] += 1
+        return outcome != 'negative'
+
+    def add(self, jti):
+        """Record a token this process just blacklisted"""
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+            if self._pending is not None:
+                self._pending.append(jti)
+
+    def rebuild(self):
+        """Build a new filter from the live blacklist and swap it in; False if a rebuild is already running"""
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                # Tokens blacklisted while we scan may be missed by the scan
+                self._pending = []
+            live = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            bloom = BloomFilter(max(self.min_capacity, 2 * live.count()), self.false_positive_rate)
+            for jti in live.values_list('token__jti', flat=True).iterator(chunk_size=10000):
+                bloom.add(jti)
+            with self._lock:
+                for jti in self._pending:
+                    bloom.add(jti)
+                self._pending = None
+                self._filter = bloom
+                self._built_at = self._clock()
+                self.counters['rebuilds'] += 1
+            return True
+        finally:
+            with self._lock:
+                self._pending = None
+            self._rebuild_lock.release()
+
+    def stats(self):
+        """Return filter counters for monitoring"""
+        bloom = self._filter
+        with self._lock:
+            counters = Counter(self.counters)
+        return {
+            'built': bloom is not None,
+            'entries': bloom.count if bloom is not None else 0,
+            'capacity': bloom.capacity if bloom is not None else 0,
+            'checks': counters['positive'] + counters['negative'] + counters['unbuilt'],
+            'skipped_lookups': counters['negative'],
+            'rebuilds': counters['rebuilds'],
+        }
+
+    def _maybe_rebuild(self):
+        bloom = self._filter
+        stale = (
+            bloom is None
+            or bloom.count > bloom.capacity
+            or self._clock() - self._built_at > self.rebuild_interval
+        )
+        if not stale or self._rebuild_lock.locked():
+            return
+        if not self.background:
+            self.rebuild()
+            return
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        threading.Thread(target=self._rebuild_in_background, name='token-revocation-filter', daemon=True).start()
+
+    def _rebuild_in_background(self):
+        close_old_connections()
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Failed to rebuild the token revocation filter')
+        finally:
+            with self._lock:
+                self._scheduled = False
+            close_old_connections()
+
+
+_revocation_filter = None
+_revocation_filter_lock = threading.Lock()
+
+
+def get_revocation_filter():
+    """
+    Return the process-wide revocation filter, created from
+    settings.TOKEN_REVOCATION on first use, or None when revocation checks
+    must go to the database (filter disabled, or refresh does not rotate and
+    blacklist tokens).
+    """
+    global _revocation_filter
+    config = {**DEFAULT_TOKEN_REVOCATION, **getattr(settings, 'TOKEN_REVOCATION', {})}
+    if not (config['ENABLED'] and api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION):
+        return None
+    if _revocation_filter is None:
+        with _revocation_filter_lock:
+            if _revocation_filter is None:
+                _revocation_filter = RevocationFilter(
+                    false_positive_rate=config['FALSE_POSITIVE_RATE'],
+                    min_capacity=config['MIN_CAPACITY'],
+                    rebuild_interval=config['REBUILD_INTERVAL'],
+                )
+    return _revocation_filter
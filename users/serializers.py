@@ -36,6 +36,12 @@ class UserCreateSerializer(serializers.Serializer):
             raise serializers.ValidationError({"admin_id": "Users must have an admin_id assigned."})
         if role == 'admin' and admin_id:
             raise serializers.ValidationError({"admin_id": "Admins cannot have an admin_id."})
+        self.validate_admin(admin_id)
+        
+        return attrs
+    
+    def validate_admin(self, admin_id):
+        """Validate that admin_id references an admin"""
         if admin_id:
             try:
                 admin_user = User.objects.get(id=admin_id)
@@ -43,8 +49,6 @@ class UserCreateSerializer(serializers.Serializer):
                     raise serializers.ValidationError({"admin_id": "admin_id must reference a user with admin role."})
             except User.DoesNotExist:
                 raise serializers.ValidationError({"admin_id": "Admin user with this ID does not exist."})
-        
-        return attrs
     
     def create(self, validated_data):
         """Create user and profile"""
@@ -68,3 +72,21 @@ class UserCreateSerializer(serializers.Serializer):
         profile.save(validate=False)  # Skip validation during creation to avoid circular dependency
         
         return user
+
+
+class UserBulkCreateSerializer(UserCreateSerializer):
+    """
+    Per-record validation for bulk provisioning.
+    
+    Username and email uniqueness and the admin_id lookup run once for the
+    whole batch in users/provisioning.py instead of once per record.
+    """
+    
+    def validate_username(self, value):
+        return value
+    
+    def validate_email(self, value):
+        return value
+    
+    def validate_admin(self, admin_id):
+        pass
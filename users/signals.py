@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import get_user_cache
+from .models import UserProfile
+
+
+@receiver(pre_save, sender=UserProfile)
+def remember_previous_role(sender, instance, **kwargs):
+    """Keep the stored role and admin so post_save can tell whether they changed"""
+    instance._previous_role = None
+    if instance.pk is not None and not instance._state.adding:
+        stored = sender.objects.filter(pk=instance.pk).values_list('role', 'admin_id', 'role_version').first()
+        if stored is not None:
+            instance._previous_role = stored[:2]
+            # A stale in-memory copy must not roll the version back
+            instance.role_version = stored[2]
+
+
+@receiver(post_save, sender=UserProfile)
+def revoke_tokens_on_role_change(sender, instance, created, **kwargs):
+    """Tokens minted with the old role claims carry the old role_version and must be refreshed"""
+    previous = getattr(instance, '_previous_role', None)
+    if not created and previous != (instance.role, instance.admin_id_id):
+        # Incremented in the database so concurrent changes each count
+        sender.objects.filter(pk=instance.pk).update(role_version=F('role_version') + 1)
+        instance.refresh_from_db(fields=['role_version'])
+    get_user_cache().invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=UserProfile)
+def revoke_tokens_on_profile_delete(sender, instance, **kwargs):
+    # Without a profile no role claims are accepted (see RoleClaimsJWTAuthentication)
+    get_user_cache().invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Saving a user (e.g. deactivating it or changing its password) drops it from the authentication cache"""
+    get_user_cache().invalidate(instance.pk)
@@ -1,3 +1,794 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import authentication, login, provisioning, revocation
+from .authentication import UserCache, get_user_cache
+from .hashing import hash_passwords
+from .login import PasswordPool
+from .models import UserProfile
+from .revocation import BloomFilter, RevocationFilter
+from .throttling import SlidingWindowThrottle
+from .tokens import RoleRefreshToken
+
+TEST_SETTINGS = {
+    'AUDIT_LOG': {'ENABLED': False},
+}
+
+
+@override_settings(**TEST_SETTINGS)
+class RoleClaimTests(TestCase):
+    """Role and admin_id travel in the JWT so admin checks skip the profile lookup"""
+
+    def setUp(self):
+        cache.clear()
+        get_user_cache().clear()
+        for patcher in (
+            mock.patch.object(login, '_throttles', None),
+            mock.patch.object(revocation, '_revocation_filter', RevocationFilter(background=False)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.admin = User.objects.create_user(username='admin', password='secret-pass')
+        UserProfile(user=self.admin, role='admin').save()
+        self.user = User.objects.create_user(username='agent', password='secret-pass')
+        UserProfile(user=self.user, role='user', admin_id=self.admin).save()
+
+    def _login(self, username):
+        response = APIClient().post(reverse('user_login'), {'username': username, 'password': 'secret-pass'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def _client(self, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return client
+
+    def _profile_queries(self, queries):
+        # Loading the user joins its profile's role_version; that is not a role lookup
+        return [
+            query['sql'] for query in queries
+            if 'users_userprofile' in query['sql'] and not query['sql'].startswith('SELECT "auth_user"')
+        ]
+
+    def test_login_tokens_carry_role_claims(self):
+        data = self._login('agent')
+        access = AccessToken(data['token'])
+        refresh = RefreshToken(data['refresh_token'])
+        self.assertEqual((access['role'], access['admin_id']), ('user', self.admin.id))
+        self.assertEqual((refresh['role'], refresh['admin_id']), ('user', self.admin.id))
+        self.assertEqual(AccessToken(self._login('admin')['token'])['role'], 'admin')
+
+    def test_admin_endpoints_skip_profile_lookup(self):
+        client = self._client(self._login('admin')['token'])
+        for name in ('command_list_create', 'command_top', 'tokens_usage', 'admin_activity_summary'):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse(name))
+            self.assertEqual(response.status_code, 200, name)
+            self.assertEqual(self._profile_queries(queries), [], name)
+
+    def test_user_claim_is_denied_admin_endpoints(self):
+        client = self._client(self._login('agent')['token'])
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('command_top'))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self._profile_queries(queries), [])
+
+    def test_token_without_claims_falls_back_to_profile(self):
+        client = self._client(RefreshToken.for_user(self.admin).access_token)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('command_top'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(self._profile_queries(queries), [])
+
+    def test_role_change_rejects_earlier_access_tokens(self):
+        data = self._login('agent')
+        client = self._client(data['token'])
+        self.assertEqual(client.get(reverse('command_list_create')).status_code, 200)
+
+        # Same second as the token's iat: versions, not timestamps, decide
+        profile = self.user.profile
+        profile.role, profile.admin_id = 'admin', None
+        profile.save()
+        self.assertEqual(profile.role_version, 1)
+        response = client.get(reverse('command_list_create'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'token_not_valid')
+
+    def test_role_change_reaches_other_processes_after_max_staleness(self):
+        client = self._client(self._login('agent')['token'])
+        self.assertEqual(client.get(reverse('command_list_create')).status_code, 200)
+        # A change made elsewhere: no signal reaches this process's user cache
+        UserProfile.objects.filter(user=self.user).update(role='admin', admin_id=None, role_version=1)
+        self.assertEqual(client.get(reverse('command_list_create')).status_code, 200)
+        now = time.monotonic() + get_user_cache().max_staleness + 1
+        with mock.patch.object(get_user_cache(), '_clock', return_value=now):
+            self.assertEqual(client.get(reverse('command_list_create')).status_code, 401)
+
+    def test_refreshed_token_against_a_stale_cache_entry(self):
+        data = self._login('agent')
+        self.assertEqual(self._client(data['token']).get(reverse('command_list_create')).status_code, 200)
+        # Promoted on another worker, which this process's cache never hears of
+        UserProfile.objects.filter(user=self.user).update(role='admin', admin_id=None, role_version=1)
+        response = APIClient().post(reverse('token_refresh'), {'refresh': data['refresh_token']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data['access'])['role_version'], 1)
+        client = self._client(response.data['access'])
+        self.assertEqual(client.get(reverse('command_top')).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get(reverse('command_top')).status_code, 200)
+        self.assertEqual(self._profile_queries(queries), [])
+        # The old token is still turned away once the entry is reloaded
+        self.assertEqual(self._client(data['token']).get(reverse('command_list_create')).status_code, 401)
+
+    def test_stale_profile_copy_does_not_reuse_a_version(self):
+        stale = UserProfile.objects.get(user=self.user)
+        current = UserProfile.objects.get(user=self.user)
+        current.role, current.admin_id = 'admin', None
+        current.save()
+        stale.admin_id = User.objects.create_user(username='lead', password='secret-pass')
+        UserProfile(user=stale.admin_id, role='admin').save()
+        stale.save()
+        self.assertEqual(UserProfile.objects.get(user=self.user).role_version, 2)
+
+    def test_deleted_profile_rejects_role_claims(self):
+        client = self._client(self._login('admin')['token'])
+        UserProfile.objects.filter(user=self.user).delete()
+        self.admin.profile.delete()
+        self.assertEqual(client.get(reverse('command_top')).status_code, 401)
+
+    def test_saving_profile_without_role_change_keeps_tokens(self):
+        client = self._client(self._login('agent')['token'])
+        profile = self.user.profile
+        profile.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.role_version, 0)
+        self.assertEqual(client.get(reverse('command_list_create')).status_code, 200)
+
+    def test_refresh_issues_current_role_claims(self):
+        data = self._login('agent')
+        profile = self.user.profile
+        profile.role, profile.admin_id = 'admin', None
+        profile.save()
+
+        response = APIClient().post(reverse('token_refresh'), {'refresh': data['refresh_token']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        access = AccessToken(response.data['access'])
+        self.assertEqual((access['role'], access['admin_id']), ('admin', None))
+        self.assertEqual(RoleRefreshToken(response.data['refresh'])['role'], 'admin')
+        self.assertEqual(self._client(access).get(reverse('command_top')).status_code, 200)
+
+        # The rotated-out refresh token is blacklisted as before
+        reused = APIClient().post(reverse('token_refresh'), {'refresh': data['refresh_token']}, format='json')
+        self.assertEqual(reused.status_code, 401)
+
+
+@override_settings(**TEST_SETTINGS)
+class AuthUserCacheTests(TestCase):
+    """Authenticated users are served from a bounded per-process cache"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.user_cache = UserCache(max_size=2, max_staleness=30.0, clock=lambda: self.now)
+        patcher = mock.patch.object(authentication, '_user_cache', self.user_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = User.objects.create_user(username='admin', password='secret-pass')
+        UserProfile(user=self.admin, role='admin').save()
+        self.user = User.objects.create_user(username='agent', password='secret-pass')
+        UserProfile(user=self.user, role='user', admin_id=self.admin).save()
+        self.client = self._client(self.user)
+
+    def _client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RoleRefreshToken.for_user(user).access_token}')
+        return client
+
+    def _user_queries(self, queries):
+        return [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT "auth_user"') and 'WHERE "auth_user"."id" =' in query['sql']
+        ]
+
+    def test_repeat_requests_skip_user_query(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.client.get(reverse('command_list_create')).status_code, 200)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.client.get(reverse('command_list_create')).status_code, 200)
+        self.assertEqual(len(self._user_queries(first)), 1)
+        self.assertEqual(self._user_queries(second), [])
+        stats = self.user_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+        self.assertIsNotNone(stats['avg_hit_ms'])
+        self.assertIsNotNone(stats['avg_miss_ms'])
+
+    def test_deactivating_user_invalidates_entry(self):
+        self.assertEqual(self.client.get(reverse('command_list_create')).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('command_list_create'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'user_inactive')
+
+    def test_unsignalled_deactivation_is_honoured_after_staleness_bound(self):
+        self.assertEqual(self.client.get(reverse('command_list_create')).status_code, 200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.now += 29
+        self.assertEqual(self.client.get(reverse('command_list_create')).status_code, 200)
+        self.now += 2
+        self.assertEqual(self.client.get(reverse('command_list_create')).status_code, 401)
+        self.assertEqual(self.user_cache.stats()['expired'], 1)
+
+    def test_profile_save_invalidates_entry(self):
+        self.client.get(reverse('command_list_create'))
+        self.user.profile.save()
+        self.assertIsNone(self.user_cache.get(self.user.pk))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.user_cache.set(1, self.user)
+        self.user_cache.set(2, self.admin)
+        self.user_cache.get(1)
+        self.user_cache.set(3, self.user)
+        self.assertIsNone(self.user_cache.get(2))
+        self.assertIsNotNone(self.user_cache.get(1))
+        self.assertEqual(self.user_cache.stats()['evictions'], 1)
+
+    def test_entries_are_copied_per_request(self):
+        self.user_cache.set(self.user.pk, self.user)
+        first = self.user_cache.get(self.user.pk)
+        first.role_claims = {'role': 'admin'}
+        first.profile
+        second = self.user_cache.get(self.user.pk)
+        self.assertFalse(hasattr(second, 'role_claims'))
+        self.assertNotIn('profile', second._state.fields_cache)
+
+    @override_settings(AUTH_USER_CACHE={'ENABLED': False})
+    def test_disabled_cache_loads_user_every_request(self):
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(reverse('command_list_create')).status_code, 200)
+            self.assertEqual(len(self._user_queries(queries)), 1)
+        self.assertEqual(self.user_cache.stats()['hits'], 0)
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get(reverse('auth_cache_stats')).status_code, 403)
+        response = self._client(self.admin).get(reverse('auth_cache_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cache']['max_size'], 2)
+
+
+@override_settings(**TEST_SETTINGS, LOGIN={'USERNAME_ATTEMPTS': 3, 'IP_ATTEMPTS': 5, 'ATTEMPT_WINDOW': 60.0})
+class LoginTests(TestCase):
+    """Login verifies passwords off the event loop, in one query, behind attempt throttles"""
+
+    def setUp(self):
+        patcher = mock.patch.object(login, '_throttles', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = User.objects.create_user(username='admin', password='secret-pass')
+        UserProfile(user=self.admin, role='admin').save()
+        self.client = APIClient()
+
+    def _login(self, username='admin', password='secret-pass', **extra):
+        return self.client.post(reverse('user_login'), {'username': username, 'password': password}, format='json', **extra)
+
+    def _user_queries(self, queries):
+        return [query['sql'] for query in queries if 'FROM "auth_user"' in query['sql']]
+
+    def test_login_returns_tokens_and_user(self):
+        response = self._login()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['user'], {
+            'id': self.admin.id, 'username': 'admin', 'email': '', 'role': 'admin', 'admin_id': None,
+        })
+        self.assertEqual(AccessToken(data['token'])['user_id'], str(self.admin.id))
+
+    def test_form_encoded_login(self):
+        response = self.client.post(reverse('user_login'), {'username': 'admin', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_wrong_password_uses_one_user_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._login(password='wrong')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['error'], 'Invalid password')
+        self.assertEqual(len(self._user_queries(queries)), 1)
+
+    def test_unknown_user_is_not_hashed(self):
+        with mock.patch.object(PasswordPool, 'check') as check:
+            response = self._login(username='nobody')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['error'], 'User does not exist')
+        check.assert_not_called()
+
+    def test_inactive_user_is_rejected(self):
+        User.objects.filter(pk=self.admin.pk).update(is_active=False)
+        response = self._login()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['error'], 'User account is inactive')
+
+    def test_missing_credentials_and_bad_json(self):
+        self.assertEqual(self._login(password='').status_code, 400)
+        response = self.client.post(reverse('user_login'), '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('user_login')).status_code, 405)
+
+    def test_outdated_hash_is_upgraded(self):
+        hasher = PBKDF2PasswordHasher()
+        User.objects.filter(pk=self.admin.pk).update(password=hasher.encode('secret-pass', hasher.salt(), iterations=1000))
+        self.assertEqual(self._login().status_code, 200)
+        self.admin.refresh_from_db()
+        self.assertNotIn('$1000$', self.admin.password)
+        self.assertTrue(check_password('secret-pass', self.admin.password))
+
+    def test_username_attempts_are_throttled(self):
+        for _ in range(3):
+            self.assertEqual(self._login(password='wrong').status_code, 401)
+        response = self._login()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(self._login(username='nobody').status_code, 401)
+
+    def test_ip_attempts_are_throttled(self):
+        for index in range(5):
+            self.assertEqual(self._login(username=f'nobody-{index}').status_code, 401)
+        self.assertEqual(self._login().status_code, 429)
+        self.assertEqual(self._login(REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    def test_client_ip_behind_trusted_proxies(self):
+        forwarded = {'REMOTE_ADDR': '10.0.0.1', 'HTTP_X_FORWARDED_FOR': '6.6.6.6, 203.0.113.7, 10.0.0.9'}
+        with override_settings(LOGIN={'USERNAME_ATTEMPTS': 3, 'IP_ATTEMPTS': 5, 'TRUSTED_PROXIES': 2}):
+            for index in range(5):
+                self.assertEqual(self._login(username=f'nobody-{index}', **forwarded).status_code, 401)
+            self.assertEqual(self._login(**forwarded).status_code, 429)
+            # Same proxy, another client behind it; a spoofed left-most entry changes nothing
+            other = {**forwarded, 'HTTP_X_FORWARDED_FOR': '6.6.6.6, 198.51.100.4, 10.0.0.9'}
+            self.assertEqual(self._login(**other).status_code, 200)
+            spoofed = {**forwarded, 'HTTP_X_FORWARDED_FOR': '1.2.3.4, 203.0.113.7, 10.0.0.9'}
+            self.assertEqual(self._login(**spoofed).status_code, 429)
+        request = RequestFactory().post('/', **forwarded)
+        self.assertEqual(login.client_ip(request), '10.0.0.1')
+
+    def test_ip_throttle_can_be_disabled(self):
+        with override_settings(LOGIN={'USERNAME_ATTEMPTS': 3, 'IP_ATTEMPTS': 0}):
+            for index in range(10):
+                self.assertEqual(self._login(username=f'nobody-{index}').status_code, 401)
+            self.assertEqual(self._login().status_code, 200)
+
+    def test_login_is_documented(self):
+        response = self.client.get(reverse('schema-json', kwargs={'format': '.json'}))
+        self.assertEqual(response.status_code, 200)
+        operation = json.loads(response.content)['paths']['/api/auth/login/']['post']
+        self.assertEqual(set(operation['responses']), {'200', '400', '401', '429', '503'})
+        body = next(parameter for parameter in operation['parameters'] if parameter['in'] == 'body')
+        self.assertEqual(body['schema']['required'], ['username', 'password'])
+        self.assertEqual(self._login().status_code, 200)
+
+    def test_saturated_pool_sheds_logins(self):
+        with mock.patch.object(login, '_password_pool', PasswordPool(workers=1, max_pending=0)):
+            response = self._login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_sliding_window(self):
+        now = [0.0]
+        throttle = SlidingWindowThrottle(limit=2, window=10, clock=lambda: now[0])
+        self.assertEqual(throttle.attempt('a'), 0)
+        now[0] = 4
+        self.assertEqual(throttle.attempt('a'), 0)
+        self.assertEqual(throttle.attempt('a'), 6)
+        self.assertEqual(throttle.attempt('b'), 0)
+        now[0] = 10
+        self.assertEqual(throttle.attempt('a'), 0)
+        self.assertEqual(throttle.attempt('a'), 4)
+        now[0] = 30
+        throttle.attempt('c')
+        self.assertEqual(set(throttle._attempts), {'c'})
+
+
+@override_settings(**TEST_SETTINGS)
+class TokenRevocationTests(TestCase):
+    """Refresh consults the revocation filter before the blacklist, and expired tokens are purged"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.filter = RevocationFilter(min_capacity=1000, rebuild_interval=60, background=False, clock=lambda: self.now)
+        patcher = mock.patch.object(revocation, '_revocation_filter', self.filter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = User.objects.create(username='admin')
+        UserProfile(user=self.admin, role='admin').save()
+
+    def _refresh(self, token):
+        return APIClient().post(reverse('token_refresh'), {'refresh': str(token)}, format='json')
+
+    def _blacklist_lookups(self, queries):
+        return [
+            query['sql'] for query in queries
+            if 'FROM "token_blacklist_blacklistedtoken" INNER JOIN' in query['sql']
+        ]
+
+    def _outstanding(self, expires_in, blacklisted=False, jti=None):
+        token = OutstandingToken.objects.create(
+            user=self.admin, jti=jti or f'jti-{OutstandingToken.objects.count()}', token='x',
+            expires_at=timezone.now() + timedelta(seconds=expires_in)
+        )
+        if blacklisted:
+            BlacklistedToken.objects.create(token=token)
+        return token
+
+    def test_refresh_skips_blacklist_lookup_for_unrevoked_tokens(self):
+        refresh = RoleRefreshToken.for_user(self.admin)
+        self.filter.rebuild()
+        with CaptureQueriesContext(connection) as queries:
+            response = self._refresh(refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._blacklist_lookups(queries), [])
+        self.assertEqual(self.filter.stats()['skipped_lookups'], 2)
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=refresh['jti']).exists())
+
+    @override_settings(TOKEN_REVOCATION={'ENABLED': False})
+    def test_disabled_filter_looks_up_blacklist(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._refresh(RoleRefreshToken.for_user(self.admin))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self._blacklist_lookups(queries)), 2)
+        self.assertEqual(self.filter.stats()['checks'], 0)
+
+    def test_locally_revoked_token_is_rejected(self):
+        refresh = RoleRefreshToken.for_user(self.admin)
+        self.assertEqual(self._refresh(refresh).status_code, 200)
+        self.assertIn(refresh['jti'], self.filter._filter)
+        response = self._refresh(refresh)
+        self.assertEqual(response.status_code, 401)
+
+    def test_revocation_unseen_by_filter_is_still_rejected(self):
+        refresh = RoleRefreshToken.for_user(self.admin)
+        self.filter.rebuild()
+        # Blacklisted by another worker after this worker built its filter
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=refresh['jti']))
+        self.assertFalse(self.filter.might_be_revoked(refresh['jti']))
+        response = self._refresh(refresh)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'token_not_valid')
+
+    def test_logout_revokes_refresh_token(self):
+        refresh = RoleRefreshToken.for_user(self.admin)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.post(reverse('user_logout'), {'refresh_token': str(refresh)}, format='json').status_code, 200)
+        self.assertEqual(self._refresh(refresh).status_code, 401)
+
+    def test_rebuild_holds_live_blacklist_only(self):
+        self._outstanding(3600, blacklisted=True, jti='live')
+        self._outstanding(-3600, blacklisted=True, jti='expired')
+        self._outstanding(3600, jti='outstanding')
+        self.filter.might_be_revoked('anything')
+        self.assertEqual(self.filter.stats()['entries'], 1)
+        self.assertTrue(self.filter.might_be_revoked('live'))
+        self.assertFalse(self.filter.might_be_revoked('outstanding'))
+
+        self._outstanding(3600, blacklisted=True, jti='later')
+        self.assertFalse(self.filter.might_be_revoked('later'))
+        self.now += 61
+        self.assertTrue(self.filter.might_be_revoked('later'))
+        self.assertEqual(self.filter.stats()['rebuilds'], 2)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(10000, 0.001)
+        keys = [f'key-{i}' for i in range(10000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 50)
+
+    def test_purge_deletes_expired_tokens_in_batches(self):
+        for index in range(5):
+            self._outstanding(-60, blacklisted=index % 2 == 0)
+        live = [self._outstanding(3600, blacklisted=True), self._outstanding(3600)]
+        out = StringIO()
+        call_command('purge_expired_tokens', batch_size=2, stdout=out)
+        self.assertIn('Deleted 5 expired outstanding tokens and 3 blacklisted entries', out.getvalue())
+        self.assertEqual(sorted(OutstandingToken.objects.values_list('pk', flat=True)), sorted(token.pk for token in live))
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+@override_settings(
+    **TEST_SETTINGS,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    USER_PROVISIONING={'HTTP_MAX_RECORDS': 100, 'HASH_WORKERS': 1},
+)
+class UserProvisioningTests(TestCase):
+    """Admins register users in bulk from JSON or CSV with per-record results"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', email='admin@example.com')
+        UserProfile(user=self.admin, role='admin').save()
+        self.member = User.objects.create(username='member', email='member@example.com')
+        UserProfile(user=self.member, role='user', admin_id=self.admin).save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _record(self, username, **fields):
+        return {
+            'username': username, 'email': f'{username}@example.com', 'password': 'Zx9!long-passphrase',
+            'role': 'user', 'admin_id': self.admin.id, **fields
+        }
+
+    def _post(self, records):
+        return self.client.post(reverse('user_bulk_register'), records, format='json')
+
+    def test_creates_users_and_profiles(self):
+        response = self._post([self._record(f'dev{i}') for i in range(3)] + [self._record('lead', role='admin', admin_id=None)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['rejected']), (4, 0))
+        user = User.objects.get(username='dev1')
+        self.assertEqual(response.data['results'][1], {'index': 1, 'status': 'created', 'id': user.id, 'username': 'dev1'})
+        self.assertTrue(user.check_password('Zx9!long-passphrase'))
+        self.assertEqual((user.profile.role, user.profile.admin_id_id), ('user', self.admin.id))
+        self.assertEqual(User.objects.get(username='lead').profile.role, 'admin')
+
+    def test_reports_errors_per_record(self):
+        records = [
+            self._record('ok'),
+            self._record('member'),
+            self._record('dup-email', email='member@example.com'),
+            self._record('ok', email='other@example.com'),
+            self._record('orphan', admin_id=None),
+            self._record('ghost-admin', admin_id=999999),
+            self._record('not-admin', admin_id=self.member.id),
+            self._record('weak', password='123'),
+            'not a record',
+        ]
+        response = self._post(records)
+        self.assertEqual(response.status_code, 201)
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], list(range(len(records))))
+        self.assertEqual([result['status'] for result in results], ['created'] + ['rejected'] * 8)
+        self.assertIn('username', results[1]['errors'])
+        self.assertIn('email', results[2]['errors'])
+        self.assertIn('username', results[3]['errors'])
+        self.assertIn('admin_id', results[4]['errors'])
+        self.assertEqual(results[5]['errors']['admin_id'], ['Admin user with this ID does not exist.'])
+        self.assertEqual(results[6]['errors']['admin_id'], ['admin_id must reference a user with admin role.'])
+        self.assertIn('password', results[7]['errors'])
+        self.assertIn('non_field_errors', results[8]['errors'])
+        self.assertEqual(User.objects.filter(username__in=['ok', 'orphan', 'weak']).count(), 1)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        counts = []
+        for prefix, size in (('a', 5), ('b', 50)):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self._post([self._record(f'{prefix}{i}') for i in range(size)]).status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_csv_upload(self):
+        body = (
+            'username,email,password,role,admin_id,first_name\n'
+            f'csv1,csv1@example.com,Zx9!long-passphrase,user,{self.admin.id},Ada\n'
+            'csv2,csv2@example.com,Zx9!long-passphrase,admin,,\n'
+        )
+        response = self.client.post(reverse('user_bulk_register'), body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(User.objects.get(username='csv1').first_name, 'Ada')
+
+    def test_admin_only_and_limits(self):
+        member_client = APIClient()
+        member_client.force_authenticate(self.member)
+        self.assertEqual(member_client.post(reverse('user_bulk_register'), [self._record('x')], format='json').status_code, 403)
+        self.assertEqual(self._post([]).status_code, 400)
+        with override_settings(USER_PROVISIONING={'HTTP_MAX_RECORDS': 2, 'HASH_WORKERS': 1}):
+            response = self._post([self._record(f'c{i}') for i in range(3)])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('provision_users', response.data['error'])
+        self.assertFalse(User.objects.filter(username='c0').exists())
+        response = self._post([self._record('member')])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data['success'])
+
+    def test_http_hashing_uses_one_long_lived_pool(self):
+        with mock.patch.object(provisioning, '_hash_pool', None), \
+                mock.patch.object(provisioning, 'spawn_pool', side_effect=lambda workers: ThreadPoolExecutor(workers)) as spawn:
+            self.assertIsNone(provisioning.get_hash_pool())
+            with override_settings(USER_PROVISIONING={'HASH_WORKERS': 2}):
+                for batch in range(2):
+                    response = self._post([self._record(f'p{batch}-{i}') for i in range(3)])
+                    self.assertEqual(response.data['created'], 3)
+                pool = provisioning.get_hash_pool()
+            spawn.assert_called_once_with(2)
+            pool.shutdown()
+        self.assertTrue(check_password('Zx9!long-passphrase', User.objects.get(username='p1-2').password))
+
+    def test_management_command_with_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'team.json')
+            report = os.path.join(directory, 'report.json')
+            with open(source, 'w') as handle:
+                json.dump({'records': [self._record('cli1'), self._record('member')]}, handle)
+            out = StringIO()
+            call_command('provision_users', source, report=report, workers=1, stdout=out)
+            self.assertIn('Created 1 users, rejected 1', out.getvalue())
+            with open(report) as handle:
+                self.assertEqual([result['status'] for result in json.load(handle)], ['created', 'rejected'])
+        self.assertTrue(User.objects.filter(username='cli1', profile__role='user').exists())
+
+    def test_passwords_hash_in_worker_processes(self):
+        passwords = [f'secret-{i}' for i in range(4)]
+        hashes = hash_passwords(passwords, workers=2)
+        self.assertEqual(len(set(hashes)), 4)
+        self.assertTrue(all(check_password(password, encoded) for password, encoded in zip(passwords, hashes)))
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS, LOGIN={'USERNAME_ATTEMPTS': 10 ** 6, 'IP_ATTEMPTS': 10 ** 6, 'HASH_MAX_PENDING': 1024})
+class LoginThroughputBenchmark(TestCase):
+    """Logins/sec at a fixed p99 (ZAPFIX_LOGIN_P99_MS, default 2000) with 1 hashing thread vs the default pool"""
+
+    async def _storm(self, concurrency, total):
+        client = AsyncClient()
+        latencies = []
+
+        async def worker(offset):
+            for index in range(offset, total, concurrency):
+                started = time.perf_counter()
+                response = await client.post(
+                    reverse('user_login'), {'username': f'bench{index % 20}', 'password': 'secret-pass'},
+                    content_type='application/json'
+                )
+                latencies.append(time.perf_counter() - started)
+                self.assertEqual(response.status_code, 200)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return total / elapsed, latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+
+    async def test_login_throughput(self):
+        p99_target = float(os.environ.get('ZAPFIX_LOGIN_P99_MS', 2000))
+        total = int(os.environ.get('ZAPFIX_LOGIN_TOTAL', 64))
+        admin = await User.objects.acreate(username='bench-admin')
+        await UserProfile.objects.acreate(user=admin, role='admin')
+        password = make_password('secret-pass')
+        for index in range(20):
+            user = await User.objects.acreate(username=f'bench{index}', password=password)
+            await UserProfile.objects.acreate(user=user, role='user', admin_id=admin)
+
+        print(f'\n{os.cpu_count()} CPU(s), p99 target {p99_target:.0f} ms, {total} logins per level')
+        for workers in (1, login.DEFAULT_LOGIN['HASH_WORKERS']):
+            pool = PasswordPool(workers=workers, max_pending=1024)
+            best = None
+            with mock.patch.object(login, '_password_pool', pool), mock.patch.object(login, '_throttles', None):
+                for concurrency in (1, 2, 4, 8, 16):
+                    rate, p99 = await self._storm(concurrency, total)
+                    print(f'workers={workers} concurrency={concurrency}: {rate:.1f} logins/s, p99 {p99:.0f} ms')
+                    if p99 <= p99_target and (best is None or rate > best):
+                        best = rate
+            pool.shutdown()
+            print(f'workers={workers}: best {best or 0:.1f} logins/s with p99 <= {p99_target:.0f} ms')
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS)
+class TokenRefreshBenchmark(TestCase):
+    """Refresh latency over ZAPFIX_TOKEN_ROWS historical token rows (default 10M), with and without the filter, before and after purging"""
+
+    def _latencies(self, user, count=300):
+        tokens = [RoleRefreshToken.for_user(user) for _ in range(count)]
+        client = APIClient()
+        latencies = []
+        for token in tokens:
+            started = time.perf_counter()
+            response = client.post(reverse('token_refresh'), {'refresh': str(token)}, format='json')
+            latencies.append((time.perf_counter() - started) * 1000)
+            self.assertEqual(response.status_code, 200)
+        latencies.sort()
+        return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+    def _report(self, label, user):
+        with override_settings(TOKEN_REVOCATION={'ENABLED': False}):
+            p50, p99 = self._latencies(user)
+        print(f'{label}, blacklist lookup: p50 {p50:.2f} ms, p99 {p99:.2f} ms')
+        revocations = RevocationFilter(background=False)
+        with mock.patch.object(revocation, '_revocation_filter', revocations):
+            started = time.perf_counter()
+            revocations.rebuild()
+            print(f'{label}, filter rebuilt with {revocations.stats()["entries"]:,} live revocations in {time.perf_counter() - started:.1f} s')
+            p50, p99 = self._latencies(user)
+        print(f'{label}, revocation filter: p50 {p50:.2f} ms, p99 {p99:.2f} ms')
+
+    def test_refresh_latency(self):
+        rows = int(os.environ.get('ZAPFIX_TOKEN_ROWS', 10000000))
+        users = [User.objects.create(username=f'bench{i}') for i in range(50)]
+        user = users[0]
+        UserProfile(user=user, role='admin').save()
+        now = timezone.now()
+        batch = 20000
+        started = time.perf_counter()
+        # History of rotations: every token but the newest 2% was blacklisted
+        # when it was refreshed, and 95% have expired
+        for start in range(0, rows, batch):
+            tokens = OutstandingToken.objects.bulk_create([
+                OutstandingToken(
+                    user=users[index % 50], jti=f'{index:032x}', token='x', created_at=now,
+                    expires_at=now + timedelta(days=7 if index >= rows * 0.95 else -1)
+                )
+                for index in range(start, min(start + batch, rows))
+            ])
+            BlacklistedToken.objects.bulk_create([
+                BlacklistedToken(token=token) for token in tokens if int(token.jti, 16) < rows * 0.98
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        print(f'\nloaded {rows:,} outstanding tokens in {time.perf_counter() - started:.0f} s')
+
+        self._report(f'{rows:,} rows', user)
+
+        started = time.perf_counter()
+        out = StringIO()
+        call_command('purge_expired_tokens', batch_size=5000, stdout=out)
+        print(f'purge: {out.getvalue().strip()} in {time.perf_counter() - started:.0f} s')
+        self._report(f'{OutstandingToken.objects.count():,} rows after purge', user)
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(**TEST_SETTINGS)
+class UserProvisioningBenchmark(TestCase):
+    """Users/sec of one POST /api/auth/register/ per user vs the bulk endpoint (ZAPFIX_PROVISION_USERS, default 2000)"""
+
+    def test_provisioning_throughput(self):
+        total = int(os.environ.get('ZAPFIX_PROVISION_USERS', 2000))
+        admin = User.objects.create(username='bench-admin')
+        # The HTTP cap keeps requests short; lift it to time one large batch
+        cap = override_settings(USER_PROVISIONING={**provisioning.provisioning_settings(), 'HTTP_MAX_RECORDS': total})
+        cap.enable()
+        self.addCleanup(cap.disable)
+        UserProfile(user=admin, role='admin').save()
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        def records(prefix):
+            return [
+                {'username': f'{prefix}{i}', 'email': f'{prefix}{i}@example.com', 'password': 'Zx9!long-passphrase',
+                 'role': 'user', 'admin_id': admin.id}
+                for i in range(total)
+            ]
+
+        print(f'\n{os.cpu_count()} CPU(s), {total} users')
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            for record in records('single'):
+                self.assertEqual(client.post(reverse('user_register'), record, format='json').status_code, 201)
+        elapsed = time.perf_counter() - started
+        print(f'one POST per user: {total / elapsed:.2f} users/s ({elapsed:.1f} s, {len(queries)} queries)')
+
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(reverse('user_bulk_register'), records('bulk'), format='json')
+        elapsed = time.perf_counter() - started
+        self.assertEqual(response.data['created'], total)
+        print(f'bulk endpoint: {total / elapsed:.2f} users/s ({elapsed:.1f} s, {len(queries)} queries)')
@@ -0,0 +1,47 @@
+import threading
+import time
+from collections import deque
+
+
+class SlidingWindowThrottle:
+    """
+    In-memory sliding-window attempt counter.
+
+    `attempt(key)` allows at most `limit` attempts per `key` within any
+    `window` seconds. Each key keeps the timestamps of its attempts inside the
+    window (at most `limit` of them), and idle keys are dropped every `window`
+    seconds, so memory stays proportional to the keys seen recently. State is
+    per process: with N workers a client can make up to N * `limit` attempts.
+    """
+
+    def __init__(self, limit, window, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self._clock = clock
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._next_prune = clock() + window
+
+    def attempt(self, key):
+        """Record an attempt; returns 0 if allowed, else seconds until the next one would be"""
+        now = self._clock()
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now)
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                attempts = self._attempts[key] = deque()
+            while attempts and attempts[0] <= now - self.window:
+                attempts.popleft()
+            if len(attempts) >= self.limit:
+                return attempts[0] + self.window - now
+            attempts.append(now)
+            return 0
+
+    def _prune(self, now):
+        cutoff = now - self.window
+        self._attempts = {
+            key: attempts for key, attempts in self._attempts.items()
+            if attempts and attempts[-1] > cutoff
+        }
+        self._next_prune = now + self.window
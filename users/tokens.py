@@ -0,0 +1,94 @@
+"""
+JWTs that carry the user's role.
+
+`role` and `admin_id` are embedded as claims when a refresh token is minted
+and copied into every access token derived from it, so `is_admin` can answer
+from the validated token instead of loading the UserProfile.
+
+A role change must not leave a stale role in circulation:
+
+* every refresh re-reads the claims from the profile, so rotated refresh
+  tokens and new access tokens carry the current role;
+* the change bumps UserProfile.role_version (users/signals.py), which tokens
+  carry as the `role_version` claim. RoleClaimsJWTAuthentication loads the
+  current version with the user and rejects tokens carrying another one,
+  which sends clients to refresh. Other workers see the new version once
+  their cached copy of the user expires, so AUTH_USER_CACHE['MAX_STALENESS']
+  bounds how long a stale role is honoured.
+
+Refresh tokens are checked against the blacklist through the revocation
+filter (users/revocation.py), and blacklisting a token that already is
+blacklisted fails, so a rotated-out token cannot be replayed even when the
+filter has not seen its revocation.
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .revocation import get_revocation_filter
+
+ROLE_CLAIM = 'role'
+ADMIN_ID_CLAIM = 'admin_id'
+ROLE_VERSION_CLAIM = 'role_version'
+
+
+def role_claims(profile):
+    """The role claims for a UserProfile (or None when the user has no profile)"""
+    if profile is None:
+        return {}
+    return {ROLE_CLAIM: profile.role, ADMIN_ID_CLAIM: profile.admin_id_id, ROLE_VERSION_CLAIM: profile.role_version}
+
+
+class RoleRefreshToken(RefreshToken):
+    """Refresh token carrying `role`, `admin_id` and `role_version` claims (copied into its access tokens)"""
+
+    @classmethod
+    def for_user(cls, user):
+        from .models import UserProfile
+
+        token = super().for_user(user)
+        try:
+            profile = user.profile
+        except UserProfile.DoesNotExist:
+            profile = None
+        token.payload.update(role_claims(profile))
+        return token
+
+    def update_role_claims(self):
+        """Replace the role claims with the user's current profile (one query)"""
+        from .models import UserProfile
+
+        user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+        profile = UserProfile.objects.filter(user_id=user_id).only('role', 'admin_id', 'role_version').first()
+        for claim in (ROLE_CLAIM, ADMIN_ID_CLAIM, ROLE_VERSION_CLAIM):
+            self.payload.pop(claim, None)
+        self.payload.update(role_claims(profile))
+
+    def check_blacklist(self):
+        """Skip the blacklist query when the revocation filter rules the token out"""
+        revocations = get_revocation_filter()
+        if revocations is not None and not revocations.might_be_revoked(self.payload[api_settings.JTI_CLAIM]):
+            return
+        super().check_blacklist()
+
+    def blacklist(self):
+        """Blacklist this token; raises TokenError if it already was"""
+        blacklisted, created = super().blacklist()
+        revocations = get_revocation_filter()
+        if revocations is not None:
+            revocations.add(self.payload[api_settings.JTI_CLAIM])
+        if not created:
+            raise TokenError(_('Token is blacklisted'))
+        return blacklisted, created
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that re-reads the role claims, so rotation picks up role changes"""
+    token_class = RoleRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        refresh.update_role_claims()
+        return super().validate({**attrs, 'refresh': str(refresh)})
@@ -5,7 +5,9 @@ from . import views
 urlpatterns = [
     # Authentication endpoints
     path('register/', views.user_register, name='user_register'),
+    path('register/bulk/', views.user_bulk_register, name='user_bulk_register'),
     path('login/', views.user_login, name='user_login'),
     path('logout/', views.user_logout, name='user_logout'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('cache/stats/', views.auth_cache_stats, name='auth_cache_stats'),
 ]
@@ -1,17 +1,36 @@
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, BasePermission, AllowAny
+from rest_framework.views import APIView
 from django.contrib.auth.models import User
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
+from .authentication import get_user_cache
+from zapfix_backend.parsers import CSVParser, DecompressingJSONParser
+from zapfix_backend.schema import documented_as
+
+from .login import PasswordPoolBusy, client_ip, get_login_throttles, get_password_pool
 from .models import UserProfile
+from .provisioning import get_hash_pool, provision_users, provisioning_settings
+from .revocation import get_revocation_filter
 from .serializers import UserCreateSerializer
+from .tokens import ROLE_CLAIM, RoleRefreshToken
 
 
 def is_admin(user):
-    """Check if user is an admin"""
+    """Check if user is an admin, from the JWT role claim when present, else from the profile"""
+    claims = getattr(user, 'role_claims', None)
+    if claims is not None:
+        return claims[ROLE_CLAIM] == 'admin'
     try:
         return user.profile.is_admin
     except (UserProfile.DoesNotExist, AttributeError):
@@ -65,55 +84,60 @@ def user_register(request):
 
 @swagger_auto_schema(
     method='post',
+    manual_parameters=[
+        openapi.Parameter('Content-Encoding', openapi.IN_HEADER, description='gzip to send a compressed body', type=openapi.TYPE_STRING, enum=['gzip', 'identity']),
+    ],
     request_body=openapi.Schema(
-        type=openapi.TYPE_OBJECT,
-        required=['username', 'password'],
-        properties={
-            'username': openapi.Schema(type=openapi.TYPE_STRING, description='Username'),
-            'password': openapi.Schema(type=openapi.TYPE_STRING, description='Password', format='password'),
-        }
+        type=openapi.TYPE_ARRAY,
+        items=openapi.Schema(type=openapi.TYPE_OBJECT),
+        description=(
+            f'Up to {provisioning_settings()["HTTP_MAX_RECORDS"]} users, same fields as POST /api/auth/register/, '
+            'as a JSON array, {"records": [...]}, or CSV with a header row (Content-Type: text/csv). '
+            'Use the provision_users management command for larger batches'
+        )
     ),
     responses={
-        200: openapi.Response('Login successful'),
-        400: openapi.Response('Bad request - missing credentials'),
-        401: openapi.Response('Unauthorized - invalid credentials'),
+        201: openapi.Response('At least one user was created; per-record results'),
+        400: openapi.Response('Bad request - no user was created'),
+        413: openapi.Response('Body too large once decompressed')
     },
-    tags=['Authentication']
+    tags=['Authentication'],
+    security=[{'Bearer': []}]
 )
 @api_view(['POST'])
-@permission_classes([AllowAny])
-def user_login(request):
-    """User login (for both admin and regular users)"""
-    from django.contrib.auth import authenticate
-    from rest_framework_simplejwt.tokens import RefreshToken
-    
-    username = request.data.get('username')
-    password = request.data.get('password')
-    
-    if not username or not password:
+@parser_classes([DecompressingJSONParser, CSVParser])
+@permission_classes([IsAuthenticated, AdminPermission])
+def user_bulk_register(request):
+    """Register a batch of users, e.g. to onboard a team (Admin only)"""
+    records = request.data.get('records') if isinstance(request.data, dict) else request.data
+    if not isinstance(records, list) or not records:
         return Response({
             'success': False,
-            'error': 'Username and password are required'
+            'error': 'records must be a non-empty list'
         }, status=status.HTTP_400_BAD_REQUEST)
-    
-    user = authenticate(request, username=username, password=password)
-    
-    if user is None:
-        user_exists = User.objects.filter(username=username).exists()
-        error_msg = 'Invalid password' if user_exists else 'User does not exist'
-        
+    config = provisioning_settings()
+    if len(records) > config['HTTP_MAX_RECORDS']:
         return Response({
             'success': False,
-            'error': error_msg
-        }, status=status.HTTP_401_UNAUTHORIZED)
+            'error': (
+                f"At most {config['HTTP_MAX_RECORDS']} users can be registered per request; "
+                'split the batch or use the provision_users management command'
+            )
+        }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Check if user is active
-    if not user.is_active:
-        return Response({
-            'success': False,
-            'error': 'User account is inactive'
-        }, status=status.HTTP_401_UNAUTHORIZED)
+    results = provision_users(records, hash_workers=config['HASH_WORKERS'], hash_pool=get_hash_pool())
+    created = sum(result['status'] == 'created' for result in results)
     
+    return Response({
+        'success': bool(created),
+        'created': created,
+        'rejected': len(results) - created,
+        'results': results
+    }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+
+def _issue_login_tokens(request, user):
+    """Profile, activity log and JWTs for a verified login (sync; runs off the event loop)"""
     # Auto-create profile if missing
     try:
         profile = user.profile
@@ -123,8 +147,11 @@ def user_login(request):
         profile.save(validate=False)
         user.refresh_from_db()
     
-    # Generate JWT tokens
-    refresh = RefreshToken.for_user(user)
+    from Activitylogs.audit import log_activity
+    log_activity(request, 'login', user=user)
+    
+    # Generate JWT tokens carrying the role claims
+    refresh = RoleRefreshToken.for_user(user)
     access_token = refresh.access_token
     
     # Prepare user data
@@ -133,15 +160,112 @@ def user_login(request):
         'username': user.username,
         'email': user.email,
         'role': user.profile.role,
-        'admin_id': user.profile.admin_id.id if user.profile.admin_id else None
+        'admin_id': user.profile.admin_id_id
     }
     
-    return Response({
+    return {
         'success': True,
         'token': str(access_token),
         'refresh_token': str(refresh),
         'user': user_data
-    }, status=status.HTTP_200_OK)
+    }
+
+
+def _login_error(error, status_code, retry_after=None):
+    response = JsonResponse({'success': False, 'error': error}, status=status_code)
+    if retry_after is not None:
+        response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+class UserLoginSchema(APIView):
+    """Documentation stand-in for the async user_login view (see zapfix_backend/schema.py)"""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['username', 'password'],
+            properties={
+                'username': openapi.Schema(type=openapi.TYPE_STRING, description='Username'),
+                'password': openapi.Schema(type=openapi.TYPE_STRING, description='Password', format='password'),
+            }
+        ),
+        responses={
+            200: openapi.Response('Login successful; access token, refresh token and user'),
+            400: openapi.Response('Bad request - missing credentials or malformed body'),
+            401: openapi.Response('Unauthorized - unknown user, invalid password or inactive account'),
+            429: openapi.Response('Too many attempts for this username or client IP; see Retry-After'),
+            503: openapi.Response('Login is busy; retry after Retry-After seconds'),
+        },
+        tags=['Authentication'],
+        security=[]
+    )
+    def post(self, request):
+        raise NotImplementedError('Served by user_login')
+
+
+@documented_as(UserLoginSchema)
+@csrf_exempt
+@require_POST
+async def user_login(request):
+    """
+    User login (for both admin and regular users)
+    
+    Async view: the password hash is verified on a bounded pool (see
+    users/login.py) so a login storm does not pin the workers. Attempts are
+    throttled per username and per client IP. Accepts JSON or form-encoded
+    `username` and `password`.
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return _login_error('Request body must be valid JSON', status.HTTP_400_BAD_REQUEST)
+        if not isinstance(data, dict):
+            return _login_error('Request body must be a JSON object', status.HTTP_400_BAD_REQUEST)
+    else:
+        data = request.POST
+    
+    username = data.get('username')
+    password = data.get('password')
+    
+    if not username or not password or not isinstance(username, str) or not isinstance(password, str):
+        return _login_error('Username and password are required', status.HTTP_400_BAD_REQUEST)
+    
+    # Throttle before any hashing
+    username_throttle, ip_throttle = get_login_throttles()
+    retry_after = max(
+        ip_throttle.attempt(client_ip(request)) if ip_throttle else 0,
+        username_throttle.attempt(username),
+    )
+    if retry_after:
+        return _login_error('Too many login attempts, try again later', status.HTTP_429_TOO_MANY_REQUESTS, retry_after)
+    
+    # One query answers both "does the user exist" and "what is the stored hash"
+    user = await User.objects.select_related('profile').filter(username=username).afirst()
+    if user is None:
+        return _login_error('User does not exist', status.HTTP_401_UNAUTHORIZED)
+    
+    pool = get_password_pool()
+    try:
+        valid, must_update = await pool.check(password, user.password)
+        if valid and must_update:
+            # Re-hash with the preferred hasher, as ModelBackend would
+            user.password = await pool.make(password)
+            await User.objects.filter(pk=user.pk).aupdate(password=user.password)
+    except PasswordPoolBusy:
+        return _login_error('Login is busy, try again shortly', status.HTTP_503_SERVICE_UNAVAILABLE, retry_after=1)
+    
+    if not valid:
+        return _login_error('Invalid password', status.HTTP_401_UNAUTHORIZED)
+    
+    # Check if user is active
+    if not user.is_active:
+        return _login_error('User account is inactive', status.HTTP_401_UNAUTHORIZED)
+    
+    return JsonResponse(await sync_to_async(_issue_login_tokens)(request, user), status=status.HTTP_200_OK)
 
 
 @swagger_auto_schema(
@@ -163,8 +287,6 @@ def user_login(request):
 @permission_classes([IsAuthenticated])
 def user_logout(request):
     """User logout - blacklist the refresh token"""
-    from rest_framework_simplejwt.tokens import RefreshToken
-    
     try:
         # Get the refresh token from the request body (optional)
         refresh_token = request.data.get('refresh_token')
@@ -172,7 +294,7 @@ def user_logout(request):
         if refresh_token:
             try:
                 # Blacklist the refresh token
-                token = RefreshToken(refresh_token)
+                token = RoleRefreshToken(refresh_token)
                 token.blacklist()
             except Exception:
                 # If token is already blacklisted or invalid, continue
@@ -190,6 +312,27 @@ def user_logout(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@swagger_auto_schema(
+    method='get',
+    responses={
+        200: openapi.Response('Authentication user cache and revocation filter metrics for this process'),
+        403: openapi.Response('Forbidden - Admin only'),
+    },
+    tags=['Authentication'],
+    security=[{'Bearer': []}]
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, AdminPermission])
+def auth_cache_stats(request):
+    """Hit rate and latency of this worker's authentication cache, and its token revocation filter (Admin only)"""
+    revocations = get_revocation_filter()
+    return Response({
+        'success': True,
+        'cache': get_user_cache().stats(),
+        'revocation_filter': revocations.stats() if revocations is not None else None,
+    }, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def api_root(request):
@@ -206,22 +349,34 @@ def api_root(request):
         'endpoints': {
             'authentication': {
                 'register': '/api/auth/register/ (POST) - Register new user (Admin only)',
-                'login': '/api/auth/login/ (POST) - User login',
+                'register_bulk': '/api/auth/register/bulk/ (POST) - Register a small batch of users from JSON or CSV, with per-record results (Admin only; larger onboardings: manage.py provision_users)',
+                'login': '/api/auth/login/ (POST) - User login (async; throttled per username and IP)',
                 'logout': '/api/auth/logout/ (POST) - User logout',
+                'cache_stats': '/api/auth/cache/stats/ (GET) - Authentication user cache and token revocation filter metrics for this worker (Admin only)',
             },
             'sessions': {
                 'list': '/api/sessions/ (GET) - Get all sessions',
                 'create': '/api/sessions/ (POST) - Create new session',
+                'search': '/api/sessions/search/?q= (GET) - Full-text search over your messages',
                 'detail': '/api/sessions/{session_id}/ (GET) - Get session with messages',
                 'update': '/api/sessions/{session_id}/ (PATCH) - Update session',
                 'add_message': '/api/sessions/{session_id}/messages/ (POST) - Add message to session',
+                'add_messages_bulk': '/api/sessions/{session_id}/messages/bulk/ (POST) - Add a batch of messages to session',
+                'sync': '/api/sessions/{session_id}/sync/?after=&since_version= (GET) - Messages added, edited or deleted since a cursor',
+                'events': '/api/sessions/{session_id}/events/ (GET) - Server-Sent Events stream of new messages (ASGI)',
             },
             'commands': {
                 'list': '/api/commands/ (GET) - Get command history',
                 'create': '/api/commands/ (POST) - Log command execution',
+                'bulk_create': '/api/commands/bulk/ (POST) - Log a batch of command executions (JSON array or NDJSON, optionally Content-Encoding: gzip)',
+                'search': '/api/commands/search/?q=&match=contains|prefix (GET) - Search commands by substring or prefix',
+                'top': '/api/commands/top/?by=command|user|hostname&limit= (GET) - Most frequent commands with failure rate and timings (Admin only)',
+                'latency': '/api/commands/latency/?command_type=&hostname=&date_from=&date_to= (GET) - Execution time p50/p90/p99 (Admin only)',
+                'detail': '/api/commands/{command_id}/?tail=&offset=&length= (GET) - Get command with its output (last N lines or a byte range)',
             },
             'tokens': {
                 'create': '/api/tokens/ (POST) - Record token usage',
+                'bulk_create': '/api/tokens/bulk/ (POST) - Record a batch of token usage records',
                 'usage': '/api/tokens/usage/ (GET) - Get token usage statistics',
             },
             'admin': {
@@ -2,6 +2,9 @@
 ASGI config for zapfix_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. uvicorn or daphne) so the async session
+event streams (/api/sessions/<id>/events/) hold no thread while idle and
+the async login view (/api/auth/login/) hashes passwords off the event loop.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
@@ -0,0 +1,81 @@
+import base64
+import zlib
+
+from django.db import models
+
+# Stored values that start with CODEC_PREFIX are "<prefix><codec>:<base64 payload>".
+# \x02 (STX) does not occur in ordinary text, so plain rows written before a
+# column was switched to CompressedTextField are read back unchanged.
+CODEC_PREFIX = '\x02'
+CODECS = {
+    'zlib': (zlib.compress, zlib.decompress),
+}
+
+
+def compress_text(value, codec='zlib', level=6):
+    """Encode `value` with `codec`, as stored by CompressedTextField"""
+    compress = CODECS[codec][0]
+    payload = base64.b64encode(compress(value.encode('utf-8'), level)).decode('ascii')
+    return f'{CODEC_PREFIX}{codec}:{payload}'
+
+
+def decompress_text(value):
+    """Decode a stored value; values without the codec marker are returned as is"""
+    if not isinstance(value, str) or not value.startswith(CODEC_PREFIX):
+        return value
+    codec, sep, payload = value[len(CODEC_PREFIX):].partition(':')
+    if not sep or codec not in CODECS:
+        return value
+    decompress = CODECS[codec][1]
+    try:
+        return decompress(base64.b64decode(payload)).decode('utf-8')
+    except (ValueError, zlib.error):
+        return value
+
+
+def is_compressed(value):
+    return isinstance(value, str) and value.startswith(CODEC_PREFIX) and value[len(CODEC_PREFIX):].partition(':')[0] in CODECS
+
+
+class CompressedTextField(models.TextField):
+    """
+    TextField that stores values of `compress_threshold` characters or more
+    zlib-compressed behind a codec marker.
+
+    The column stays a text column, so switching a field over needs no data
+    migration: old rows are read as plain text and compressed the next time
+    they are saved. Model instances always hold the plain text. Database-side
+    text lookups (LIKE, icontains) cannot see inside compressed values.
+    """
+
+    def __init__(self, *args, compress_threshold=4096, compress_level=6, **kwargs):
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.compress_threshold != 4096:
+            kwargs['compress_threshold'] = self.compress_threshold
+        if self.compress_level != 6:
+            kwargs['compress_level'] = self.compress_level
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        return decompress_text(value)
+
+    def to_python(self, value):
+        return decompress_text(super().to_python(value))
+
+    def get_db_prep_save(self, value, connection):
+        value = super().get_db_prep_save(value, connection)
+        if not isinstance(value, str):
+            return value
+        # Plain values that happen to look encoded are always encoded, so they
+        # survive the round trip
+        if len(value) < self.compress_threshold and not value.startswith(CODEC_PREFIX):
+            return value
+        encoded = compress_text(value, level=self.compress_level)
+        if len(encoded) >= len(value) and not value.startswith(CODEC_PREFIX):
+            return value
+        return encoded
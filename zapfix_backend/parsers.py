@@ -0,0 +1,126 @@
+"""
+Request parsers for batch ingest endpoints.
+
+All parsers honour `Content-Encoding: gzip`: the body is inflated as it is
+read, never buffered compressed, and reading stops with 413 once the
+decompressed size passes INGEST_MAX_DECOMPRESSED_BYTES (so a small gzip bomb cannot
+exhaust memory). `NDJSONParser` turns newline-delimited JSON into a list,
+decoding one line at a time; `CSVParser` turns CSV with a header row into a
+list of dicts.
+
+None derives from DRF's JSONParser: DRF hands JSONParser subclasses the
+buffered `request.body`, which Django caps at DATA_UPLOAD_MAX_MEMORY_SIZE
+before any decompression could happen.
+"""
+import codecs
+import csv
+import gzip
+import io
+import json
+import zlib
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError, UnsupportedMediaType
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+# Default cap on a decompressed request body (override with INGEST_MAX_DECOMPRESSED_BYTES)
+MAX_DECOMPRESSED_BYTES = 32 * 1024 * 1024
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Request body is too large.'
+    default_code = 'request_too_large'
+
+
+def _reject_constant(value):
+    raise ValueError(f'Out of range float values are not JSON compliant: {value}')
+
+
+class _LimitedReader(io.RawIOBase):
+    """Raw reader over `stream` that raises RequestTooLarge after `limit` bytes"""
+
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self._limit = limit
+        self._read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        try:
+            data = self._stream.read(len(buffer))
+        except (OSError, EOFError, zlib.error) as exc:
+            raise ParseError(f'Invalid compressed body - {exc}')
+        self._read += len(data)
+        if self._read > self._limit:
+            raise RequestTooLarge(f'Request body exceeds {self._limit} bytes once decompressed.')
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def decoded_stream(stream, parser_context):
+    """Binary stream of the request body with its Content-Encoding removed and size capped"""
+    request = (parser_context or {}).get('request')
+    encoding = request.META.get('HTTP_CONTENT_ENCODING', 'identity').strip().lower() if request is not None else 'identity'
+    if encoding == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    elif encoding not in ('', 'identity'):
+        raise UnsupportedMediaType(encoding, detail=f'Unsupported Content-Encoding "{encoding}".')
+    limit = getattr(settings, 'INGEST_MAX_DECOMPRESSED_BYTES', MAX_DECOMPRESSED_BYTES)
+    return io.BufferedReader(_LimitedReader(stream, limit))
+
+
+class DecompressingJSONParser(BaseParser):
+    """JSON parser that reads the body as a stream and accepts gzip-encoded bodies"""
+    media_type = 'application/json'
+    renderer_class = JSONRenderer
+    strict = api_settings.STRICT_JSON
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        reader = codecs.getreader(encoding)(decoded_stream(stream, parser_context))
+        try:
+            if self.strict:
+                return json.load(reader, parse_constant=_reject_constant)
+            return json.load(reader)
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class NDJSONParser(BaseParser):
+    """Newline-delimited JSON (one value per line, blank lines ignored) parsed into a list"""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        lines = codecs.getreader(encoding)(decoded_stream(stream, parser_context))
+        records = []
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f'NDJSON parse error on line {number} - {exc}')
+        return records
+
+
+class CSVParser(BaseParser):
+    """CSV with a header row parsed into a list of dicts; empty cells are left out so optional fields keep their defaults"""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        lines = codecs.getreader(encoding)(decoded_stream(stream, parser_context))
+        try:
+            return [
+                {column: value for column, value in row.items() if column and value not in ('', None)}
+                for row in csv.DictReader(lines)
+            ]
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ParseError(f'CSV parse error - {exc}')
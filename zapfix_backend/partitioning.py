@@ -0,0 +1,231 @@
+"""
+Monthly range partitioning for the append-only tables on PostgreSQL.
+
+`activity_logs`, `command_executions` and `token_usage` are partitioned by
+`created_at` into one child table per calendar month (`<table>_pYYYYMM`) plus a
+`<table>_default` catch-all. Other backends keep plain tables and every helper
+here is a no-op for them.
+
+PostgreSQL requires the partition key in every unique constraint, so the
+primary key of a partitioned table is `(id, created_at)`. Django still treats
+`id` as the primary key; ids are random UUIDs, so uniqueness is not at risk.
+"""
+import re
+from datetime import date
+
+from django.utils import timezone
+
+PARTITIONED_TABLES = ['activity_logs', 'command_executions', 'token_usage']
+PARTITION_KEY = 'created_at'
+# Rollups of a partitioned table, as (table, UTC time column); their rows for
+# expired months leave with the partitions so they keep matching the raw rows
+ROLLUP_TABLES = {
+    'token_usage': [('token_usage_hourly', 'hour')],
+}
+
+
+def supports_partitioning(connection):
+    return connection.vendor == 'postgresql'
+
+
+def month_start(value):
+    """First day of the month containing `value`"""
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    """First day of the month `months` after the month containing `value`"""
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def is_partitioned(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relkind FROM pg_class c "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [table]
+        )
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def list_partitions(connection, table):
+    """Return {month: partition name} for the monthly partitions of `table`"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+            [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    pattern = re.compile(r'^%s_p(\d{4})(\d{2})$' % re.escape(table))
+    partitions = {}
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def _index_and_fk_definitions(connection, table):
+    """Return the non-primary-key index DDL and the foreign keys of `table`"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT i.indexdef FROM pg_indexes i "
+            "WHERE i.schemaname = current_schema() AND i.tablename = %s AND i.indexname NOT IN ("
+            "  SELECT con.conname FROM pg_constraint con "
+            "  JOIN pg_class c ON c.oid = con.conrelid "
+            "  WHERE c.relname = %s AND con.contype = 'p')",
+            [table, table]
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT con.conname, pg_get_constraintdef(con.oid) FROM pg_constraint con "
+            "JOIN pg_class c ON c.oid = con.conrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid) "
+            "AND con.contype = 'f' AND con.conparentid = 0",
+            [table]
+        )
+        foreign_keys = cursor.fetchall()
+    return indexes, foreign_keys
+
+
+def _rebuild_table(schema_editor, table, partitioned):
+    """Recreate `table` as a partitioned (or plain) table and move its rows across"""
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    legacy = f'{table}_legacy'
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT min(created_at), max(created_at) FROM %s" % quote(table)
+        )
+        first, last = cursor.fetchone()
+
+    index_definitions, foreign_keys = _index_and_fk_definitions(connection, table)
+    schema_editor.execute('ALTER TABLE %s RENAME TO %s' % (quote(table), quote(legacy)))
+    schema_editor.execute(
+        'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING CONSTRAINTS)%s' % (
+            quote(table), quote(legacy),
+            ' PARTITION BY RANGE (%s)' % quote(PARTITION_KEY) if partitioned else ''
+        )
+    )
+    if partitioned:
+        schema_editor.execute('ALTER TABLE %s ADD PRIMARY KEY (id, %s)' % (quote(table), quote(PARTITION_KEY)))
+        today = timezone.localdate()
+        start = month_start(first.date() if first else today)
+        end = add_months(month_start(max(last.date() if last else today, today)), 3)
+        month = start
+        while month <= end:
+            create_partition(schema_editor, table, month)
+            month = add_months(month, 1)
+        schema_editor.execute(
+            'CREATE TABLE %s PARTITION OF %s DEFAULT' % (quote(f'{table}_default'), quote(table))
+        )
+    else:
+        schema_editor.execute('ALTER TABLE %s ADD PRIMARY KEY (id)' % quote(table))
+
+    schema_editor.execute('INSERT INTO %s SELECT * FROM %s' % (quote(table), quote(legacy)))
+    schema_editor.execute('DROP TABLE %s' % quote(legacy))
+
+    # Indexes and foreign keys keep their original names so Django's migration
+    # state still matches the database. `ON ONLY` (emitted for partitioned
+    # parents) is dropped so a rebuilt index covers every partition.
+    for definition in index_definitions:
+        schema_editor.execute(definition.replace(' ON ONLY ', ' ON '))
+    for name, definition in foreign_keys:
+        schema_editor.execute('ALTER TABLE %s ADD CONSTRAINT %s %s' % (quote(table), quote(name), definition))
+
+
+def partition_table(schema_editor, table):
+    """Convert `table` to monthly range partitions (PostgreSQL only)"""
+    if not supports_partitioning(schema_editor.connection) or is_partitioned(schema_editor.connection, table):
+        return
+    _rebuild_table(schema_editor, table, partitioned=True)
+
+
+def unpartition_table(schema_editor, table):
+    """Convert a partitioned `table` back into a plain table (PostgreSQL only)"""
+    if not supports_partitioning(schema_editor.connection) or not is_partitioned(schema_editor.connection, table):
+        return
+    _rebuild_table(schema_editor, table, partitioned=False)
+
+
+def create_partition(schema_editor, table, month):
+    """Create the partition of `table` for the month starting at `month`"""
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        "CREATE TABLE IF NOT EXISTS %s PARTITION OF %s FOR VALUES FROM ('%s') TO ('%s')" % (
+            quote(partition_name(table, month)), quote(table),
+            month.isoformat(), add_months(month, 1).isoformat()
+        )
+    )
+
+
+def ensure_future_partitions(schema_editor, table, months_ahead=3):
+    """
+    Create monthly partitions from the current month through `months_ahead`.
+
+    Rows that already landed in the default partition for a missing month are
+    moved into the new partition, since PostgreSQL refuses to create a partition
+    whose range overlaps rows in the default one.
+    """
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    existing = list_partitions(connection, table)
+    default = f'{table}_default'
+    created = []
+    month = month_start(timezone.localdate())
+    for _ in range(months_ahead + 1):
+        if month not in existing:
+            upper = add_months(month, 1)
+            schema_editor.execute('ALTER TABLE %s DETACH PARTITION %s' % (quote(table), quote(default)))
+            create_partition(schema_editor, table, month)
+            schema_editor.execute(
+                'INSERT INTO %s SELECT * FROM %s WHERE %s >= %%s AND %s < %%s' % (
+                    quote(table), quote(default), quote(PARTITION_KEY), quote(PARTITION_KEY)
+                ),
+                [month.isoformat(), upper.isoformat()]
+            )
+            schema_editor.execute(
+                'DELETE FROM %s WHERE %s >= %%s AND %s < %%s' % (
+                    quote(default), quote(PARTITION_KEY), quote(PARTITION_KEY)
+                ),
+                [month.isoformat(), upper.isoformat()]
+            )
+            schema_editor.execute('ALTER TABLE %s ATTACH PARTITION %s DEFAULT' % (quote(table), quote(default)))
+            created.append(partition_name(table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def expire_partitions(schema_editor, table, retention_months, drop=False):
+    """
+    Detach (and optionally drop) partitions that end before the retention window.
+
+    The window keeps the current month plus the `retention_months` before it.
+    Rows of the table's ROLLUP_TABLES for the expired months are deleted.
+    """
+    quote = schema_editor.quote_name
+    cutoff = add_months(month_start(timezone.localdate()), -retention_months)
+    expired = []
+    for month, name in sorted(list_partitions(schema_editor.connection, table).items()):
+        if add_months(month, 1) <= cutoff:
+            schema_editor.execute('ALTER TABLE %s DETACH PARTITION %s' % (quote(table), quote(name)))
+            if drop:
+                schema_editor.execute('DROP TABLE %s' % quote(name))
+            expired.append(name)
+            expired_until = add_months(month, 1)
+    if expired:
+        for rollup, column in ROLLUP_TABLES.get(table, []):
+            schema_editor.execute(
+                'DELETE FROM %s WHERE %s < %%s' % (quote(rollup), quote(column)), [expired_until.isoformat()]
+            )
+    return expired
@@ -0,0 +1,18 @@
+"""
+API documentation for views drf_yasg cannot see.
+
+drf_yasg only documents DRF views, which it recognises by the `cls` attribute
+APIView.as_view() sets on the URL callback. `documented_as` gives a plain
+Django view (such as the async users.views.user_login) a schema-only APIView
+stand-in whose decorated handlers describe the endpoint; the stand-in never
+serves a request.
+"""
+
+
+def documented_as(view_class):
+    """Document the decorated plain Django view with `view_class`'s handlers"""
+    def decorator(view):
+        view.cls = view_class
+        view.initkwargs = {}
+        return view
+    return decorator
@@ -154,7 +154,7 @@ STATIC_URL = 'static/'
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.RoleClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -172,6 +172,55 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'users.tokens.RoleTokenRefreshSerializer',
+}
+
+# Per-process cache of authenticated users (see users/authentication.py)
+AUTH_USER_CACHE = {
+    'ENABLED': config('AUTH_USER_CACHE_ENABLED', default=True, cast=bool),
+    'MAX_SIZE': config('AUTH_USER_CACHE_MAX_SIZE', default=10000, cast=int),
+    'MAX_STALENESS': config('AUTH_USER_CACHE_MAX_STALENESS', default=30.0, cast=float),
+}
+
+# Refresh token revocation filter (see users/revocation.py)
+TOKEN_REVOCATION = {
+    'ENABLED': config('TOKEN_REVOCATION_FILTER_ENABLED', default=True, cast=bool),
+    'FALSE_POSITIVE_RATE': config('TOKEN_REVOCATION_FALSE_POSITIVE_RATE', default=0.001, cast=float),
+    'REBUILD_INTERVAL': config('TOKEN_REVOCATION_REBUILD_INTERVAL', default=300.0, cast=float),
+}
+
+# Bulk user registration over HTTP (see users/provisioning.py)
+USER_PROVISIONING = {
+    'HTTP_MAX_RECORDS': config('USER_PROVISIONING_HTTP_MAX_RECORDS', default=100, cast=int),
+    'HASH_WORKERS': config('USER_PROVISIONING_HASH_WORKERS', default=2, cast=int),
+}
+
+# Login password pool and attempt throttling (see users/login.py)
+LOGIN = {
+    'HASH_WORKERS': config('LOGIN_HASH_WORKERS', default=4, cast=int),
+    'HASH_MAX_PENDING': config('LOGIN_HASH_MAX_PENDING', default=64, cast=int),
+    'USERNAME_ATTEMPTS': config('LOGIN_USERNAME_ATTEMPTS', default=10, cast=int),
+    'IP_ATTEMPTS': config('LOGIN_IP_ATTEMPTS', default=100, cast=int),
+    'ATTEMPT_WINDOW': config('LOGIN_ATTEMPT_WINDOW', default=60.0, cast=float),
+    # Reverse proxies in front of the app; the client IP is then read from CLIENT_IP_HEADER
+    'TRUSTED_PROXIES': config('LOGIN_TRUSTED_PROXIES', default=0, cast=int),
+    'CLIENT_IP_HEADER': config('LOGIN_CLIENT_IP_HEADER', default='HTTP_X_FORWARDED_FOR'),
+}
+
+# Activity log writer (see Activitylogs/audit.py)
+AUDIT_LOG = {
+    'ENABLED': config('AUDIT_LOG_ENABLED', default=True, cast=bool),
+    'BATCH_SIZE': config('AUDIT_LOG_BATCH_SIZE', default=200, cast=int),
+    'FLUSH_INTERVAL': config('AUDIT_LOG_FLUSH_INTERVAL', default=2.0, cast=float),
+    'MAX_QUEUE_SIZE': config('AUDIT_LOG_MAX_QUEUE_SIZE', default=10000, cast=int),
+    'ENQUEUE_TIMEOUT': config('AUDIT_LOG_ENQUEUE_TIMEOUT', default=0.0, cast=float),
+}
+
+# Session event streams (see session/events.py)
+SESSION_EVENTS = {
+    'BACKEND': config('SESSION_EVENTS_BACKEND', default='session.events.InMemoryBackend'),
+    'KEEPALIVE_INTERVAL': config('SESSION_EVENTS_KEEPALIVE_INTERVAL', default=15.0, cast=float),
+    'QUEUE_SIZE': config('SESSION_EVENTS_QUEUE_SIZE', default=1000, cast=int),
 }
 
 # CORS Settings
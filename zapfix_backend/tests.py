@@ -0,0 +1,255 @@
+import os
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
+
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from Tokenusage.models import TokenUsage
+from CommandExecution.models import CommandExecution
+from Activitylogs.models import DailyUserActivity
+from message.models import Message
+from session.models import Session
+from .fields import CODEC_PREFIX, compress_text, decompress_text
+from .filters import DateRangeFilter
+from .partitioning import add_months, expire_partitions, month_start, partition_name, is_partitioned, supports_partitioning
+
+
+class DateRangeFilterTests(TestCase):
+    """Tests for the shared half-open date range filter"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_dates_become_half_open_utc_range(self):
+        date_range = DateRangeFilter.from_request(self.factory.get('/', {'date_from': '2026-03-01', 'date_to': '2026-03-31'}))
+        self.assertEqual(date_range.start, datetime(2026, 3, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(date_range.end, datetime(2026, 4, 1, tzinfo=dt_timezone.utc))
+
+    def test_timezone_shifts_the_boundaries(self):
+        date_range = DateRangeFilter.from_request(self.factory.get('/', {'date_from': '2026-01-10', 'tz': 'Asia/Kolkata'}))
+        self.assertEqual(date_range.start, datetime(2026, 1, 10, tzinfo=ZoneInfo('Asia/Kolkata')))
+        self.assertEqual(date_range.start, datetime(2026, 1, 9, 18, 30, tzinfo=dt_timezone.utc))
+        self.assertIsNone(date_range.end)
+
+    def test_invalid_values_are_ignored(self):
+        date_range = DateRangeFilter.from_request(self.factory.get('/', {'date_from': '2026-13-45', 'date_to': 'soon', 'tz': 'Mars/Base'}))
+        self.assertFalse(date_range.is_bounded)
+        qs = TokenUsage.objects.all()
+        self.assertIs(date_range.filter(qs), qs)
+
+    def test_filter_days_is_inclusive(self):
+        date_range = DateRangeFilter(date(2026, 1, 1), date(2026, 1, 2))
+        sql = str(date_range.filter_days(DailyUserActivity.objects.values('id')).query)
+        self.assertIn('>=', sql)
+        self.assertIn('<=', sql)
+
+
+class DateRangeIndexUsageTests(TestCase):
+    """EXPLAIN checks that the range predicates can use the (user, created_at) indexes"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='planner')
+        self.date_range = DateRangeFilter(date(2026, 1, 1), date(2026, 1, 31))
+
+    def _plan(self, queryset):
+        plan = queryset.explain()
+        if os.environ.get('ZAPFIX_BENCHMARKS'):
+            # Show the plan for comparison across backends
+            print(f'\n[{connection.vendor}] {plan}')
+        return plan
+
+    def test_token_usage_range_uses_composite_index(self):
+        queryset = self.date_range.filter(TokenUsage.objects.filter(user=self.user)).values('tokens_total')
+        plan = self._plan(queryset)
+        if connection.vendor == 'sqlite':
+            self.assertIn('token_usage_user_id_5b452f_idx (user_id=? AND created_at>? AND created_at<?)', plan)
+        elif connection.vendor == 'postgresql':
+            self.assertIn('token_usage_user_id_5b452f_idx', plan)
+
+    def test_command_range_uses_composite_index(self):
+        queryset = self.date_range.filter(CommandExecution.objects.filter(user=self.user)).values('id')
+        plan = self._plan(queryset)
+        if connection.vendor == 'sqlite':
+            self.assertIn('command_exe_user_id_6867d1_idx (user_id=? AND created_at>? AND created_at<?)', plan)
+        elif connection.vendor == 'postgresql':
+            self.assertIn('command_exe_user_id_6867d1_idx', plan)
+
+    def test_date_cast_cannot_range_scan(self):
+        # The previous created_at__date filters only matched the user_id prefix of the index
+        queryset = TokenUsage.objects.filter(
+            user=self.user, created_at__date__gte=date(2026, 1, 1), created_at__date__lte=date(2026, 1, 31)
+        ).values('tokens_total')
+        plan = self._plan(queryset)
+        if connection.vendor == 'sqlite':
+            self.assertNotIn('created_at>?', plan)
+
+
+class PartitioningTests(TestCase):
+    """Tests for the monthly partition helpers and their non-PostgreSQL fallback"""
+
+    def test_month_arithmetic(self):
+        self.assertEqual(month_start(date(2026, 2, 17)), date(2026, 2, 1))
+        self.assertEqual(add_months(date(2026, 11, 1), 2), date(2027, 1, 1))
+        self.assertEqual(add_months(date(2026, 1, 1), -1), date(2025, 12, 1))
+        self.assertEqual(partition_name('token_usage', date(2026, 3, 1)), 'token_usage_p202603')
+
+    def test_other_backends_keep_plain_tables(self):
+        if supports_partitioning(connection):
+            self.assertTrue(is_partitioned(connection, 'token_usage'))
+            return
+        out = StringIO()
+        call_command('manage_partitions', stdout=out)
+        self.assertIn('nothing to do', out.getvalue())
+        self.assertIn('token_usage', connection.introspection.table_names())
+
+
+    def test_expiring_token_usage_months_deletes_their_cube_hours(self):
+        schema_editor = mock.Mock()
+        schema_editor.quote_name = connection.ops.quote_name
+        partitions = {date(2025, 1, 1): 'token_usage_p202501', date(2025, 2, 1): 'token_usage_p202502'}
+        with mock.patch('zapfix_backend.partitioning.list_partitions', return_value=partitions), \
+                mock.patch('zapfix_backend.partitioning.timezone.localdate', return_value=date(2026, 3, 15)):
+            expired = expire_partitions(schema_editor, 'token_usage', retention_months=12)
+        self.assertEqual(expired, ['token_usage_p202501', 'token_usage_p202502'])
+        schema_editor.execute.assert_called_with(
+            'DELETE FROM "token_usage_hourly" WHERE "hour" < %s', ['2025-03-01']
+        )
+
+
+def _stored(model, field, pk):
+    """Raw column value, bypassing the field's decoder"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.get_field(field).column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {column} FROM {table} WHERE id = %s', [model._meta.pk.get_db_prep_value(pk, connection)])
+        return cursor.fetchone()[0]
+
+
+def _build_log(lines):
+    return '\n'.join(f'[{i:05d}] compiling module_{i % 40}.py ... ok' for i in range(lines))
+
+
+@override_settings(AUDIT_LOG={'ENABLED': False})
+class CompressedTextFieldTests(TestCase):
+    """Large text values are stored zlib-compressed and read back transparently"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.session = Session.objects.create(user=self.user)
+
+    def test_large_values_are_compressed_small_ones_are_not(self):
+        log = _build_log(2000)
+        big = Message.objects.create(session=self.session, role='assistant', content=log)
+        small = Message.objects.create(session=self.session, role='user', content='hello')
+        stored = _stored(Message, 'content', big.pk)
+        self.assertTrue(stored.startswith(CODEC_PREFIX + 'zlib:'))
+        self.assertLess(len(stored), len(log) / 5)
+        self.assertEqual(_stored(Message, 'content', small.pk), 'hello')
+        self.assertEqual(Message.objects.get(pk=big.pk).content, log)
+        self.assertEqual(Message.objects.filter(pk=big.pk).values_list('content', flat=True).get(), log)
+
+    def test_legacy_plain_rows_are_read_and_compressed_on_save(self):
+        log = _build_log(2000)
+        message = Message.objects.create(session=self.session, role='assistant', content='placeholder')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {Message._meta.db_table} SET content = %s WHERE id = %s',
+                [log, Message._meta.pk.get_db_prep_value(message.pk, connection)]
+            )
+        message = Message.objects.get(pk=message.pk)
+        self.assertEqual(message.content, log)
+        message.save()
+        self.assertTrue(_stored(Message, 'content', message.pk).startswith(CODEC_PREFIX))
+        self.assertEqual(Message.objects.get(pk=message.pk).content, log)
+
+    def test_values_that_look_encoded_round_trip(self):
+        tricky = CODEC_PREFIX + 'zlib:not base64'
+        message = Message.objects.create(session=self.session, role='user', content=tricky)
+        self.assertEqual(Message.objects.get(pk=message.pk).content, tricky)
+        self.assertEqual(decompress_text(compress_text('x' * 10)), 'x' * 10)
+        self.assertEqual(decompress_text(CODEC_PREFIX + 'lz4:abc'), CODEC_PREFIX + 'lz4:abc')
+
+    def test_command_error_message_through_the_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        log = _build_log(3000)
+        response = client.post(reverse('command_list_create'), {
+            'command': 'make', 'command_type': 'shell', 'status': 'failed', 'error_message': log,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        command_id = response.data['execution']['id']
+        self.assertTrue(_stored(CommandExecution, 'error_message', command_id).startswith(CODEC_PREFIX))
+        self.assertEqual(CommandExecution.objects.get(pk=command_id).error_message, log)
+
+    def test_backfill_command_compresses_existing_rows(self):
+        log = _build_log(2000)
+        message = Message.objects.create(session=self.session, role='assistant', content='placeholder')
+        Message.objects.create(session=self.session, role='user', content='short')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {Message._meta.db_table} SET content = %s WHERE id = %s',
+                [log, Message._meta.pk.get_db_prep_value(message.pk, connection)]
+            )
+        out = StringIO()
+        call_command('compress_text_fields', model=['message.Message'], dry_run=True, stdout=out)
+        self.assertIn('message.Message.content: would compress 1 rows', out.getvalue())
+        call_command('compress_text_fields', model=['message.Message'], batch_size=1, stdout=StringIO())
+        self.assertTrue(_stored(Message, 'content', message.pk).startswith(CODEC_PREFIX))
+        self.assertEqual(Message.objects.get(pk=message.pk).content, log)
+
+
+@skipUnless(os.environ.get('ZAPFIX_BENCHMARKS'), 'set ZAPFIX_BENCHMARKS=1 to run benchmarks')
+@override_settings(AUDIT_LOG={'ENABLED': False})
+class CompressedTextFieldBenchmark(TestCase):
+    """Storage and endpoint latency with and without compression"""
+
+    def test_storage_and_latency(self):
+        user = User.objects.create(username='bench')
+        client = APIClient()
+        client.force_authenticate(user)
+        fields = [
+            Message._meta.get_field('content'),
+            CommandExecution._meta.get_field('error_message'),
+        ]
+        thresholds = {field: field.compress_threshold for field in fields}
+        log = _build_log(20000)
+        rounds = 50
+        try:
+            for label, threshold in [('plain', 10 ** 12), ('compressed', None)]:
+                for field in fields:
+                    field.compress_threshold = threshold or thresholds[field]
+                session = Session.objects.create(user=user)
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    client.post(reverse('session_add_message', args=[session.id]), {'role': 'assistant', 'content': log}, format='json')
+                message_write = (time.perf_counter() - started) / rounds
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    client.get(reverse('session_detail_update', args=[session.id]), {'limit': 1})
+                message_read = (time.perf_counter() - started) / rounds
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    client.post(reverse('command_list_create'), {
+                        'command': 'make', 'command_type': 'shell', 'status': 'failed', 'error_message': log,
+                    }, format='json')
+                command_write = (time.perf_counter() - started) / rounds
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT SUM(LENGTH(content)) FROM {Message._meta.db_table} WHERE session_id = %s', [session.id.hex])
+                    stored = cursor.fetchone()[0]
+                print(
+                    f'\n{label:>10}: {stored / rounds / 1024:7.1f} KiB stored per {len(log) / 1024:.0f} KiB message, '
+                    f'message POST {message_write * 1000:.2f} ms, session GET {message_read * 1000:.2f} ms, '
+                    f'command POST {command_write * 1000:.2f} ms'
+                )
+        finally:
+            for field, threshold in thresholds.items():
+                field.compress_threshold = threshold
@@ -0,0 +1,33 @@
+"""
+SQLite triggers that have to survive migrations.
+
+Django rebuilds SQLite tables for many schema changes (copy, drop, rename),
+and the rebuild silently drops the table's triggers. Search indexes kept in
+step by triggers (message/search.py, CommandExecution/search.py) register
+their CREATE TRIGGER IF NOT EXISTS statements with `restore_after_migrate`,
+which re-creates them after every migrate of the app.
+"""
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def ensure_sqlite_triggers(connection, table, statements):
+    """
+    Run `statements(quote_name)`, a list of CREATE TRIGGER IF NOT EXISTS
+    statements, on SQLite once `table` (the index they maintain) exists.
+    """
+    if connection.vendor != 'sqlite' or table not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        for statement in statements(connection.ops.quote_name):
+            cursor.execute(statement)
+
+
+def restore_after_migrate(app_config, table, statements):
+    """Call ensure_sqlite_triggers after every migrate of `app_config`'s app"""
+    def restore(sender, using, **kwargs):
+        ensure_sqlite_triggers(connections[using], table, statements)
+
+    post_migrate.connect(
+        restore, sender=app_config, weak=False, dispatch_uid=f'{app_config.label}.restore_sqlite_triggers'
+    )